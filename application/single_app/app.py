@@ -31,6 +31,7 @@ from route_backend_feedback import *
 from route_backend_settings import *
 from route_backend_prompts import *
 from route_backend_group_prompts import *
+from route_backend_ingestion import *
 
 # =================== Helper Functions ===================
 @app.before_first_request
@@ -38,6 +39,8 @@ def before_first_request():
     settings = get_settings()
     initialize_clients(settings)
     ensure_custom_logo_file_exists(app, settings)
+    if INGESTION_RUN_IN_WEB_PROCESS:
+        start_ingestion_workers()
 
 @app.context_processor
 def inject_settings():
@@ -170,6 +173,9 @@ register_route_backend_prompts(app)
 # ------------------- API Group Prompts Routes ----------
 register_route_backend_group_prompts(app)
 
+# ------------------- API Ingestion Queue Routes --------
+register_route_backend_ingestion(app)
+
 if __name__ == '__main__':
     settings = get_settings()
     initialize_clients(settings)
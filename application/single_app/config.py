@@ -6,6 +6,7 @@ import uuid
 import tempfile
 import json
 import pandas as pd
+import numpy as np
 import time
 import threading
 import random
@@ -24,6 +25,18 @@ import ffmpeg_binaries as ffmpeg_bin
 ffmpeg_bin.init()
 import ffmpeg as ffmpeg_py
 import glob
+import copy
+from collections import deque
+import hashlib
+import sqlite3
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, nullcontext
+import socket
+import queue
+import bisect
+import atexit
 
 from flask import (
     Flask, 
@@ -61,7 +74,8 @@ from io import BytesIO
 from typing import List
 
 from azure.cosmos import CosmosClient, PartitionKey, exceptions
-from azure.cosmos.exceptions import CosmosResourceNotFoundError
+from azure.cosmos.exceptions import CosmosResourceNotFoundError, CosmosAccessConditionFailedError
+from azure.core import MatchConditions
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.formrecognizer import DocumentAnalysisClient
@@ -71,6 +85,7 @@ from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import SearchIndex, SearchField, SearchFieldDataType
 from azure.core.exceptions import AzureError, ResourceNotFoundError, HttpResponseError, ServiceRequestError
 from azure.core.polling import LROPoller
+from azure.core.polling.base_polling import LROBasePolling
 from azure.mgmt.cognitiveservices import CognitiveServicesManagementClient
 from azure.identity import ClientSecretCredential, DefaultAzureCredential, get_bearer_token_provider, AzureAuthorityHosts
 from azure.ai.contentsafety import ContentSafetyClient
@@ -90,7 +105,7 @@ app.config['VERSION'] = '0.214.001'
 Session(app)
 
 CLIENTS = {}
-CLIENTS_LOCK = threading.Lock()
+CLIENTS_LOCK = threading.RLock()
 
 ALLOWED_EXTENSIONS = {
     'txt', 'pdf', 'docx', 'xlsx', 'xls', 'csv', 'pptx', 'html', 'jpg', 'jpeg', 'png', 'bmp', 'tiff', 'tif', 'heif', 'md', 'json', 
@@ -112,6 +127,52 @@ AZURE_ENVIRONMENT = os.getenv("AZURE_ENVIRONMENT", "public") # public, usgovernm
 
 WORD_CHUNK_SIZE = 400
 
+# Limits for a single multi-input embeddings.create request
+EMBEDDING_BATCH_MAX_ITEMS = 16
+EMBEDDING_BATCH_MAX_TOKENS = 32000
+
+# Limits for a single Azure AI Search indexing request (service max is 1000 docs / 16 MB)
+SEARCH_INDEX_BATCH_MAX_DOCUMENTS = 500
+SEARCH_INDEX_BATCH_MAX_BYTES = 12 * 1024 * 1024
+
+# Durable ingestion job queue (SQLite file shared by the web app and ingestion workers)
+INGESTION_QUEUE_DB_PATH = os.getenv("INGESTION_QUEUE_DB_PATH", os.path.join(tempfile.gettempdir(), "simplechat_ingestion_queue.db"))
+INGESTION_WORKER_COUNT = int(os.getenv("INGESTION_WORKER_COUNT", "2"))
+INGESTION_RUN_IN_WEB_PROCESS = os.getenv("INGESTION_RUN_IN_WEB_PROCESS", "true").lower() == "true"
+INGESTION_JOB_LEASE_SECONDS = int(os.getenv("INGESTION_JOB_LEASE_SECONDS", "300"))
+INGESTION_JOB_MAX_ATTEMPTS = int(os.getenv("INGESTION_JOB_MAX_ATTEMPTS", "3"))
+
+# Processes for CPU-bound parse/chunk stages of ingestion (0 = parse on the calling thread)
+INGESTION_PARSE_PROCESSES = int(os.getenv("INGESTION_PARSE_PROCESSES", "2"))
+
+# Document Intelligence polling: first wait, growth factor and longest wait (seconds)
+DI_POLL_INITIAL_DELAY = 1.0
+DI_POLL_BACKOFF = 1.5
+DI_POLL_MAX_DELAY = 10.0
+
+# Video Indexer: refresh account tokens this long before expiry; index polling first wait,
+# growth factor and longest wait (seconds); the overall limit is the video_index_timeout setting
+VIDEO_INDEXER_TOKEN_REFRESH_MARGIN_SECONDS = 300
+VIDEO_INDEXER_POLL_INITIAL_DELAY = 5.0
+VIDEO_INDEXER_POLL_BACKOFF = 1.5
+VIDEO_INDEXER_POLL_MAX_DELAY = 60.0
+
+# Document Intelligence result cache, keyed by file SHA-256 and model ID (0 bytes = no size limit)
+DI_CACHE_DIR = os.getenv("DI_CACHE_DIR", os.path.join(tempfile.gettempdir(), "simplechat_di_cache"))
+DI_CACHE_MAX_BYTES = int(os.getenv("DI_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+# Ingestion checkpoints (extraction results and indexed chunks) for resuming interrupted jobs;
+# like the queue, the directory must be shared by the web app and ingestion workers
+INGESTION_CHECKPOINT_DIR = os.getenv("INGESTION_CHECKPOINT_DIR", os.path.join(tempfile.gettempdir(), "simplechat_ingestion_checkpoints"))
+INGESTION_CHECKPOINT_MAX_AGE_HOURS = int(os.getenv("INGESTION_CHECKPOINT_MAX_AGE_HOURS", "72"))
+
+# Speech fast-transcription: pooled connections shared by transcription threads, per-request timeout
+SPEECH_HTTP_POOL_SIZE = 10
+SPEECH_REQUEST_TIMEOUT_SECONDS = 600
+
+# Rows rendered when a CSV / Excel file is attached to a chat
+TABLE_FILE_MAX_ROWS = 5000
+
 if AZURE_ENVIRONMENT == "usgovernment":
     resource_manager = "https://management.usgovcloudapi.net"
     authority = AzureAuthorityHosts.AZURE_GOVERNMENT
@@ -411,4 +472,79 @@ def initialize_clients(settings):
                 #     CLIENTS["storage_account_audio_files_client"] = audio_client
                 #     # Create audio containers if needed
         except Exception as e:
-            print(f"Failed to initialize Blob Storage clients: {e}")
\ No newline at end of file
+            print(f"Failed to initialize Blob Storage clients: {e}")
+
+def get_default_azure_credential():
+    """
+    Returns the process-wide DefaultAzureCredential so its token cache is
+    shared instead of rebuilding the credential on every call.
+    """
+    with CLIENTS_LOCK:
+        credential = CLIENTS.get("default_azure_credential")
+        if credential is None:
+            credential = DefaultAzureCredential()
+            CLIENTS["default_azure_credential"] = credential
+        return credential
+
+def get_cognitive_services_token_provider():
+    """Returns the shared bearer token provider for Azure OpenAI (managed identity)."""
+    with CLIENTS_LOCK:
+        token_provider = CLIENTS.get("cognitive_services_token_provider")
+        if token_provider is None:
+            token_provider = get_bearer_token_provider(
+                get_default_azure_credential(),
+                "https://cognitiveservices.azure.com/.default"
+            )
+            CLIENTS["cognitive_services_token_provider"] = token_provider
+        return token_provider
+
+def get_azure_openai_client(service, settings):
+    """
+    Returns a pooled AzureOpenAI client for `service` ("gpt", "embedding" or
+    "image_gen"). Clients are held in CLIENTS and keyed by a fingerprint of the
+    settings they were built from, so they are only rebuilt when that
+    configuration changes and their HTTP connections stay alive between calls.
+    """
+    setting_keys = [
+        f"enable_{service}_apim",
+        f"azure_apim_{service}_endpoint",
+        f"azure_apim_{service}_subscription_key",
+        f"azure_apim_{service}_api_version",
+        f"azure_openai_{service}_endpoint",
+        f"azure_openai_{service}_api_version",
+        f"azure_openai_{service}_authentication_type",
+        f"azure_openai_{service}_key"
+    ]
+    fingerprint = hashlib.sha256(
+        json.dumps({k: settings.get(k) for k in setting_keys}, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    client_key = f"azure_openai_{service}_client"
+
+    with CLIENTS_LOCK:
+        cached = CLIENTS.get(client_key)
+        if cached and cached["fingerprint"] == fingerprint:
+            return cached["client"]
+
+        if settings.get(f"enable_{service}_apim"):
+            client = AzureOpenAI(
+                api_version=settings.get(f"azure_apim_{service}_api_version"),
+                azure_endpoint=settings.get(f"azure_apim_{service}_endpoint"),
+                api_key=settings.get(f"azure_apim_{service}_subscription_key")
+            )
+        elif settings.get(f"azure_openai_{service}_authentication_type") == "managed_identity":
+            client = AzureOpenAI(
+                api_version=settings.get(f"azure_openai_{service}_api_version"),
+                azure_endpoint=settings.get(f"azure_openai_{service}_endpoint"),
+                azure_ad_token_provider=get_cognitive_services_token_provider()
+            )
+        else:
+            client = AzureOpenAI(
+                api_version=settings.get(f"azure_openai_{service}_api_version"),
+                azure_endpoint=settings.get(f"azure_openai_{service}_endpoint"),
+                api_key=settings.get(f"azure_openai_{service}_key")
+            )
+
+        # The previous client is not closed here; requests already in flight may
+        # still be using it, and it is released once they drop their reference.
+        CLIENTS[client_key] = {"fingerprint": fingerprint, "client": client}
+        return client
@@ -99,46 +99,83 @@ def get_valid_access_token(scopes=None):
         # This might happen if the cache was cleared or the user logged in differently
         return None # Cannot acquire token without an account context
     
+# Video Indexer account tokens, keyed by account / video scope. Tokens are
+# reused until VIDEO_INDEXER_TOKEN_REFRESH_MARGIN_SECONDS before they expire.
+_video_indexer_token_cache = {}
+_video_indexer_token_lock = threading.Lock()
+
+def _get_jwt_expiry(token):
+    """Returns the exp claim of a JWT (not verified), or None if it cannot be read."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+def invalidate_video_indexer_account_token(settings, video_id=None):
+    """Drops a cached token, e.g. after the Video Indexer API rejected it with 401."""
+    cache_key = (
+        settings.get("video_indexer_subscription_id"),
+        settings.get("video_indexer_resource_group"),
+        settings.get("video_indexer_account_name"),
+        video_id
+    )
+    with _video_indexer_token_lock:
+        _video_indexer_token_cache.pop(cache_key, None)
+
 def get_video_indexer_account_token(settings, video_id=None):
     """
     For ARM-based VideoIndexer accounts:
-    1) Acquire an ARM token with DefaultAzureCredential
+    1) Acquire an ARM token with the shared DefaultAzureCredential
     2) POST to the ARM generateAccessToken endpoint
     3) Return the account-level accessToken
+    The token is cached and only requested again shortly before it expires.
     """
-    # 1) ARM token
-    arm_scope = "https://management.azure.com/.default"
-    credential = DefaultAzureCredential()
-    arm_token = credential.get_token(arm_scope).token
-    print("[VIDEO] ARM token acquired", flush=True)
-
-    # 2) Call the generateAccessToken API
     rg       = settings["video_indexer_resource_group"]
     sub      = settings["video_indexer_subscription_id"]
     acct     = settings["video_indexer_account_name"]
-    api_ver  = settings.get("video_indexer_arm_api_version", "2021-11-10-preview")
-    url      = (
-        f"https://management.azure.com/subscriptions/{sub}"
-        f"/resourceGroups/{rg}"
-        f"/providers/Microsoft.VideoIndexer/accounts/{acct}"
-        f"/generateAccessToken?api-version={api_ver}"
-    )
-    body = {
-        "permissionType": "Contributor",
-        "scope": "Account"
-    }
-    if video_id:
-        body["videoId"] = video_id
+    cache_key = (sub, rg, acct, video_id)
 
-    resp = requests.post(
-        url,
-        json=body,
-        headers={"Authorization": f"Bearer {arm_token}"}
-    )
-    resp.raise_for_status()
-    ai = resp.json().get("accessToken")
-    print(f"[VIDEO] Account token acquired (len={len(ai)})", flush=True)
-    return ai
+    with _video_indexer_token_lock:
+        cached = _video_indexer_token_cache.get(cache_key)
+        if cached and cached["expires_at"] - VIDEO_INDEXER_TOKEN_REFRESH_MARGIN_SECONDS > time.time():
+            return cached["token"]
+
+        # 1) ARM token (cached by the credential itself)
+        arm_scope = "https://management.azure.com/.default"
+        credential = get_default_azure_credential()
+        arm_token = credential.get_token(arm_scope).token
+        print("[VIDEO] ARM token acquired", flush=True)
+
+        # 2) Call the generateAccessToken API
+        api_ver  = settings.get("video_indexer_arm_api_version", "2021-11-10-preview")
+        url      = (
+            f"https://management.azure.com/subscriptions/{sub}"
+            f"/resourceGroups/{rg}"
+            f"/providers/Microsoft.VideoIndexer/accounts/{acct}"
+            f"/generateAccessToken?api-version={api_ver}"
+        )
+        body = {
+            "permissionType": "Contributor",
+            "scope": "Account"
+        }
+        if video_id:
+            body["videoId"] = video_id
+
+        resp = requests.post(
+            url,
+            json=body,
+            headers={"Authorization": f"Bearer {arm_token}"}
+        )
+        resp.raise_for_status()
+        ai = resp.json().get("accessToken")
+        print(f"[VIDEO] Account token acquired (len={len(ai)})", flush=True)
+
+        # Account tokens are valid for an hour; use the token's own expiry when readable
+        expires_at = _get_jwt_expiry(ai) or time.time() + 3600
+        _video_indexer_token_cache[cache_key] = {"token": ai, "expires_at": expires_at}
+        return ai
 
 def login_required(f):
     @wraps(f)
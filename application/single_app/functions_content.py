@@ -3,6 +3,8 @@
 from config import *
 from functions_settings import *
 from functions_logging import *
+from functions_rate_limiting import *
+from functions_di_cache import *
 
 def extract_text_file(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
@@ -12,41 +14,75 @@ def extract_markdown_file(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
         return f.read()
 
-def extract_content_with_azure_di(file_path):
+class DocumentIntelligenceBackoffPolling(LROBasePolling):
+    """
+    Polling for Document Intelligence analyze operations. The wait between
+    status requests starts at initial_delay and grows by backoff up to
+    max_delay, so long analyses are not polled at a fixed short interval.
+    A longer Retry-After from the service is always honoured.
+    """
+
+    def __init__(self, initial_delay=DI_POLL_INITIAL_DELAY, backoff=DI_POLL_BACKOFF, max_delay=DI_POLL_MAX_DELAY):
+        super().__init__(timeout=initial_delay, lro_options={"final-state-via": "operation-location"})
+        self._next_delay = initial_delay
+        self._backoff = backoff
+        self._max_delay = max_delay
+
+    def _extract_delay(self):
+        delay = self._next_delay
+        self._next_delay = min(delay * self._backoff, self._max_delay)
+        # The base class returns the service's Retry-After, or self._timeout when there is none
+        self._timeout = delay
+        return max(super()._extract_delay(), delay)
+
+def extract_content_with_azure_di(file_path, model_id="prebuilt-read", use_cache=True, file_sha256=None):
     """
     Extracts text page-by-page using Azure Document Intelligence "prebuilt-read"
     and returns a list of dicts, each containing page_number and content.
+    Results are cached by file SHA-256 and model ID, so identical bytes are
+    only analysed once. Pass file_sha256 when it is already known (file probe)
+    to skip hashing the file again.
     """
+    if use_cache and get_settings().get('enable_document_intelligence_cache', True):
+        try:
+            file_sha256 = file_sha256 or compute_file_sha256(file_path)
+            cached_pages = get_cached_di_pages(file_sha256, model_id)
+            if cached_pages is not None:
+                print(f"Document Intelligence cache hit for {os.path.basename(file_path)} ({file_sha256[:12]}).")
+                return cached_pages
+        except OSError as e:
+            print(f"Warning: Document Intelligence cache lookup failed for {file_path}: {e}")
+            file_sha256 = None
+    else:
+        file_sha256 = None
+
     try:
         document_intelligence_client = CLIENTS['document_intelligence_client'] # Ensure CLIENTS is populated
         with open(file_path, "rb") as f:
+            # The poller's thread asks for the operation status after a delay that
+            # grows from DI_POLL_INITIAL_DELAY to DI_POLL_MAX_DELAY (or Retry-After)
             poller = document_intelligence_client.begin_analyze_document(
-                model_id="prebuilt-read",
-                document=f
+                model_id=model_id,
+                document=f,
+                polling=DocumentIntelligenceBackoffPolling()
             )
 
         max_wait_time = 600
-        start_time = time.time()
-
-        while True:
-            status = poller.status()
-            if status == "succeeded":
-                 break
-            if status in ["failed", "canceled"]:
-                # Attempt to get result even on failure for potential error details
-                try:
-                     result = poller.result()
-                     # Optionally add failed result details to the exception message
-                     error_details = f"Failed DI result details: {result}"
-                except Exception as res_ex:
-                     error_details = f"Could not get result details after failure: {res_ex}"
-                raise Exception(f"Document analysis {status} for document. {error_details}")
-            if time.time() - start_time > max_wait_time:
-                raise TimeoutError(f"Document analysis took too long.")
-
-            sleep_duration = 10 # Or adjust based on expected processing time
-            time.sleep(sleep_duration)
-
+        # Returns as soon as the operation finishes
+        poller.wait(timeout=max_wait_time)
+        if not poller.done():
+            raise TimeoutError(f"Document analysis took too long.")
+
+        status = poller.status()
+        if status in ["failed", "canceled"]:
+            # Attempt to get result even on failure for potential error details
+            try:
+                 result = poller.result()
+                 # Optionally add failed result details to the exception message
+                 error_details = f"Failed DI result details: {result}"
+            except Exception as res_ex:
+                 error_details = f"Could not get result details after failure: {res_ex}"
+            raise Exception(f"Document analysis {status} for document. {error_details}")
 
         result = poller.result()
 
@@ -109,6 +145,9 @@ def extract_content_with_azure_di(file_path):
         #     content=f"DI extraction processed data: {pages_data}"
         # )
 
+        if file_sha256:
+            store_di_pages(file_sha256, model_id, pages_data)
+
         return pages_data
 
     except HttpResponseError as e:
@@ -123,16 +162,24 @@ def extract_content_with_azure_di(file_path):
         raise e
 
 
-def extract_table_file(file_path, file_ext):
+def extract_table_file(file_path, file_ext, max_rows=TABLE_FILE_MAX_ROWS):
+    """
+    Renders the first `max_rows` rows of a CSV / Excel file as an HTML table.
+    Only those rows are read, so large files do not have to fit in memory.
+    """
     try:
+        # Read one extra row to know whether the table was cut off
         if file_ext == '.csv':
-            df = pd.read_csv(file_path)
+            df = pd.read_csv(file_path, nrows=max_rows + 1)
         elif file_ext in ['.xls', '.xlsx']:
-            df = pd.read_excel(file_path)
+            df = pd.read_excel(file_path, nrows=max_rows + 1)
         else:
             raise ValueError("Unsupported file extension for table extraction.")
-        
-        table_html = df.to_html(index=False, classes='table table-striped table-bordered')
+
+        truncated = len(df) > max_rows
+        table_html = df.head(max_rows).to_html(index=False, classes='table table-striped table-bordered')
+        if truncated:
+            table_html += f"<p><em>Showing the first {max_rows} rows.</em></p>"
         return table_html
     except Exception as e:
         raise
@@ -259,74 +306,118 @@ def chunk_word_file_into_pages(di_pages):
     # Current logic returns empty list if no words.
     return new_pages
 
-def generate_embedding(
-    text,
+def get_embedding_model_name(settings):
+    """Returns the embedding deployment chunks are embedded with, or None if none is configured."""
+    if settings.get('enable_embedding_apim', False):
+        return settings.get('azure_apim_embedding_deployment')
+
+    embedding_model_obj = settings.get('embedding_model', {})
+    if embedding_model_obj and embedding_model_obj.get('selected'):
+        return embedding_model_obj['selected'][0]['deploymentName']
+    return None
+
+def _get_embedding_client_and_model(settings):
+    embedding_client = get_azure_openai_client("embedding", settings)
+    return embedding_client, get_embedding_model_name(settings)
+
+def compute_chunk_content_hash(text):
+    """SHA-256 of a chunk's text; chunks with the same hash can share an embedding."""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+def estimate_token_count(text):
+    """
+    Rough token estimate used for request sizing (about 3 characters per token,
+    which errs on the high side for English text).
+    """
+    if not text:
+        return 0
+    return max(1, len(text) // 3)
+
+def _build_embedding_batches(texts, max_items=EMBEDDING_BATCH_MAX_ITEMS, max_tokens=EMBEDDING_BATCH_MAX_TOKENS):
+    """
+    Groups the indexes of non-empty texts into batches bounded by item count
+    and estimated token count. A single oversized text gets a batch of its own.
+    """
+    batches = []
+    current_batch = []
+    current_tokens = 0
+
+    for idx, text in enumerate(texts):
+        if not text or not text.strip():
+            continue
+        text_tokens = estimate_token_count(text)
+        if current_batch and (len(current_batch) >= max_items or current_tokens + text_tokens > max_tokens):
+            batches.append(current_batch)
+            current_batch = []
+            current_tokens = 0
+        current_batch.append(idx)
+        current_tokens += text_tokens
+
+    if current_batch:
+        batches.append(current_batch)
+
+    return batches
+
+def generate_embeddings(
+    texts,
     max_retries=5,
     initial_delay=1.0,
     delay_multiplier=2.0
 ):
-    settings = get_settings()
-
-    retries = 0
-    current_delay = initial_delay
+    """
+    Embeds many texts using as few embeddings.create calls as possible.
 
-    enable_embedding_apim = settings.get('enable_embedding_apim', False)
+    Returns a list the same length as `texts`, where each entry is the
+    embedding for the text at that position, or None if the text was empty
+    or its batch could not be embedded.
+    """
+    settings = get_settings()
+    embedding_client, embedding_model = _get_embedding_client_and_model(settings)
 
-    if enable_embedding_apim:
-        embedding_model = settings.get('azure_apim_embedding_deployment')
-        embedding_client = AzureOpenAI(
-            api_version = settings.get('azure_apim_embedding_api_version'),
-            azure_endpoint = settings.get('azure_apim_embedding_endpoint'),
-            api_key=settings.get('azure_apim_embedding_subscription_key'))
-    else:
-        if (settings.get('azure_openai_embedding_authentication_type') == 'managed_identity'):
-            token_provider = get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")
-            embedding_client = AzureOpenAI(
-                api_version=settings.get('azure_openai_embedding_api_version'),
-                azure_endpoint=settings.get('azure_openai_embedding_endpoint'),
-                azure_ad_token_provider=token_provider
-            )
-        
-            embedding_model_obj = settings.get('embedding_model', {})
-            if embedding_model_obj and embedding_model_obj.get('selected'):
-                selected_embedding_model = embedding_model_obj['selected'][0]
-                embedding_model = selected_embedding_model['deploymentName']
-        else:
-            embedding_client = AzureOpenAI(
-                api_version=settings.get('azure_openai_embedding_api_version'),
-                azure_endpoint=settings.get('azure_openai_embedding_endpoint'),
-                api_key=settings.get('azure_openai_embedding_key')
-            )
-            
-            embedding_model_obj = settings.get('embedding_model', {})
-            if embedding_model_obj and embedding_model_obj.get('selected'):
-                selected_embedding_model = embedding_model_obj['selected'][0]
-                embedding_model = selected_embedding_model['deploymentName']
+    embeddings = [None] * len(texts)
 
-    while True:
-        random_delay = random.uniform(0.5, 2.0)
-        time.sleep(random_delay)
+    for batch_indexes in _build_embedding_batches(texts):
+        batch_texts = [texts[i] for i in batch_indexes]
 
         try:
-            response = embedding_client.embeddings.create(
-                model=embedding_model,
-                input=text
+            # Admission, Retry-After handling and backoff are shared with every
+            # other Azure OpenAI caller through the rate limiter
+            response = call_with_openai_rate_limit(
+                embedding_model,
+                lambda: embedding_client.embeddings.create(
+                    model=embedding_model,
+                    input=batch_texts
+                ),
+                estimated_tokens=sum(estimate_token_count(t) for t in batch_texts),
+                max_retries=max_retries,
+                initial_delay=initial_delay,
+                delay_multiplier=delay_multiplier
             )
 
-            embedding = response.data[0].embedding
-            return embedding
+            # Results carry the position of their input within the request
+            for item in response.data:
+                embeddings[batch_indexes[item.index]] = item.embedding
 
         except RateLimitError as e:
-            retries += 1
-            if retries > max_retries:
-                return None
-
-            wait_time = current_delay * random.uniform(1.0, 1.5)
-            time.sleep(wait_time)
-            current_delay *= delay_multiplier
+            print(f"Embedding request still rate limited after {max_retries} retries: {e}")
 
         except Exception as e:
-            return None
+            print(f"Error generating embeddings for a batch of {len(batch_texts)} text(s): {e}")
+
+    return embeddings
+
+def generate_embedding(
+    text,
+    max_retries=5,
+    initial_delay=1.0,
+    delay_multiplier=2.0
+):
+    return generate_embeddings(
+        [text],
+        max_retries=max_retries,
+        initial_delay=initial_delay,
+        delay_multiplier=delay_multiplier
+    )[0]
 
 def get_all_chunks(document_id, user_id):
     try:
@@ -0,0 +1,102 @@
+# functions_di_cache.py
+
+from config import *
+
+# Content-addressed cache of Document Intelligence results. Entries are keyed
+# by the SHA-256 of the analysed file and the model ID, so a re-uploaded
+# version of the same file, or the same file uploaded to another workspace,
+# reuses the extracted pages instead of being analysed again. Each entry is a
+# JSON file under DI_CACHE_DIR; when the directory grows past
+# DI_CACHE_MAX_BYTES the least recently used entries are removed.
+_di_cache_lock = threading.Lock()
+
+def compute_file_sha256(file_path, block_size=1024 * 1024):
+    """Returns the hex SHA-256 of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _get_di_cache_path(file_sha256, model_id):
+    safe_model_id = re.sub(r'[^A-Za-z0-9_.-]', '_', model_id)
+    return os.path.join(DI_CACHE_DIR, f"{file_sha256}_{safe_model_id}.json")
+
+def get_cached_di_pages(file_sha256, model_id):
+    """
+    Returns the cached [{"page_number", "content"}] list for this file hash
+    and model, or None on a miss. A hit refreshes the entry's access time.
+    """
+    cache_path = _get_di_cache_path(file_sha256, model_id)
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            pages = json.load(f).get("pages")
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable DI cache entry {cache_path}: {e}")
+        return None
+
+    if not isinstance(pages, list):
+        return None
+
+    try:
+        os.utime(cache_path, None)
+    except OSError:
+        pass
+    return pages
+
+def store_di_pages(file_sha256, model_id, pages):
+    """
+    Writes the extracted pages for this file hash and model, then trims the
+    cache back under DI_CACHE_MAX_BYTES. Failures are logged, not raised; the
+    cache is only an optimisation.
+    """
+    cache_path = _get_di_cache_path(file_sha256, model_id)
+    entry = {
+        "file_sha256": file_sha256,
+        "model_id": model_id,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "pages": pages
+    }
+    try:
+        os.makedirs(DI_CACHE_DIR, exist_ok=True)
+        # Write to a temporary name and swap it in so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=DI_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: could not write DI cache entry {cache_path}: {e}")
+        return
+
+    _evict_di_cache_entries()
+
+def _evict_di_cache_entries():
+    """Removes least recently used entries until the cache fits DI_CACHE_MAX_BYTES."""
+    if DI_CACHE_MAX_BYTES <= 0:
+        return
+
+    with _di_cache_lock:
+        entries = []
+        total_bytes = 0
+        for entry_path in glob.glob(os.path.join(DI_CACHE_DIR, "*.json")):
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+            total_bytes += stat.st_size
+
+        if total_bytes <= DI_CACHE_MAX_BYTES:
+            return
+
+        entries.sort()
+        for _, size, entry_path in entries:
+            if total_bytes <= DI_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(entry_path)
+                total_bytes -= size
+            except OSError:
+                continue
@@ -0,0 +1,71 @@
+# functions_document_store.py
+
+from config import *
+
+# Cosmos DB accepts at most 10 operations in a single patch request
+PATCH_MAX_OPERATIONS = 10
+
+def get_documents_container(group_id=None):
+    return cosmos_group_documents_container if group_id is not None else cosmos_user_documents_container
+
+def read_document_item(document_id, user_id, group_id=None):
+    """
+    Point-reads a document record (the containers are partitioned by /id)
+    and returns it only if it belongs to the given user or group, else None.
+    """
+    cosmos_container = get_documents_container(group_id)
+
+    try:
+        document_item = cosmos_container.read_item(item=document_id, partition_key=document_id)
+    except CosmosResourceNotFoundError:
+        return None
+
+    if group_id is not None:
+        if document_item.get('group_id') != group_id:
+            return None
+    elif document_item.get('user_id') != user_id:
+        return None
+
+    return document_item
+
+def build_patch_operations(set_fields=None, increment_fields=None):
+    """Builds Cosmos patch operations: 'set' for each field value, 'incr' for each delta."""
+    operations = [
+        {"op": "set", "path": f"/{key}", "value": value}
+        for key, value in (set_fields or {}).items()
+    ]
+    operations += [
+        {"op": "incr", "path": f"/{key}", "value": delta}
+        for key, delta in (increment_fields or {}).items()
+        if delta
+    ]
+    return operations
+
+def patch_document_item(document_item, operations, group_id=None):
+    """
+    Applies patch operations to a document read with read_document_item, on
+    the condition that it has not changed since (its _etag). `document_item`
+    must already hold the patched values; it is written with a conditional
+    replace when there are more operations than one patch request allows.
+    Raises CosmosAccessConditionFailedError if another writer got there first,
+    so the caller can re-read and retry.
+    """
+    cosmos_container = get_documents_container(group_id)
+    condition = {
+        "etag": document_item.get('_etag'),
+        "match_condition": MatchConditions.IfNotModified
+    }
+
+    if len(operations) <= PATCH_MAX_OPERATIONS:
+        return cosmos_container.patch_item(
+            item=document_item['id'],
+            partition_key=document_item['id'],
+            patch_operations=operations,
+            **condition
+        )
+
+    return cosmos_container.replace_item(
+        item=document_item['id'],
+        body=document_item,
+        **condition
+    )
@@ -4,8 +4,49 @@ from config import *
 from functions_content import *
 from functions_settings import *
 from functions_search import *
+from functions_search_indexing import *
+from functions_document_store import *
 from functions_logging import *
 from functions_authentication import *
+from functions_parsing import *
+from functions_ingestion_stats import *
+from functions_ingestion_checkpoints import *
+from functions_file_probe import *
+
+_parsing_pool = None
+_parsing_pool_lock = threading.Lock()
+
+def _get_parsing_pool():
+    global _parsing_pool
+    with _parsing_pool_lock:
+        if _parsing_pool is None and INGESTION_PARSE_PROCESSES > 0:
+            # spawn: forking a process that already runs request/worker threads is unsafe
+            _parsing_pool = ProcessPoolExecutor(
+                max_workers=INGESTION_PARSE_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _parsing_pool
+
+def run_parsing_task(fn, *args, **kwargs):
+    """
+    Runs a CPU-bound parse/chunk function from functions_parsing in the
+    parsing process pool and returns its result, so it does not hold the GIL
+    for the web and embedding threads. Runs inline when the pool is disabled
+    (INGESTION_PARSE_PROCESSES=0) or has broken.
+    """
+    global _parsing_pool
+    pool = _get_parsing_pool()
+    if pool is None:
+        return fn(*args, **kwargs)
+
+    try:
+        return pool.submit(fn, *args, **kwargs).result()
+    except BrokenProcessPool as e:
+        print(f"Parsing process pool is broken ({e}); running {fn.__name__} inline")
+        with _parsing_pool_lock:
+            if _parsing_pool is pool:
+                _parsing_pool = None
+        return fn(*args, **kwargs)
 
 def allowed_file(filename, allowed_extensions=None):
     if not allowed_extensions:
@@ -103,57 +144,351 @@ def create_document(file_name, user_id, document_id, num_file_chunks, status, gr
 
 def get_document_metadata(document_id, user_id, group_id=None):
     is_group = group_id is not None
-    cosmos_container = cosmos_group_documents_container if is_group else cosmos_user_documents_container
 
-    if is_group:
-        query = """
-            SELECT * 
-            FROM c
-            WHERE c.id = @document_id 
-                AND c.group_id = @group_id
-            ORDER BY c.version DESC
-        """
-        parameters = [
-            {"name": "@document_id", "value": document_id},
-            {"name": "@group_id", "value": group_id}
-        ]
-    else:
-        query = """
-            SELECT * 
-            FROM c
-            WHERE c.id = @document_id 
-                AND c.user_id = @user_id
-            ORDER BY c.version DESC
-        """
-        parameters = [
-            {"name": "@document_id", "value": document_id},
-            {"name": "@user_id", "value": user_id}
-        ]
-
-    add_file_task_to_file_processing_log(
-        document_id=document_id, 
-        user_id=group_id if is_group else user_id,
-        content=f"Query is {query}, parameters are {parameters}."
-    )
     try:
-        document_items = list(
-            cosmos_container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            )
-        )
+        document_item = read_document_item(document_id, user_id, group_id)
         add_file_task_to_file_processing_log(
             document_id=document_id, 
             user_id=group_id if is_group else user_id,
-            content=f"Document metadata retrieved: {document_items}."
+            content=f"Document metadata retrieved: {document_item}.",
+            level="debug"
         )
-        return document_items[0] if document_items else None
+        return document_item
 
     except Exception as e:
         print(f"Error retrieving document metadata: {repr(e)}\nTraceback:\n{traceback.format_exc()}")
         return None
 
+def get_previous_document_version(file_name, user_id, version, group_id=None):
+    """
+    Returns the metadata of the newest version of file_name older than
+    `version` in the same personal or group workspace, or None.
+    """
+    is_group = group_id is not None
+    cosmos_container = cosmos_group_documents_container if is_group else cosmos_user_documents_container
+
+    query = f"""
+        SELECT TOP 1 *
+        FROM c
+        WHERE c.file_name = @file_name
+            AND c.{'group_id' if is_group else 'user_id'} = @owner_id
+            AND c.version < @version
+        ORDER BY c.version DESC
+    """
+    parameters = [
+        {"name": "@file_name", "value": file_name},
+        {"name": "@owner_id", "value": group_id if is_group else user_id},
+        {"name": "@version", "value": version}
+    ]
+
+    results = list(
+        cosmos_container.query_items(
+            query=query,
+            parameters=parameters,
+            enable_cross_partition_query=True
+        )
+    )
+    return results[0] if results else None
+
+def load_previous_version_embeddings(job_context):
+    """
+    Maps chunk content hash -> embedding for the previous version of the
+    job's file. Only used when that version finished processing with the
+    embedding model that is configured now. Chunks indexed before
+    chunk_content_hash existed are hashed from their text.
+    """
+    previous_document = get_previous_document_version(
+        file_name=job_context.file_name,
+        user_id=job_context.user_id,
+        version=job_context.version,
+        group_id=job_context.group_id
+    )
+    if not previous_document:
+        return {}
+    if previous_document.get("embedding_model") != job_context.embedding_model:
+        return {}
+
+    results = job_context.search_client.search(
+        search_text="*",
+        filter=f"document_id eq '{previous_document['id']}'",
+        select=["chunk_content_hash", "chunk_text", "embedding"]
+    )
+
+    reusable_embeddings = {}
+    for chunk in results:
+        embedding = chunk.get("embedding")
+        if not embedding:
+            continue
+        content_hash = chunk.get("chunk_content_hash") or compute_chunk_content_hash(chunk.get("chunk_text"))
+        reusable_embeddings[content_hash] = embedding
+
+    print(f"Loaded {len(reusable_embeddings)} reusable embeddings for {job_context.document_id} from version {previous_document.get('version')}.")
+    return reusable_embeddings
+
+class IngestionJobContext:
+    """
+    Per-upload state resolved once in process_document_upload_background and
+    passed down to every chunk save: document version, owner scope, file name
+    and the Cosmos / Search clients for that scope. Saves the per-chunk
+    get_document_metadata() query (and its file_processing log writes).
+    Also holds the previous version's embeddings, so unchanged chunks of a
+    re-uploaded file are not embedded again.
+    """
+
+    def __init__(self, document_id, user_id, file_name, version=1, group_id=None, settings=None, metadata=None):
+        self.document_id = document_id
+        self.user_id = user_id
+        self.group_id = group_id
+        self.is_group = group_id is not None
+        self.owner_id = group_id if self.is_group else user_id
+        self.file_name = file_name
+        self.version = version
+        self.metadata = metadata or {}
+        self.settings = settings if settings is not None else get_settings()
+        self.documents_container = cosmos_group_documents_container if self.is_group else cosmos_user_documents_container
+        self.search_client = CLIENTS["search_client_group"] if self.is_group else CLIENTS["search_client_user"]
+        self.embedding_model = get_embedding_model_name(self.settings)
+        self.stage_timer = IngestionStageTimer()
+        # Resume state from an earlier, interrupted run of this job
+        self.checkpoint = IngestionCheckpoint(document_id, version) if self.settings.get('enable_ingestion_checkpoints', True) else None
+        # Size, MIME type, hash, page count, ... of the upload; set by the probe stage
+        self.file_probe = None
+        self._reusable_embeddings = None
+        self._reusable_embeddings_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, document_id, user_id, file_name, group_id=None, settings=None):
+        """Builds the context from the document's current metadata record."""
+        metadata = get_document_metadata(document_id=document_id, user_id=user_id, group_id=group_id)
+        if not metadata:
+            raise ValueError(f"No metadata found for document {document_id} (group: {group_id is not None})")
+
+        return cls(
+            document_id=document_id,
+            user_id=user_id,
+            file_name=file_name,
+            version=metadata.get("version") or 1,
+            group_id=group_id,
+            settings=settings,
+            metadata=metadata
+        )
+
+    def new_index_writer(self):
+        return SearchIndexBatchWriter(
+            self.search_client,
+            stats_recorder=self.stage_timer.record,
+            indexed_callback=self._record_indexed_chunks if self.checkpoint is not None else None
+        )
+
+    def _record_indexed_chunks(self, documents):
+        chunk_numbers_by_file = {}
+        for document in documents:
+            if document.get("page_number") is not None:
+                chunk_numbers_by_file.setdefault(document.get("file_name"), []).append(document["page_number"])
+        for file_name, chunk_numbers in chunk_numbers_by_file.items():
+            self.checkpoint.mark_chunks_indexed(file_name, chunk_numbers)
+
+    def get_reusable_embeddings(self):
+        """
+        Previous-version embeddings keyed by chunk content hash, loaded on
+        first use. Empty for a first version, when enable_incremental_reindexing
+        is off, or if they cannot be read (every chunk is then embedded).
+        """
+        with self._reusable_embeddings_lock:
+            if self._reusable_embeddings is None:
+                self._reusable_embeddings = {}
+                if self.version > 1 and self.embedding_model and self.settings.get('enable_incremental_reindexing', True):
+                    try:
+                        self._reusable_embeddings = load_previous_version_embeddings(self)
+                    except Exception as e:
+                        print(f"Warning: could not load previous version embeddings for {self.document_id}: {e}")
+            return self._reusable_embeddings
+
+class IngestionProgressReporter:
+    """
+    Coalesces the progress updates an ingestion job sends through its
+    update_callback. Updates are merged in memory and written with a single
+    update_document() call when ingestion_progress_flush_seconds have passed,
+    when the estimated percentage moved by ingestion_progress_flush_percent,
+    on terminal statuses (complete / error / failed), or as soon as a field
+    other than status / current_file_chunk changes. Call flush() when the
+    job ends to write whatever is still pending.
+    """
+
+    PROGRESS_ONLY_FIELDS = ('status', 'current_file_chunk')
+    TERMINAL_STATUS_MARKERS = ('processing complete', 'error', 'failed')
+
+    def __init__(self, job_context):
+        self.job_context = job_context
+        settings = job_context.settings
+        self.flush_seconds = float(settings.get('ingestion_progress_flush_seconds', 5) or 0)
+        self.flush_percent = float(settings.get('ingestion_progress_flush_percent', 5) or 0)
+
+        # Local copy of the fields calculate_processing_percentage reads
+        self._shadow = dict(job_context.metadata)
+        self._pending = {}
+        self._pending_num_chunks_increment = 0
+        self._last_flush_at = time.monotonic()
+        self._last_flushed_percentage = calculate_processing_percentage(self._shadow)
+        self._lock = threading.RLock()
+
+    def update(self, **kwargs):
+        num_chunks_increment = kwargs.pop('num_chunks_increment', 0)
+
+        with self._lock:
+            force_flush = False
+            for key, value in kwargs.items():
+                # update_document ignores None values, so they are not buffered either
+                if value is None:
+                    continue
+                if key not in self.PROGRESS_ONLY_FIELDS and self._shadow.get(key) != value:
+                    force_flush = True
+                self._pending[key] = value
+                self._shadow[key] = value
+            self._pending_num_chunks_increment += num_chunks_increment
+
+            status = str(self._shadow.get('status', '')).lower()
+            if any(marker in status for marker in self.TERMINAL_STATUS_MARKERS):
+                force_flush = True
+
+            percentage = calculate_processing_percentage(self._shadow)
+            if (
+                force_flush
+                or time.monotonic() - self._last_flush_at >= self.flush_seconds
+                or abs(percentage - self._last_flushed_percentage) >= self.flush_percent
+            ):
+                self._flush_locked(percentage)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked(calculate_processing_percentage(self._shadow))
+
+    def _flush_locked(self, percentage):
+        if not self._pending and not self._pending_num_chunks_increment:
+            return
+
+        args = {
+            "document_id": self.job_context.document_id,
+            "user_id": self.job_context.user_id,
+            **self._pending
+        }
+
+        if self._pending_num_chunks_increment:
+            args["num_chunks_increment"] = self._pending_num_chunks_increment
+
+        if self.job_context.is_group:
+            args["group_id"] = self.job_context.group_id
+
+        update_document(**args)
+
+        self._pending = {}
+        self._pending_num_chunks_increment = 0
+        self._last_flush_at = time.monotonic()
+        self._last_flushed_percentage = percentage
+        self._shadow['percentage_complete'] = percentage
+
+def get_search_index_writer(group_id=None):
+    """Returns a buffered SearchIndexBatchWriter for the user or group index."""
+    search_client = CLIENTS["search_client_group"] if group_id is not None else CLIENTS["search_client_user"]
+    return SearchIndexBatchWriter(search_client)
+
+# Length of the transcript windows a video is split into
+VIDEO_CHUNK_WINDOW_SECONDS = 30.0
+
+def video_timestamp_to_seconds(ts):
+    """Converts a Video Indexer "H:MM:SS.fff" (or "MM:SS.fff") timestamp to seconds."""
+    parts = [float(p) for p in ts.split(':')]
+    if len(parts) == 3:
+        h, m, s = parts
+    else:
+        h = 0.0
+        m, s = parts
+    return h * 3600 + m * 60 + s
+
+def build_video_windows(speech_context, ocr_context, window_seconds=VIDEO_CHUNK_WINDOW_SECONDS):
+    """
+    Groups transcript lines into windows of window_seconds, each starting at
+    the first line not yet covered, and attaches the OCR lines seen up to the
+    window's end. Every timestamp is parsed once; window boundaries come from
+    a sorted search over the start times instead of rescanning the lists.
+
+    Returns [{"start", "seconds", "text", "ocr_text"}] in time order.
+    """
+    if not speech_context:
+        return []
+
+    speech_starts = np.array([video_timestamp_to_seconds(item["start"]) for item in speech_context], dtype=np.float64)
+    speech_order = np.argsort(speech_starts, kind="stable")
+    speech_starts = speech_starts[speech_order]
+    speech_items = [speech_context[i] for i in speech_order]
+
+    ocr_starts = np.array([video_timestamp_to_seconds(item["start"]) for item in ocr_context], dtype=np.float64)
+    ocr_order = np.argsort(ocr_starts, kind="stable")
+    ocr_starts = ocr_starts[ocr_order]
+    ocr_texts = [ocr_context[i]["text"] for i in ocr_order]
+
+    # Window k covers speech_items[window_first[k]:window_last[k]]
+    window_first = []
+    window_last = []
+    position = 0
+    while position < len(speech_starts):
+        end = int(np.searchsorted(speech_starts, speech_starts[position] + window_seconds, side="right"))
+        window_first.append(position)
+        window_last.append(end)
+        position = end
+
+    window_first = np.array(window_first)
+    window_ends = speech_starts[window_first] + window_seconds
+    # OCR lines up to each window's end that an earlier window has not taken
+    ocr_cuts = np.searchsorted(ocr_starts, window_ends, side="right")
+
+    windows = []
+    ocr_position = 0
+    for first, last, ocr_cut in zip(window_first.tolist(), window_last, ocr_cuts.tolist()):
+        windows.append({
+            "start": speech_items[first]["start"],
+            "seconds": int(speech_starts[first]),
+            "text": " ".join(item["text"] for item in speech_items[first:last]).strip(),
+            "ocr_text": " ".join(ocr_texts[ocr_position:ocr_cut]).strip()
+        })
+        ocr_position = max(ocr_position, ocr_cut)
+    return windows
+
+def build_video_chunk(
+    page_text_content,
+    ocr_chunk_text,
+    start_time,
+    seconds,
+    file_name,
+    user_id,
+    document_id,
+    group_id,
+    embedding,
+    version,
+    upload_date=None
+):
+    """
+    Builds the search index document for one video window. The chunk_id uses
+    the integer second offset so it is a valid key.
+    """
+    chunk = {
+        "id":                   f"{document_id}_{seconds}",
+        "document_id":          document_id,
+        "chunk_text":           page_text_content,
+        "video_ocr_chunk_text": ocr_chunk_text,
+        "embedding":            embedding,
+        "file_name":            file_name,
+        "start_time":           start_time,
+        "chunk_sequence":       seconds,
+        "upload_date":          upload_date or datetime.now(timezone.utc).isoformat(),
+        "version":              version,
+    }
+    if group_id is not None:
+        chunk["group_id"] = group_id
+    else:
+        chunk["user_id"] = user_id
+    return chunk
+
 def save_video_chunk(
     page_text_content,
     ocr_chunk_text,
@@ -161,23 +496,24 @@ def save_video_chunk(
     file_name,
     user_id,
     document_id,
-    group_id
+    group_id,
+    embedding=None,
+    index_writer=None,
+    job_context=None
 ):
     """
     Saves one 30-second video chunk to the search index, with separate fields for transcript and OCR.
-    The chunk_id is built from document_id and the integer second offset to ensure a valid key.
+    An embedding computed by the caller (e.g. in a batch) is used as-is. When an
+    index_writer is given the chunk is buffered on it and the caller flushes it.
+    process_video_document builds its chunks in bulk with build_video_chunk.
     """
     try:
-        current_time = datetime.now(timezone.utc).isoformat()
-        is_group = group_id is not None
-
-        # Convert start_time "HH:MM:SS.mmm" to integer seconds
-        h, m, s = start_time.split(':')
-        seconds = int(h) * 3600 + int(m) * 60 + int(float(s))
+        seconds = int(video_timestamp_to_seconds(start_time))
 
         # 1) generate embedding on the transcript text
         try:
-            embedding = generate_embedding(page_text_content)
+            if embedding is None:
+                embedding = generate_embedding(page_text_content)
             print(f"[VideoChunk] EMBEDDING OK for {document_id}@{start_time}", flush=True)
         except Exception as e:
             print(f"[VideoChunk] EMBEDDING ERROR for {document_id}@{start_time}: {e}", flush=True)
@@ -185,30 +521,31 @@ def save_video_chunk(
 
         # 2) build chunk document
         try:
-            meta = get_document_metadata(document_id, user_id, group_id)
-            version = meta.get("version", 1) if meta else 1
-
-            # Use integer seconds to build a safe document key
-            chunk_id = f"{document_id}_{seconds}"
-
-            chunk = {
-                "id":                   chunk_id,
-                "document_id":          document_id,
-                "chunk_text":           page_text_content,
-                "video_ocr_chunk_text": ocr_chunk_text,
-                "embedding":            embedding,
-                "file_name":            file_name,
-                "start_time":           start_time,
-                "chunk_sequence":       seconds,
-                "upload_date":          current_time,
-                "version":              version,
-            }
+            if job_context is not None:
+                version = job_context.version
+            else:
+                meta = get_document_metadata(document_id, user_id, group_id)
+                version = meta.get("version", 1) if meta else 1
+
+            chunk = build_video_chunk(
+                page_text_content=page_text_content,
+                ocr_chunk_text=ocr_chunk_text,
+                start_time=start_time,
+                seconds=seconds,
+                file_name=file_name,
+                user_id=user_id,
+                document_id=document_id,
+                group_id=group_id,
+                embedding=embedding,
+                version=version
+            )
+            chunk_id = chunk["id"]
 
-            if is_group:
-                chunk["group_id"] = group_id
+            if job_context is not None:
+                client = job_context.search_client
+            elif group_id is not None:
                 client = CLIENTS["search_client_group"]
             else:
-                chunk["user_id"] = user_id
                 client = CLIENTS["search_client_user"]
 
             print(f"[VideoChunk] CHUNK BUILT {chunk_id}", flush=True)
@@ -217,10 +554,14 @@ def save_video_chunk(
             print(f"[VideoChunk] CHUNK BUILD ERROR for {document_id}@{start_time}: {e}", flush=True)
             return
 
-        # 3) upload to search index
+        # 3) upload to search index (or queue it on the caller's batch writer)
         try:
-            client.upload_documents(documents=[chunk])
-            print(f"[VideoChunk] UPLOAD OK for {chunk_id}", flush=True)
+            if index_writer is not None:
+                index_writer.add(chunk)
+                print(f"[VideoChunk] QUEUED {chunk_id}", flush=True)
+            else:
+                client.upload_documents(documents=[chunk])
+                print(f"[VideoChunk] UPLOAD OK for {chunk_id}", flush=True)
         except Exception as e:
             print(f"[VideoChunk] UPLOAD ERROR for {chunk_id}: {e}", flush=True)
 
@@ -235,23 +576,14 @@ def process_video_document(
     temp_file_path,
     original_filename,
     update_callback,
-    group_id
+    group_id,
+    job_context=None
 ):
     """
     Processes a video by dividing transcript into 30-second chunks,
     extracting OCR separately, and saving each as a chunk with safe IDs.
     """
 
-    def to_seconds(ts: str) -> float:
-        parts = ts.split(':')
-        parts = [float(p) for p in parts]
-        if len(parts) == 3:
-            h, m, s = parts
-        else:
-            h = 0.0
-            m, s = parts
-        return h * 3600 + m * 60 + s
-
     settings = get_settings()
     if not settings.get("enable_video_file_support", False):
         print("[VIDEO] indexing disabled in settings", flush=True)
@@ -268,7 +600,8 @@ def process_video_document(
                 document_id,
                 original_filename,
                 update_callback,
-                group_id
+                group_id,
+                job_context
             )
             update_callback(status=f"Enhanced citations: video at {blob_path}")
         except Exception as e:
@@ -289,50 +622,79 @@ def process_video_document(
         update_callback(status=f"VIDEO: auth failed → {e}")
         return 0
 
-    # 2) Upload video to Indexer
+    checkpoint = job_context.checkpoint if job_context is not None else None
+    vid = checkpoint.get_step_result("video_indexer_id") if checkpoint is not None else None
+    indexing_start = time.monotonic()
+
+    # 2) Upload video to Indexer (a resumed job polls the video it already uploaded)
+    if vid:
+        print(f"[VIDEO] RESUMING, videoId={vid}", flush=True)
+        update_callback(status=f"VIDEO: resuming id={vid}")
+    else:
+        try:
+            url = f"{vi_ep}/{vi_loc}/Accounts/{vi_acc}/Videos"
+            params = {"accessToken": token, "name": original_filename}
+            with open(temp_file_path, "rb") as f:
+                resp = requests.post(url, params=params, files={"file": f})
+            resp.raise_for_status()
+            vid = resp.json().get("id")
+            if not vid:
+                raise ValueError("no video ID returned")
+            print(f"[VIDEO] UPLOAD OK, videoId={vid}", flush=True)
+            update_callback(status=f"VIDEO: uploaded id={vid}")
+            if checkpoint is not None:
+                checkpoint.save_step_result("video_indexer_id", vid)
+        except Exception as e:
+            print(f"[VIDEO] UPLOAD ERROR: {e}", flush=True)
+            update_callback(status=f"VIDEO: upload failed → {e}")
+            return 0
+
+    # 3) Poll until ready, backing off between checks, for at most video_index_timeout seconds
     try:
-        url = f"{vi_ep}/{vi_loc}/Accounts/{vi_acc}/Videos"
-        params = {"accessToken": token, "name": original_filename}
-        with open(temp_file_path, "rb") as f:
-            resp = requests.post(url, params=params, files={"file": f})
-        resp.raise_for_status()
-        vid = resp.json().get("id")
-        if not vid:
-            raise ValueError("no video ID returned")
-        print(f"[VIDEO] UPLOAD OK, videoId={vid}", flush=True)
-        update_callback(status=f"VIDEO: uploaded id={vid}")
-    except Exception as e:
-        print(f"[VIDEO] UPLOAD ERROR: {e}", flush=True)
-        update_callback(status=f"VIDEO: upload failed → {e}")
-        return 0
+        index_timeout = float(settings.get("video_index_timeout", 600) or 600)
+    except (TypeError, ValueError):
+        index_timeout = 600.0
+    deadline = time.monotonic() + index_timeout
+    poll_delay = VIDEO_INDEXER_POLL_INITIAL_DELAY
+    index_url = f"{vi_ep}/{vi_loc}/Accounts/{vi_acc}/Videos/{vid}/Index"
 
-    # 3) Poll until ready
-    index_url = (
-        f"{vi_ep}/{vi_loc}/Accounts/{vi_acc}/Videos/{vid}/Index"
-        f"?accessToken={token}&includeInsights=Transcript&includeStreamingUrls=false"
-    )
     while True:
-        r = requests.get(index_url)
-        if r.status_code in (401, 404):
-            time.sleep(30); continue
-        if r.status_code == 429:
-            time.sleep(int(r.headers.get("Retry-After", 30))); continue
-        if r.status_code == 504:
-            time.sleep(30); continue
-        r.raise_for_status()
-        data = r.json()
-
-
-        info = data.get("videos", [{}])[0]
-        prog = info.get("processingProgress", "0%").rstrip("%")
-        state = info.get("state", "").lower()
-        update_callback(status=f"VIDEO: {prog}%")
-        if state == "failed":
-            update_callback(status="VIDEO: indexing failed")
-            return 0
-        if prog == "100":
-            break
-        time.sleep(30)
+        # The cached token is only renewed shortly before it expires, so long indexing runs keep working
+        params = {
+            "accessToken": get_video_indexer_account_token(settings),
+            "includeInsights": "Transcript",
+            "includeStreamingUrls": "false"
+        }
+        r = requests.get(index_url, params=params)
+        wait_seconds = poll_delay
+        if r.status_code == 401:
+            invalidate_video_indexer_account_token(settings)
+        elif r.status_code == 429:
+            try:
+                wait_seconds = float(r.headers.get("Retry-After", poll_delay))
+            except ValueError:
+                pass
+        elif r.status_code not in (404, 504):
+            r.raise_for_status()
+            data = r.json()
+
+            info = data.get("videos", [{}])[0]
+            prog = info.get("processingProgress", "0%").rstrip("%")
+            state = info.get("state", "").lower()
+            update_callback(status=f"VIDEO: {prog}%")
+            if state == "failed":
+                update_callback(status="VIDEO: indexing failed")
+                return 0
+            if prog == "100":
+                break
+
+        if time.monotonic() + wait_seconds > deadline:
+            raise TimeoutError(f"Video indexing of {original_filename} did not finish within {index_timeout:.0f} seconds.")
+        time.sleep(wait_seconds)
+        poll_delay = min(poll_delay * VIDEO_INDEXER_POLL_BACKOFF, VIDEO_INDEXER_POLL_MAX_DELAY)
+
+    if job_context is not None:
+        job_context.stage_timer.record("video_indexer", time.monotonic() - indexing_start, num_bytes=get_ingestion_file_size(job_context, temp_file_path))
 
     # 4) Extract transcript & OCR
     insights = info.get("insights", {})
@@ -350,44 +712,43 @@ def process_video_document(
         for inst in block.get("instances", [])
     ]
 
-    speech_context.sort(key=lambda x: to_seconds(x["start"]))
-    ocr_context.sort(key=lambda x: to_seconds(x["start"]))
-
-    total = 0
-    idx_s = 0
-    n_s = len(speech_context)
-    idx_o = 0
-    n_o = len(ocr_context)
-
-    while idx_s < n_s:
-        window_start = to_seconds(speech_context[idx_s]["start"])
-        window_end = window_start + 30.0
-
-        speech_lines = []
-        while idx_s < n_s and to_seconds(speech_context[idx_s]["start"]) <= window_end:
-            speech_lines.append(speech_context[idx_s]["text"])
-            idx_s += 1
-
-        ocr_lines = []
-        while idx_o < n_o and to_seconds(ocr_context[idx_o]["start"]) <= window_end:
-            ocr_lines.append(ocr_context[idx_o]["text"])
-            idx_o += 1
-
-        start_ts = speech_context[total]["start"]
-        chunk_text = " ".join(speech_lines).strip()
-        ocr_text = " ".join(ocr_lines).strip()
-
-        update_callback(current_file_chunk=total+1, status=f"VIDEO: saving chunk @ {start_ts}")
-        save_video_chunk(
-            page_text_content=chunk_text,
-            ocr_chunk_text=ocr_text,
-            start_time=start_ts,
-            file_name=original_filename,
-            user_id=user_id,
-            document_id=document_id,
-            group_id=group_id
-        )
-        total += 1
+    windows = build_video_windows(speech_context, ocr_context)
+    total = len(windows)
+
+    # One metadata lookup for the whole video rather than one per window
+    if job_context is not None:
+        version = job_context.version
+    else:
+        meta = get_document_metadata(document_id, user_id, group_id)
+        version = meta.get("version", 1) if meta else 1
+    upload_date = datetime.now(timezone.utc).isoformat()
+
+    # Embed transcript windows in batches, then index them in batches
+    index_writer = job_context.new_index_writer() if job_context is not None else get_search_index_writer(group_id)
+    for batch_start in range(0, total, EMBEDDING_BATCH_MAX_ITEMS):
+        batch = windows[batch_start:batch_start + EMBEDDING_BATCH_MAX_ITEMS]
+        embeddings = generate_embeddings([w["text"] for w in batch])
+
+        for window, embedding in zip(batch, embeddings):
+            index_writer.add(build_video_chunk(
+                page_text_content=window["text"],
+                ocr_chunk_text=window["ocr_text"],
+                start_time=window["start"],
+                seconds=window["seconds"],
+                file_name=original_filename,
+                user_id=user_id,
+                document_id=document_id,
+                group_id=group_id,
+                embedding=embedding,
+                version=version,
+                upload_date=upload_date
+            ))
+        update_callback(current_file_chunk=batch_start+len(batch), status=f"VIDEO: saving chunk @ {batch[-1]['start']}")
+
+    try:
+        index_writer.flush()
+    except Exception as e:
+        print(f"[VideoChunk] UPLOAD ERROR for {document_id}: {e}", flush=True)
 
     update_callback(status=f"VIDEO: done, {total} chunks")
     return total
@@ -475,6 +836,9 @@ def calculate_processing_percentage(doc_metadata):
     # This ensures progress is monotonic upwards until completion or error.
     return max(final_pct, current_pct)
 
+# Attempts per update_document call when concurrent writers keep changing the etag
+UPDATE_DOCUMENT_MAX_ATTEMPTS = 5
+
 def update_document(**kwargs):
     document_id = kwargs.get('document_id')
     user_id = kwargs.get('user_id')
@@ -501,100 +865,68 @@ def update_document(**kwargs):
     #     content=log_msg
     # )
 
-    # Choose the correct cosmos_container and query parameters
-    cosmos_container = cosmos_group_documents_container if is_group else cosmos_user_documents_container
-
-    if is_group:
-        query = """
-            SELECT * 
-            FROM c
-            WHERE c.id = @document_id 
-                AND c.group_id = @group_id
-        """
-        parameters = [
-            {"name": "@document_id", "value": document_id},
-            {"name": "@group_id", "value": group_id}
-        ]
-    else:
-        query = """
-            SELECT * 
-            FROM c
-            WHERE c.id = @document_id 
-                AND c.user_id = @user_id
-        """
-        parameters = [
-            {"name": "@document_id", "value": document_id},
-            {"name": "@user_id", "value": user_id}
-        ]
-    
-    add_file_task_to_file_processing_log(
-        document_id=document_id, 
-        user_id=group_id if is_group else user_id, 
-        content=f"Query is {query}, parameters are {parameters}."
-    )
+    status = kwargs.get('status', '')
 
-    try:
-        existing_documents = list(
-            cosmos_container.query_items(
-                query=query, 
-                parameters=parameters, 
-                enable_cross_partition_query=True
-            )
+    if status:
+        add_file_task_to_file_processing_log(
+            document_id=document_id,
+            user_id=group_id if is_group else user_id,
+            content=f"Status: {status}"
         )
 
-        status = kwargs.get('status', '')
-
-        if status:
-            add_file_task_to_file_processing_log(
-                document_id=document_id,
-                user_id=group_id if is_group else user_id,
-                content=f"Status: {status}"
-            )
-
-        if not existing_documents:
-            # Log specific error before raising
-            log_msg = f"Document {document_id} not found for user {user_id} during update."
-            print(log_msg)
-            add_file_task_to_file_processing_log(
-                document_id=document_id, 
-                user_id=group_id if is_group else user_id, 
-                content=log_msg
-            )
-            raise CosmosResourceNotFoundError(
-                message=f"Document {document_id} not found",
-                status=404
-            )
-
+    try:
+        # 1. Point-read the document and apply the changes as a conditional patch.
+        # If a concurrent callback wrote first (412), re-read and try again.
+        for attempt in range(1, UPDATE_DOCUMENT_MAX_ATTEMPTS + 1):
+            existing_document = read_document_item(document_id, user_id, group_id)
+
+            if not existing_document:
+                # Log specific error before raising
+                log_msg = f"Document {document_id} not found for user {user_id} during update."
+                print(log_msg)
+                add_file_task_to_file_processing_log(
+                    document_id=document_id, 
+                    user_id=group_id if is_group else user_id, 
+                    content=log_msg,
+                    level="error"
+                )
+                raise CosmosResourceNotFoundError(
+                    message=f"Document {document_id} not found",
+                    status=404
+                )
 
-        existing_document = existing_documents[0]
-        original_percentage = existing_document.get('percentage_complete', 0) # Store for comparison
+            original_percentage = existing_document.get('percentage_complete', 0) # Store for comparison
 
-        # 2. Apply updates from kwargs
-        update_occurred = False
-        updated_fields_requiring_chunk_sync = set() # Track fields needing propagation
+            # 2. Apply updates from kwargs
+            update_occurred = False
+            updated_fields_requiring_chunk_sync = set() # Track fields needing propagation
+            set_fields = {}
 
-        if num_chunks_increment > 0:
-            current_num_chunks = existing_document.get('num_chunks', 0)
-            existing_document['num_chunks'] = current_num_chunks + num_chunks_increment
-            update_occurred = True # Incrementing counts as an update
-            add_file_task_to_file_processing_log(
-                document_id=document_id, 
-                user_id=group_id if is_group else user_id,  
-                content=f"Incrementing num_chunks by {num_chunks_increment} to {existing_document['num_chunks']}"
-            )
+            if num_chunks_increment > 0:
+                current_num_chunks = existing_document.get('num_chunks', 0)
+                existing_document['num_chunks'] = current_num_chunks + num_chunks_increment
+                update_occurred = True # Incrementing counts as an update
+                add_file_task_to_file_processing_log(
+                    document_id=document_id, 
+                    user_id=group_id if is_group else user_id,  
+                    content=f"Incrementing num_chunks by {num_chunks_increment} to {existing_document['num_chunks']}"
+                )
 
-        for key, value in kwargs.items():
-            if value is not None and existing_document.get(key) != value:
-                # Avoid overwriting num_chunks if it was just incremented
-                if key == 'num_chunks' and num_chunks_increment > 0:
-                    continue # Skip direct assignment if increment was used
-                existing_document[key] = value
-                update_occurred = True
-                if key in ['title', 'authors', 'file_name', 'document_classification']:
-                    updated_fields_requiring_chunk_sync.add(key)
-
-        # 3. If any update happened, handle timestamps and percentage
-        if update_occurred:
+            for key, value in kwargs.items():
+                if value is not None and existing_document.get(key) != value:
+                    # Avoid overwriting num_chunks if it was just incremented
+                    if key == 'num_chunks' and num_chunks_increment > 0:
+                        continue # Skip direct assignment if increment was used
+                    existing_document[key] = value
+                    set_fields[key] = value
+                    update_occurred = True
+                    if key in ['title', 'authors', 'file_name', 'document_classification']:
+                        updated_fields_requiring_chunk_sync.add(key)
+
+            if not update_occurred:
+                break
+
+            # 3. If any update happened, handle timestamps and percentage
             existing_document['last_updated'] = current_time
 
             # Calculate new percentage based on the *updated* existing_document state
@@ -623,10 +955,23 @@ def update_document(**kwargs):
             else:
                  existing_document['percentage_complete'] = new_percentage
 
+            set_fields['last_updated'] = existing_document['last_updated']
+            set_fields['percentage_complete'] = existing_document['percentage_complete']
+            operations = build_patch_operations(
+                set_fields=set_fields,
+                increment_fields={'num_chunks': num_chunks_increment if num_chunks_increment > 0 else 0}
+            )
+
+            try:
+                patch_document_item(existing_document, operations, group_id)
+                break
+            except CosmosAccessConditionFailedError:
+                if attempt == UPDATE_DOCUMENT_MAX_ATTEMPTS:
+                    raise
+                print(f"Document {document_id} changed during update, retrying ({attempt}/{UPDATE_DOCUMENT_MAX_ATTEMPTS})")
+
         # 4. Propagate relevant changes to search index chunks
-        # This happens regardless of 'update_occurred' flag because the *intent* from kwargs might trigger it,
-        # even if the main doc update didn't happen (e.g., only percentage changed).
-        # However, it's better to only do this if the relevant fields *actually* changed.
+        # Only done when the relevant fields *actually* changed and were written above.
         if update_occurred and updated_fields_requiring_chunk_sync:
             try:
                 chunks_to_update = get_all_chunks(document_id, user_id)
@@ -656,14 +1001,10 @@ def update_document(**kwargs):
                 add_file_task_to_file_processing_log(
                     document_id=document_id, 
                     user_id=group_id if is_group else user_id, 
-                    content=error_msg
+                    content=error_msg,
+                    level="error"
                 )
 
-
-        # 5. Upsert the document if changes were made
-        if update_occurred:
-            cosmos_container.upsert_item(existing_document)
-
     except CosmosResourceNotFoundError as e:
         # Error already logged where it was first detected
         print(f"Document {document_id} not found or access denied: {e}")
@@ -674,7 +1015,8 @@ def update_document(**kwargs):
         add_file_task_to_file_processing_log(
             document_id=document_id, 
             user_id=group_id if is_group else user_id,
-            content=error_msg
+            content=error_msg,
+            level="error"
         )
         # Optionally update status to failure here if the exception is critical
         # try:
@@ -685,12 +1027,12 @@ def update_document(**kwargs):
         #    print(f"Failed to update status to error state for {document_id}: {inner_e}")
         raise # Re-raise the original exception
 
-def save_chunks(page_text_content, page_number, file_name, user_id, document_id, group_id=None):
+def save_chunks(page_text_content, page_number, file_name, user_id, document_id, group_id=None, embedding=None, index_writer=None, job_context=None):
     """
     Save a single chunk (one page) at a time:
-      - Generate embedding
-      - Build chunk metadata
-      - Upload to Search index
+      - Generate embedding (unless one was already computed by the caller)
+      - Build chunk metadata (version comes from job_context when given)
+      - Upload to Search index, or queue it on index_writer (flushed by the caller)
     """
     current_time = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
     is_group = group_id is not None
@@ -707,27 +1049,31 @@ def save_chunks(page_text_content, page_number, file_name, user_id, document_id,
         add_file_task_to_file_processing_log(
             document_id=document_id, 
             user_id=group_id if is_group else user_id, 
-            content=f"Saving chunk, cosmos_container:{cosmos_container}, page_text_content:{page_text_content}, page_number:{page_number}, file_name:{file_name}, user_id:{user_id}, document_id:{document_id}, group_id:{group_id}"
+            content=f"Saving chunk, cosmos_container:{cosmos_container}, page_text_content:{page_text_content}, page_number:{page_number}, file_name:{file_name}, user_id:{user_id}, document_id:{document_id}, group_id:{group_id}",
+            level="debug"
         )
 
-        if is_group:
-            metadata = get_document_metadata(
-                document_id=document_id, 
-                user_id=user_id, 
-                group_id=group_id
-            )
+        if job_context is not None:
+            version = job_context.version
         else:
-            metadata = get_document_metadata(
-                document_id=document_id, 
-                user_id=user_id
-            )
+            if is_group:
+                metadata = get_document_metadata(
+                    document_id=document_id, 
+                    user_id=user_id, 
+                    group_id=group_id
+                )
+            else:
+                metadata = get_document_metadata(
+                    document_id=document_id, 
+                    user_id=user_id
+                )
 
-        if not metadata:
-            raise ValueError(f"No metadata found for document {document_id} (group: {is_group})")
+            if not metadata:
+                raise ValueError(f"No metadata found for document {document_id} (group: {is_group})")
 
-        version = metadata.get("version") if metadata.get("version") else 1 
-        if version is None:
-            raise ValueError(f"Metadata for document {document_id} missing 'version' field")
+            version = metadata.get("version") if metadata.get("version") else 1 
+            if version is None:
+                raise ValueError(f"Metadata for document {document_id} missing 'version' field")
         
     except Exception as e:
         print(f"Error updating document status or retrieving metadata for document {document_id}: {repr(e)}\nTraceback:\n{traceback.format_exc()}")
@@ -737,7 +1083,8 @@ def save_chunks(page_text_content, page_number, file_name, user_id, document_id,
     try:
         #status = f"Generating embedding for page {page_number}"
         #update_document(document_id=document_id, user_id=user_id, status=status)
-        embedding = generate_embedding(page_text_content)
+        if embedding is None:
+            embedding = generate_embedding(page_text_content)
     except Exception as e:
         print(f"Error generating embedding for page {page_number} of document {document_id}: {e}")
         raise
@@ -745,6 +1092,7 @@ def save_chunks(page_text_content, page_number, file_name, user_id, document_id,
     # Build chunk document
     try:
         chunk_id = f"{document_id}_{page_number}"
+        chunk_content_hash = compute_chunk_content_hash(page_text_content)
         chunk_keywords = []
         chunk_summary = ""
         author = []
@@ -756,6 +1104,7 @@ def save_chunks(page_text_content, page_number, file_name, user_id, document_id,
                 "document_id": document_id,
                 "chunk_id": str(page_number),
                 "chunk_text": page_text_content,
+                "chunk_content_hash": chunk_content_hash,
                 "embedding": embedding,
                 "file_name": file_name,
                 "chunk_keywords": chunk_keywords,
@@ -775,6 +1124,7 @@ def save_chunks(page_text_content, page_number, file_name, user_id, document_id,
                 "document_id": document_id,
                 "chunk_id": str(page_number),
                 "chunk_text": page_text_content,
+                "chunk_content_hash": chunk_content_hash,
                 "embedding": embedding,
                 "file_name": file_name,
                 "chunk_keywords": chunk_keywords,
@@ -797,14 +1147,145 @@ def save_chunks(page_text_content, page_number, file_name, user_id, document_id,
         #status = f"Uploading page {page_number} of document {document_id} to index."
         #update_document(document_id=document_id, user_id=user_id, status=status)
 
-        search_client = CLIENTS["search_client_group"] if is_group else CLIENTS["search_client_user"]
-        # Upload as a single-document list
-        search_client.upload_documents(documents=[chunk_document])
+        if index_writer is not None:
+            index_writer.add(chunk_document)
+        elif job_context is not None:
+            job_context.search_client.upload_documents(documents=[chunk_document])
+        else:
+            search_client = CLIENTS["search_client_group"] if is_group else CLIENTS["search_client_user"]
+            # Upload as a single-document list
+            search_client.upload_documents(documents=[chunk_document])
 
     except Exception as e:
         print(f"Error uploading chunk document for document {document_id}: {e}")
         raise
 
+def save_chunks_batch(chunks, file_name, user_id, document_id, update_callback, group_id=None, status_template="Saving chunk {index}/{total}...", total=None, progress_fields=None, index_writer=None, job_context=None):
+    """
+    Embeds and saves a list of chunks, sending up to EMBEDDING_BATCH_MAX_ITEMS
+    texts per embeddings request instead of one request per chunk. Chunk
+    documents are uploaded to the search index in batches through a
+    SearchIndexBatchWriter, which is flushed before returning unless the
+    caller passed in its own index_writer. job_context, when given, is
+    handed to every save_chunks call.
+
+    Up to ingestion_embedding_concurrency embedding batches are in flight at
+    once (each admitted by the shared Azure OpenAI rate limiter); results are
+    consumed in submission order, so chunks are saved, reported and numbered
+    exactly as in a sequential run. With a job_context, chunks whose content
+    hash matches a chunk of the file's previous version reuse its embedding
+    and are not sent to the embeddings API, and chunks a resumed job already
+    indexed (per its checkpoint) are skipped but still counted as saved.
+
+    Each chunk is a dict with 'page_number' and 'content', plus an optional
+    'progress_index' used for progress reporting (defaults to page_number).
+    Empty chunks are skipped. Returns the number of chunks saved.
+    """
+    chunks = [c for c in chunks if c.get("content", "").strip()]
+    total = total if total is not None else len(chunks)
+    total_chunks_saved = 0
+
+    checkpoint = job_context.checkpoint if job_context is not None else None
+    if checkpoint is not None and checkpoint.resumed:
+        pending_chunks = [c for c in chunks if not checkpoint.is_chunk_indexed(file_name, c["page_number"])]
+        total_chunks_saved = len(chunks) - len(pending_chunks)
+        chunks = pending_chunks
+        if total_chunks_saved and chunks:
+            update_callback(status=f"Resumed from chunk {chunks[0]['page_number']} of {file_name} ({total_chunks_saved} already indexed)")
+    owns_index_writer = index_writer is None
+    if owns_index_writer:
+        index_writer = job_context.new_index_writer() if job_context is not None else get_search_index_writer(group_id)
+
+    settings = job_context.settings if job_context is not None else get_settings()
+    batches = [
+        chunks[batch_start:batch_start + EMBEDDING_BATCH_MAX_ITEMS]
+        for batch_start in range(0, len(chunks), EMBEDDING_BATCH_MAX_ITEMS)
+    ]
+    try:
+        concurrency = max(1, int(settings.get('ingestion_embedding_concurrency', 4) or 1))
+    except (TypeError, ValueError):
+        concurrency = 1
+    concurrency = min(concurrency, max(1, len(batches)))
+
+    reusable_embeddings = job_context.get_reusable_embeddings() if job_context is not None else {}
+
+    def embed_batch(batch):
+        embeddings = [reusable_embeddings.get(compute_chunk_content_hash(c["content"])) for c in batch]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            texts = [batch[i]["content"] for i in missing]
+            with ingestion_stage(job_context, "embedding", num_bytes=sum(len(t.encode("utf-8")) for t in texts), num_items=len(texts)):
+                new_embeddings = generate_embeddings(texts)
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+        if job_context is not None and len(missing) < len(batch):
+            job_context.stage_timer.record("embedding_reused", num_items=len(batch) - len(missing))
+        return embeddings
+
+    embedding_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed") if concurrency > 1 else None
+    # Sliding window of in-flight batches, oldest first
+    in_flight = deque()
+    next_batch = 0
+
+    try:
+        while next_batch < len(batches) or in_flight:
+            while embedding_pool is not None and next_batch < len(batches) and len(in_flight) < concurrency:
+                in_flight.append((batches[next_batch], embedding_pool.submit(embed_batch, batches[next_batch])))
+                next_batch += 1
+
+            if embedding_pool is not None:
+                batch, future = in_flight.popleft()
+                embeddings = future.result()
+            else:
+                batch = batches[next_batch]
+                next_batch += 1
+                embeddings = embed_batch(batch)
+
+            total_chunks_saved += _save_embedded_batch(
+                batch, embeddings, file_name, user_id, document_id, update_callback,
+                group_id, status_template, total, progress_fields, index_writer, job_context
+            )
+    finally:
+        if embedding_pool is not None:
+            for _, future in in_flight:
+                future.cancel()
+            embedding_pool.shutdown(wait=True)
+
+    if owns_index_writer:
+        index_writer.flush()
+
+    return total_chunks_saved
+
+def _save_embedded_batch(batch, embeddings, file_name, user_id, document_id, update_callback, group_id, status_template, total, progress_fields, index_writer, job_context):
+    """Reports progress for and saves one embedded batch of chunks, in order."""
+    total_chunks_saved = 0
+    for chunk, embedding in zip(batch, embeddings):
+        progress_index = chunk.get("progress_index", chunk["page_number"])
+        update_callback(
+            current_file_chunk=int(progress_index),
+            status=status_template.format(index=progress_index, total=total),
+            **(progress_fields or {})
+        )
+
+        args = {
+            "page_text_content": chunk["content"],
+            "page_number": chunk["page_number"],
+            "file_name": file_name,
+            "user_id": user_id,
+            "document_id": document_id,
+            "embedding": embedding,
+            "index_writer": index_writer,
+            "job_context": job_context
+        }
+
+        if group_id is not None:
+            args["group_id"] = group_id
+
+        save_chunks(**args)
+        total_chunks_saved += 1
+
+    return total_chunks_saved
+
 def get_all_chunks(document_id, user_id, group_id=None):
     is_group = group_id is not None
 
@@ -883,44 +1364,6 @@ def get_pdf_page_count(pdf_path: str) -> int:
         print(f"Error reading PDF page count: {e}")
         return 0
 
-def chunk_pdf(input_pdf_path: str, max_pages: int = 500) -> list:
-    """
-    Splits a PDF into multiple PDFs, each with up to `max_pages` pages,
-    using PyMuPDF. Returns a list of file paths for the newly created chunks.
-    """
-    chunks = []
-    try:
-        with fitz.open(input_pdf_path) as doc:
-            total_pages = doc.page_count
-            current_page = 0
-            chunk_index = 1
-            
-            base_name, ext = os.path.splitext(input_pdf_path)
-            
-            # Loop through the PDF in increments of `max_pages`
-            while current_page < total_pages:
-                end_page = min(current_page + max_pages, total_pages)
-                
-                # Create a new, empty document for this chunk
-                chunk_doc = fitz.open()
-                
-                # Insert the range of pages in one go
-                chunk_doc.insert_pdf(doc, from_page=current_page, to_page=end_page - 1)
-                
-                chunk_pdf_path = f"{base_name}_chunk_{chunk_index}{ext}"
-                chunk_doc.save(chunk_pdf_path)
-                chunk_doc.close()
-                
-                chunks.append(chunk_pdf_path)
-                
-                current_page = end_page
-                chunk_index += 1
-
-    except Exception as e:
-        print(f"Error chunking PDF: {e}")
-
-    return chunks
-
 def get_documents(user_id, group_id=None):
     is_group = group_id is not None
 
@@ -967,49 +1410,13 @@ def get_documents(user_id, group_id=None):
         return jsonify({'error': f'Error retrieving documents: {str(e)}'}), 500
 
 def get_document(user_id, document_id, group_id=None):
-    is_group = group_id is not None
-
-    # Choose the correct cosmos_container and query parameters
-    cosmos_container = cosmos_group_documents_container if is_group else cosmos_user_documents_container
-
-    if is_group:
-        query = """
-            SELECT TOP 1 * 
-            FROM c
-            WHERE c.id = @document_id 
-                AND c.group_id = @group_id
-            ORDER BY c.version DESC
-        """
-        parameters = [
-            {"name": "@document_id", "value": document_id},
-            {"name": "@group_id", "value": group_id}
-        ]
-    else:
-        query = """
-            SELECT TOP 1 * 
-            FROM c
-            WHERE c.id = @document_id 
-                AND c.user_id = @user_id
-            ORDER BY c.version DESC
-        """
-        parameters = [
-            {"name": "@document_id", "value": document_id},
-            {"name": "@user_id", "value": user_id}
-        ]
-
     try:
-        document_results = list(
-            cosmos_container.query_items(
-                query=query, 
-                parameters=parameters, 
-                enable_cross_partition_query=True
-            )
-        )
+        document_item = read_document_item(document_id, user_id, group_id)
 
-        if not document_results:
+        if not document_item:
             return jsonify({'error': 'Document not found or access denied'}), 404
 
-        return jsonify(document_results[0]), 200
+        return jsonify(document_item), 200
 
     except Exception as e:
         return jsonify({'error': f'Error retrieving document: {str(e)}'}), 500
@@ -1188,6 +1595,9 @@ def delete_document(user_id, document_id, group_id=None):
             partition_key=document_id
         )
 
+        # Drop any resume state (and the upload kept with it) for this document
+        delete_ingestion_checkpoint(document_id)
+
     except CosmosResourceNotFoundError:
         raise Exception("Document not found")
     except Exception as e:
@@ -1341,7 +1751,9 @@ def process_metadata_extraction_background(document_id, user_id, group_id=None):
         if is_group:
             args["group_id"] = group_id
 
+        extraction_start = time.monotonic()
         metadata = extract_document_metadata(**args)
+        extraction_seconds = time.monotonic() - extraction_start
 
 
         if not metadata:
@@ -1376,11 +1788,18 @@ def process_metadata_extraction_background(document_id, user_id, group_id=None):
 
         update_document(**args_metadata)
 
+        # Add this run to the stats recorded when the document was ingested
+        document_item = get_document_metadata(document_id=document_id, user_id=user_id, group_id=group_id)
         args_status = {
             "document_id": document_id,
             "user_id": user_id,
             "status": "Metadata extraction complete",
-            "percentage_complete": 100
+            "percentage_complete": 100,
+            "ingestion_stats": add_stage_to_ingestion_stats(
+                (document_item or {}).get("ingestion_stats"),
+                "metadata_extraction",
+                extraction_seconds
+            )
         }
 
         if is_group:
@@ -1446,38 +1865,11 @@ def extract_document_metadata(document_id, user_id, group_id=None):
         "abstract": ""
     }
 
-    if is_group:
-        query = """
-            SELECT *
-            FROM c
-            WHERE c.id = @document_id
-                AND c.group_id = @group_id
-        """
-        parameters = [
-            {"name": "@document_id", "value": document_id},
-            {"name": "@group_id", "value": group_id}
-        ]
-    else:
-        query = """
-            SELECT *
-            FROM c
-            WHERE c.id = @document_id 
-                AND c.user_id = @user_id
-        """
-        parameters = [
-            {"name": "@document_id", "value": document_id},
-            {"name": "@user_id", "value": user_id}
-        ]
-
     # --- Step 1: Retrieve document from Cosmos ---
+    document_items = []
     try:
-        document_items = list(
-            cosmos_container.query_items(
-                query=query, 
-                parameters=parameters, 
-                enable_cross_partition_query=True
-            )
-        )
+        document_item = read_document_item(document_id, user_id, group_id)
+        document_items = [document_item] if document_item else []
 
         args = {
             "document_id": document_id,
@@ -1494,13 +1886,15 @@ def extract_document_metadata(document_id, user_id, group_id=None):
         add_file_task_to_file_processing_log(
             document_id=document_id, 
             user_id=group_id if is_group else user_id,
-            content=f"Retrieved document items for document {document_id}: {document_items}"
+            content=f"Retrieved document items for document {document_id}: {document_items}",
+            level="debug"
         )
     except Exception as e:
         add_file_task_to_file_processing_log(
             document_id=document_id, 
             user_id=group_id if is_group else user_id,
-            content=f"Error querying document items for document {document_id}: {e}"
+            content=f"Error querying document items for document {document_id}: {e}",
+            level="error"
         )
         print(f"Error querying document items for document {document_id}: {e}")
 
@@ -1527,7 +1921,8 @@ def extract_document_metadata(document_id, user_id, group_id=None):
     add_file_task_to_file_processing_log(
         document_id=document_id, 
         user_id=group_id if is_group else user_id,
-        content=f"Extracted metadata for document {document_id}, metadata: {meta_data}"
+        content=f"Extracted metadata for document {document_id}, metadata: {meta_data}",
+        level="debug"
     )
 
     args = {
@@ -1582,7 +1977,8 @@ def extract_document_metadata(document_id, user_id, group_id=None):
                 add_file_task_to_file_processing_log(
                     document_id=document_id, 
                     user_id=group_id if is_group else user_id,
-                    content=f"Blocked document metadata: {document_metadata}, reasons: {block_reasons}"
+                    content=f"Blocked document metadata: {document_metadata}, reasons: {block_reasons}",
+                    level="warning"
                 )
                 print(f"Blocked document metadata: {document_metadata}\nReasons: {block_reasons}")
                 return None
@@ -1591,7 +1987,8 @@ def extract_document_metadata(document_id, user_id, group_id=None):
             add_file_task_to_file_processing_log(
                 document_id=document_id, 
                 user_id=group_id if is_group else user_id,
-                content=f"Error checking content safety for document metadata: {e}"
+                content=f"Error checking content safety for document metadata: {e}",
+                level="error"
             )
             print(f"Error checking content safety for document metadata: {e}")
 
@@ -1601,7 +1998,8 @@ def extract_document_metadata(document_id, user_id, group_id=None):
             add_file_task_to_file_processing_log(
                 document_id=document_id, 
                 user_id=group_id if is_group else user_id,
-                content=f"Processing Hybrid search for document {document_id} using json dump of metadata {json.dumps(meta_data)}"
+                content=f"Processing Hybrid search for document {document_id} using json dump of metadata {json.dumps(meta_data)}",
+                level="debug"
             )
 
             args = {
@@ -1645,39 +2043,17 @@ def extract_document_metadata(document_id, user_id, group_id=None):
         add_file_task_to_file_processing_log(
             document_id=document_id, 
             user_id=group_id if is_group else user_id,
-            content=f"Error processing Hybrid search for document {document_id}: {e}"
+            content=f"Error processing Hybrid search for document {document_id}: {e}",
+            level="error"
         )
         print(f"Error processing Hybrid search for document {document_id}: {e}")
         search_results = "No Hybrid results"
 
-    gpt_model = settings.get('metadata_extraction_model')
-
-    # --- Step 5: Prepare GPT Client ---
-    if enable_gpt_apim:
-        # APIM-based GPT client
-        gpt_client = AzureOpenAI(
-            api_version=settings.get('azure_apim_gpt_api_version'),
-            azure_endpoint=settings.get('azure_apim_gpt_endpoint'),
-            api_key=settings.get('azure_apim_gpt_subscription_key')
-        )
-    else:
-        # Standard Azure OpenAI approach
-        if settings.get('azure_openai_gpt_authentication_type') == 'managed_identity':
-            token_provider = get_bearer_token_provider(
-                DefaultAzureCredential(), 
-                "https://cognitiveservices.azure.com/.default"
-            )
-            gpt_client = AzureOpenAI(
-                api_version=settings.get('azure_openai_gpt_api_version'),
-                azure_endpoint=settings.get('azure_openai_gpt_endpoint'),
-                azure_ad_token_provider=token_provider
-            )
-        else:
-            gpt_client = AzureOpenAI(
-                api_version=settings.get('azure_openai_gpt_api_version'),
-                azure_endpoint=settings.get('azure_openai_gpt_endpoint'),
-                api_key=settings.get('azure_openai_gpt_key')
-            )
+    gpt_model = settings.get('metadata_extraction_model')
+
+    # --- Step 5: Prepare GPT Client ---
+    # APIM or direct Azure OpenAI (key / managed identity), pooled in CLIENTS
+    gpt_client = get_azure_openai_client("gpt", settings)
 
     # --- Step 6: GPT Prompt and JSON Parsing ---
     try:
@@ -1704,16 +2080,21 @@ def extract_document_metadata(document_id, user_id, group_id=None):
             }
         ]
 
-        response = gpt_client.chat.completions.create(
-            model=gpt_model, 
-            messages=messages
+        response = call_with_openai_rate_limit(
+            gpt_model,
+            lambda: gpt_client.chat.completions.create(
+                model=gpt_model, 
+                messages=messages
+            ),
+            estimated_tokens=estimate_token_count(json.dumps(messages))
         )
         
     except Exception as e:
         add_file_task_to_file_processing_log(
             document_id=document_id, 
             user_id=group_id if is_group else user_id,
-            content=f"Error processing GPT request for document {document_id}: {e}"
+            content=f"Error processing GPT request for document {document_id}: {e}",
+            level="error"
         )
         print(f"Error processing GPT request for document {document_id}: {e}")
         return meta_data  # Return what we have so far
@@ -1725,7 +2106,8 @@ def extract_document_metadata(document_id, user_id, group_id=None):
     add_file_task_to_file_processing_log(
         document_id=document_id, 
         user_id=group_id if is_group else user_id,
-        content=f"GPT response for document {document_id}: {response_content}"
+        content=f"GPT response for document {document_id}: {response_content}",
+        level="debug"
     )
 
     # --- Step 7: Clean and parse the GPT JSON output ---
@@ -1741,7 +2123,8 @@ def extract_document_metadata(document_id, user_id, group_id=None):
         add_file_task_to_file_processing_log(
             document_id=document_id, 
             user_id=group_id if is_group else user_id, 
-            content=f"Cleaned JSON from GPT response for document {document_id}: {cleaned_str}"
+            content=f"Cleaned JSON from GPT response for document {document_id}: {cleaned_str}",
+            level="debug"
         )
 
         gpt_output = json.loads(cleaned_str)
@@ -1749,7 +2132,8 @@ def extract_document_metadata(document_id, user_id, group_id=None):
         add_file_task_to_file_processing_log(
             document_id=document_id, 
             user_id=group_id if is_group else user_id,
-            content=f"Decoded JSON from GPT response for document {document_id}: {gpt_output}"
+            content=f"Decoded JSON from GPT response for document {document_id}: {gpt_output}",
+            level="debug"
         )
 
         # Ensure authors and keywords are always lists
@@ -1760,7 +2144,8 @@ def extract_document_metadata(document_id, user_id, group_id=None):
         add_file_task_to_file_processing_log(
             document_id=document_id, 
             user_id=group_id if is_group else user_id,
-            content=f"Error decoding JSON from GPT response for document {document_id}: {e}"
+            content=f"Error decoding JSON from GPT response for document {document_id}: {e}",
+            level="error"
         )
         print(f"Error decoding JSON from response: {e}")
         return meta_data  # or None
@@ -1800,7 +2185,8 @@ def extract_document_metadata(document_id, user_id, group_id=None):
     add_file_task_to_file_processing_log(
         document_id=document_id, 
         user_id=group_id if is_group else user_id,
-        content=f"Final metadata for document {document_id}: {meta_data}"
+        content=f"Final metadata for document {document_id}: {meta_data}",
+        level="debug"
     )
 
     args = {
@@ -1868,15 +2254,8 @@ def is_effectively_empty(value):
         return all(not item.strip() for item in value if isinstance(item, str))
     return False
 
-# --- Helper function to estimate word count ---
-def estimate_word_count(text):
-    """Estimates the number of words in a string."""
-    if not text:
-        return 0
-    return len(text.split())
-
 # --- Helper function for uploading to blob storage ---
-def upload_to_blob(temp_file_path, user_id, document_id, blob_filename, update_callback, group_id=None):
+def upload_to_blob(temp_file_path, user_id, document_id, blob_filename, update_callback, group_id=None, job_context=None):
     """Uploads the file to Azure Blob Storage."""
 
     is_group = group_id is not None
@@ -1908,7 +2287,7 @@ def upload_to_blob(temp_file_path, user_id, document_id, blob_filename, update_c
 
         update_callback(status=f"Uploading {blob_filename} to Blob Storage...")
 
-        with open(temp_file_path, "rb") as f:
+        with ingestion_stage(job_context, "blob_upload", num_bytes=get_ingestion_file_size(job_context, temp_file_path)), open(temp_file_path, "rb") as f:
             blob_client.upload_blob(f, overwrite=True, metadata=metadata)
 
         print(f"Successfully uploaded {blob_filename} to blob storage at {blob_path}")
@@ -1920,7 +2299,7 @@ def upload_to_blob(temp_file_path, user_id, document_id, blob_filename, update_c
 
 
 # --- Helper function to process TXT files ---
-def process_txt(document_id, user_id, temp_file_path, original_filename, enable_enhanced_citations, update_callback, group_id=None):
+def process_txt(document_id, user_id, temp_file_path, original_filename, enable_enhanced_citations, update_callback, group_id=None, job_context=None):
     """Processes plain text files."""
     is_group = group_id is not None
 
@@ -1934,7 +2313,8 @@ def process_txt(document_id, user_id, temp_file_path, original_filename, enable_
             "user_id": user_id,
             "document_id": document_id,
             "blob_filename": original_filename,
-            "update_callback": update_callback
+            "update_callback": update_callback,
+            "job_context": job_context
         }
 
         if is_group:
@@ -1943,37 +2323,29 @@ def process_txt(document_id, user_id, temp_file_path, original_filename, enable_
         upload_to_blob(**args)
 
     try:
-        with open(temp_file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        words = content.split()
-        num_words = len(words)
-        num_chunks_estimated = math.ceil(num_words / target_words_per_chunk)
+        with ingestion_stage(job_context, "parsing", num_bytes=get_ingestion_file_size(job_context, temp_file_path)):
+            text_chunks = run_parsing_task(parse_txt_chunks, temp_file_path, target_words_per_chunk)
+        num_chunks_estimated = len(text_chunks)
         update_callback(number_of_pages=num_chunks_estimated) # Use number_of_pages for chunk count
 
-        for i in range(0, num_words, target_words_per_chunk):
-            chunk_words = words[i : i + target_words_per_chunk]
-            chunk_content = " ".join(chunk_words)
-            chunk_index = (i // target_words_per_chunk) + 1
+        args = {
+            "chunks": [
+                {"page_number": idx, "content": chunk_content}
+                for idx, chunk_content in enumerate(text_chunks, start=1)
+            ],
+            "file_name": original_filename,
+            "user_id": user_id,
+            "document_id": document_id,
+            "update_callback": update_callback,
+            "total": num_chunks_estimated
+        }
 
-            if chunk_content.strip():
-                update_callback(
-                    current_file_chunk=chunk_index,
-                    status=f"Saving chunk {chunk_index}/{num_chunks_estimated}..."
-                )
-                args = {
-                    "page_text_content": chunk_content,
-                    "page_number": chunk_index,
-                    "file_name": original_filename,
-                    "user_id": user_id,
-                    "document_id": document_id
-                }
+        if is_group:
+            args["group_id"] = group_id
 
-                if is_group:
-                    args["group_id"] = group_id
+        args["job_context"] = job_context
 
-                save_chunks(**args)
-                total_chunks_saved += 1
+        total_chunks_saved = save_chunks_batch(**args)
 
     except Exception as e:
         raise Exception(f"Failed processing TXT file {original_filename}: {e}")
@@ -1981,7 +2353,7 @@ def process_txt(document_id, user_id, temp_file_path, original_filename, enable_
     return total_chunks_saved
 
 # --- Helper function to process HTML files ---
-def process_html(document_id, user_id, temp_file_path, original_filename, enable_enhanced_citations, update_callback, group_id=None):
+def process_html(document_id, user_id, temp_file_path, original_filename, enable_enhanced_citations, update_callback, group_id=None, job_context=None):
     """Processes HTML files."""
     is_group = group_id is not None
 
@@ -1996,7 +2368,8 @@ def process_html(document_id, user_id, temp_file_path, original_filename, enable
             "user_id": user_id,
             "document_id": document_id,
             "blob_filename": original_filename,
-            "update_callback": update_callback
+            "update_callback": update_callback,
+            "job_context": job_context
         }
 
         if is_group:
@@ -2005,64 +2378,31 @@ def process_html(document_id, user_id, temp_file_path, original_filename, enable
         upload_to_blob(**args)
 
     try:
-        # --- CHANGE HERE: Open in binary mode ('rb') ---
-        # Let BeautifulSoup handle the decoding based on meta tags or detection
-        with open(temp_file_path, 'rb') as f:
-            # --- CHANGE HERE: Pass the file object directly to BeautifulSoup ---
-            soup = BeautifulSoup(f, 'lxml') # or 'html.parser' if lxml not installed
-
-        # TODO: Advanced Table Handling - (Comment remains valid)
-        # ...
-
-        # Now process the soup object as before
-        text_content = soup.get_text(separator=" ", strip=True)
-
-        # Remainder of the chunking logic stays the same...
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=target_chunk_words * 6, # Approximation
-            chunk_overlap=target_chunk_words * 0.1 * 6, # 10% overlap approx
-            length_function=len,
-            is_separator_regex=False,
-        )
-
-        initial_chunks = text_splitter.split_text(text_content)
-
-        # Post-processing: Merge small chunks
-        final_chunks = []
-        buffer_chunk = ""
-        for i, chunk in enumerate(initial_chunks):
-            current_chunk_text = buffer_chunk + chunk
-            current_word_count = estimate_word_count(current_chunk_text)
-
-            if current_word_count >= min_chunk_words or i == len(initial_chunks) - 1:
-                if current_chunk_text.strip():
-                    final_chunks.append(current_chunk_text)
-                buffer_chunk = "" # Reset buffer
-            else:
-                # Chunk is too small, add to buffer and continue to next chunk
-                buffer_chunk = current_chunk_text + " " # Add space between merged chunks
+        # Parse and chunk in the parsing process (BeautifulSoup + splitter are CPU-bound)
+        with ingestion_stage(job_context, "parsing", num_bytes=get_ingestion_file_size(job_context, temp_file_path)):
+            final_chunks = run_parsing_task(parse_html_chunks, temp_file_path, target_chunk_words, min_chunk_words)
 
         num_chunks_final = len(final_chunks)
         update_callback(number_of_pages=num_chunks_final) # Use number_of_pages for chunk count
 
-        for idx, chunk_content in enumerate(final_chunks, start=1):
-            update_callback(
-                current_file_chunk=idx,
-                status=f"Saving chunk {idx}/{num_chunks_final}..."
-            )
-            args = {
-                "page_text_content": chunk_content,
-                "page_number": idx,
-                "file_name": original_filename,
-                "user_id": user_id,
-                "document_id": document_id
-            }
+        args = {
+            "chunks": [
+                {"page_number": idx, "content": chunk_content}
+                for idx, chunk_content in enumerate(final_chunks, start=1)
+            ],
+            "file_name": original_filename,
+            "user_id": user_id,
+            "document_id": document_id,
+            "update_callback": update_callback,
+            "total": num_chunks_final
+        }
 
-            if is_group:
-                args["group_id"] = group_id
+        if is_group:
+            args["group_id"] = group_id
+
+        args["job_context"] = job_context
 
-            save_chunks(**args)
-            total_chunks_saved += 1
+        total_chunks_saved = save_chunks_batch(**args)
 
     except Exception as e:
         # Catch potential BeautifulSoup errors too
@@ -2072,7 +2412,7 @@ def process_html(document_id, user_id, temp_file_path, original_filename, enable
 
 
 # --- Helper function to process Markdown files ---
-def process_md(document_id, user_id, temp_file_path, original_filename, enable_enhanced_citations, update_callback, group_id=None):
+def process_md(document_id, user_id, temp_file_path, original_filename, enable_enhanced_citations, update_callback, group_id=None, job_context=None):
     """Processes Markdown files."""
     is_group = group_id is not None
 
@@ -2087,7 +2427,8 @@ def process_md(document_id, user_id, temp_file_path, original_filename, enable_e
             "user_id": user_id,
             "document_id": document_id,
             "blob_filename": original_filename,
-            "update_callback": update_callback
+            "update_callback": update_callback,
+            "job_context": job_context
         }
 
         if is_group:
@@ -2096,70 +2437,31 @@ def process_md(document_id, user_id, temp_file_path, original_filename, enable_e
         upload_to_blob(**args)
 
     try:
-        with open(temp_file_path, 'r', encoding='utf-8') as f:
-            md_content = f.read()
-
-        headers_to_split_on = [
-            ("#", "Header 1"),
-            ("##", "Header 2"),
-            ("###", "Header 3"),
-            ("####", "Header 4"),
-            ("#####", "Header 5"),
-        ]
-
-        # Use MarkdownHeaderTextSplitter first
-        md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on, return_each_line=False)
-        md_header_splits = md_splitter.split_text(md_content)
-
-        initial_chunks_content = [doc.page_content for doc in md_header_splits]
-
-        # TODO: Advanced Table/Code Block Handling:
-        # - Table header replication requires identifying markdown tables (`|---|`),
-        #   detecting splits, and injecting headers.
-        # - Code block wrapping requires detecting ``` blocks split across chunks and
-        #   adding start/end fences.
-        # This requires complex regex or stateful parsing during/after splitting.
-        # For now, we focus on the text splitting and minimum size merging.
-
-        # Post-processing: Merge small chunks based on word count
-        final_chunks = []
-        buffer_chunk = ""
-        for i, chunk_text in enumerate(initial_chunks_content):
-            current_chunk_text = buffer_chunk + chunk_text # Combine with buffer first
-            current_word_count = estimate_word_count(current_chunk_text)
-
-            # Merge if current chunk alone (without buffer) is too small, UNLESS it's the last one
-            # Or, more simply, accumulate until the buffer meets the minimum size
-            if current_word_count >= min_chunk_words or i == len(initial_chunks_content) - 1:
-                 # If the combined chunk meets min size OR it's the last chunk, save it
-                if current_chunk_text.strip():
-                     final_chunks.append(current_chunk_text)
-                buffer_chunk = "" # Reset buffer
-            else:
-                # Accumulate in buffer if below min size and not the last chunk
-                buffer_chunk = current_chunk_text + "\n\n" # Add separator when buffering
+        # Split on headers and merge small sections in the parsing process
+        with ingestion_stage(job_context, "parsing", num_bytes=get_ingestion_file_size(job_context, temp_file_path)):
+            final_chunks = run_parsing_task(parse_md_chunks, temp_file_path, target_chunk_words, min_chunk_words)
 
         num_chunks_final = len(final_chunks)
         update_callback(number_of_pages=num_chunks_final)
 
-        for idx, chunk_content in enumerate(final_chunks, start=1):
-            update_callback(
-                current_file_chunk=idx,
-                status=f"Saving chunk {idx}/{num_chunks_final}..."
-            )
-            args = {
-                "page_text_content": chunk_content,
-                "page_number": idx,
-                "file_name": original_filename,
-                "user_id": user_id,
-                "document_id": document_id
-            }
+        args = {
+            "chunks": [
+                {"page_number": idx, "content": chunk_content}
+                for idx, chunk_content in enumerate(final_chunks, start=1)
+            ],
+            "file_name": original_filename,
+            "user_id": user_id,
+            "document_id": document_id,
+            "update_callback": update_callback,
+            "total": num_chunks_final
+        }
 
-            if is_group:
-                args["group_id"] = group_id
+        if is_group:
+            args["group_id"] = group_id
+
+        args["job_context"] = job_context
 
-            save_chunks(**args)
-            total_chunks_saved += 1
+        total_chunks_saved = save_chunks_batch(**args)
 
     except Exception as e:
         raise Exception(f"Failed processing Markdown file {original_filename}: {e}")
@@ -2168,7 +2470,7 @@ def process_md(document_id, user_id, temp_file_path, original_filename, enable_e
 
 
 # --- Helper function to process JSON files ---
-def process_json(document_id, user_id, temp_file_path, original_filename, enable_enhanced_citations, update_callback, group_id=None):
+def process_json(document_id, user_id, temp_file_path, original_filename, enable_enhanced_citations, update_callback, group_id=None, job_context=None):
     """Processes JSON files using RecursiveJsonSplitter."""
     is_group = group_id is not None
 
@@ -2183,7 +2485,8 @@ def process_json(document_id, user_id, temp_file_path, original_filename, enable
             "user_id": user_id,
             "document_id": document_id,
             "blob_filename": original_filename,
-            "update_callback": update_callback
+            "update_callback": update_callback,
+            "job_context": job_context
         }
 
         if is_group:
@@ -2193,33 +2496,19 @@ def process_json(document_id, user_id, temp_file_path, original_filename, enable
 
 
     try:
-        # Load the JSON data first to ensure it's valid
+        # Load and split in the parsing process
         try:
-            with open(temp_file_path, 'r', encoding='utf-8') as f:
-                json_data = json.load(f)
-        except json.JSONDecodeError as e:
+            with ingestion_stage(job_context, "parsing", num_bytes=get_ingestion_file_size(job_context, temp_file_path)):
+                final_chunks_text = run_parsing_task(parse_json_chunks, temp_file_path, max_chunk_size_chars)
+        except ValueError as e:
              raise Exception(f"Invalid JSON structure in {original_filename}: {e}")
-        except Exception as e: # Catch other file reading errors
+        except OSError as e: # Catch file reading errors
              raise Exception(f"Error reading JSON file {original_filename}: {e}")
 
-        # Initialize the splitter - convert_lists does NOT go here
-        json_splitter = RecursiveJsonSplitter(max_chunk_size=max_chunk_size_chars)
-
-        # Perform the splitting using split_json
-        # --- CHANGE HERE: Add convert_lists=True to the splitting method call ---
-        # This tells the splitter to handle lists by converting them internally during splitting
-        final_json_chunks_structured = json_splitter.split_json(
-            json_data=json_data,
-            convert_lists=True # Use the feature here as per documentation
-        )
-
-        # Convert each structured chunk (which are dicts/lists) back into a JSON string for saving
-        # Using ensure_ascii=False is safer for preserving original characters if any non-ASCII exist
-        final_chunks_text = [json.dumps(chunk, ensure_ascii=False) for chunk in final_json_chunks_structured]
-
         initial_chunk_count = len(final_chunks_text)
         update_callback(number_of_pages=initial_chunk_count) # Initial estimate
 
+        chunks_to_save = []
         for idx, chunk_content in enumerate(final_chunks_text, start=1):
             # Skip potentially empty or trivial chunks (e.g., "{}" or "[]" or just "")
             # Stripping allows checking for empty strings potentially generated
@@ -2227,24 +2516,28 @@ def process_json(document_id, user_id, temp_file_path, original_filename, enable
                 print(f"Skipping empty or trivial JSON chunk {idx}/{initial_chunk_count}")
                 continue # Skip saving this chunk
 
-            update_callback(
-                current_file_chunk=idx, # Use original index for progress display
-                # Keep number_of_pages as initial estimate during saving loop
-                status=f"Saving chunk {idx}/{initial_chunk_count}..."
-            )
-            args = {
-                "page_text_content": chunk_content,
-                "page_number": total_chunks_saved + 1,
-                "file_name": original_filename,
-                "user_id": user_id,
-                "document_id": document_id
-            }
+            chunks_to_save.append({
+                "page_number": len(chunks_to_save) + 1,
+                "content": chunk_content,
+                "progress_index": idx # Use original index for progress display
+            })
 
-            if is_group:
-                args["group_id"] = group_id
+        # Keep number_of_pages as initial estimate during saving loop
+        args = {
+            "chunks": chunks_to_save,
+            "file_name": original_filename,
+            "user_id": user_id,
+            "document_id": document_id,
+            "update_callback": update_callback,
+            "total": initial_chunk_count
+        }
+
+        if is_group:
+            args["group_id"] = group_id
+
+        args["job_context"] = job_context
 
-            save_chunks(**args)
-            total_chunks_saved += 1 # Increment only when a chunk is actually saved
+        total_chunks_saved = save_chunks_batch(**args) # Counts only chunks actually saved
 
         # Final update with the actual number of chunks saved
         if total_chunks_saved != initial_chunk_count:
@@ -2265,86 +2558,50 @@ def process_json(document_id, user_id, temp_file_path, original_filename, enable
 
 
 # --- Helper function to process a single Tabular sheet (CSV or Excel tab) ---
-def process_single_tabular_sheet(df, document_id, user_id, file_name, update_callback, group_id=None):
-    """Chunks a pandas DataFrame from a CSV or Excel sheet."""
+def process_single_tabular_sheet(sheet_chunks, document_id, user_id, file_name, update_callback, group_id=None, job_context=None):
+    """
+    Saves the chunks of one CSV file or Excel sheet, as produced by
+    chunk_tabular_dataframe (800 character chunks, header prepended).
+    """
     is_group = group_id is not None
 
     total_chunks_saved = 0
-    target_chunk_size_chars = 800 # Requirement: "800 size chunk" (assuming characters)
 
-    if df.empty:
+    if not sheet_chunks:
         print(f"Skipping empty sheet/file: {file_name}")
         return 0
 
-    # Get header
-    header = df.columns.tolist()
-    header_string = ",".join(map(str, header)) + "\n" # CSV representation of header
-
-    # Prepare rows as strings (e.g., CSV format)
-    rows_as_strings = []
-    for _, row in df.iterrows():
-        # Convert row to string, handling potential NaNs and types
-        row_string = ",".join(map(lambda x: str(x) if pd.notna(x) else "", row.tolist())) + "\n"
-        rows_as_strings.append(row_string)
-
-    # Chunk rows based on character count
-    final_chunks_content = []
-    current_chunk_rows = []
-    current_chunk_char_count = 0
-
-    for row_str in rows_as_strings:
-        row_len = len(row_str)
-        # If adding the current row exceeds the limit AND the chunk already has content
-        if current_chunk_char_count + row_len > target_chunk_size_chars and current_chunk_rows:
-            # Finalize the current chunk
-            final_chunks_content.append("".join(current_chunk_rows))
-            # Start a new chunk with the current row
-            current_chunk_rows = [row_str]
-            current_chunk_char_count = row_len
-        else:
-            # Add row to the current chunk
-            current_chunk_rows.append(row_str)
-            current_chunk_char_count += row_len
-
-    # Add the last remaining chunk if it has content
-    if current_chunk_rows:
-        final_chunks_content.append("".join(current_chunk_rows))
-
-    num_chunks_final = len(final_chunks_content)
+    num_chunks_final = len(sheet_chunks)
     # Update total pages estimate once at the start of processing this sheet
     # Note: This might overwrite previous updates if called multiple times for excel sheets.
     # Consider accumulating page count in the caller if needed.
     update_callback(number_of_pages=num_chunks_final)
 
-    # Save chunks, prepending the header to each
-    for idx, chunk_rows_content in enumerate(final_chunks_content, start=1):
-        # Prepend header - header length does not count towards chunk size limit
-        chunk_with_header = header_string + chunk_rows_content
-
-        update_callback(
-            current_file_chunk=idx,
-            status=f"Saving chunk {idx}/{num_chunks_final} from {file_name}..."
-        )
+    args = {
+        "chunks": [
+            {"page_number": idx, "content": chunk_content}
+            for idx, chunk_content in enumerate(sheet_chunks, start=1)
+        ],
+        "file_name": file_name,
+        "user_id": user_id,
+        "document_id": document_id,
+        "update_callback": update_callback,
+        "status_template": f"Saving chunk {{index}}/{{total}} from {file_name}...",
+        "total": num_chunks_final
+    }
 
-        args = {
-            "page_text_content": chunk_with_header,
-            "page_number": idx,
-            "file_name": file_name,
-            "user_id": user_id,
-            "document_id": document_id
-        }
+    if is_group:
+        args["group_id"] = group_id
 
-        if is_group:
-            args["group_id"] = group_id
+    args["job_context"] = job_context
 
-        save_chunks(**args)
-        total_chunks_saved += 1
+    total_chunks_saved = save_chunks_batch(**args)
 
     return total_chunks_saved
 
 
 # --- Helper function to process Tabular files (CSV, XLSX, XLS) ---
-def process_tabular(document_id, user_id, temp_file_path, original_filename, file_ext, enable_enhanced_citations, update_callback, group_id=None):
+def process_tabular(document_id, user_id, temp_file_path, original_filename, file_ext, enable_enhanced_citations, update_callback, group_id=None, job_context=None):
     """Processes CSV, XLSX, or XLS files using pandas."""
     is_group = group_id is not None
 
@@ -2358,7 +2615,8 @@ def process_tabular(document_id, user_id, temp_file_path, original_filename, fil
             "user_id": user_id,
             "document_id": document_id,
             "blob_filename": original_filename,
-            "update_callback": update_callback
+            "update_callback": update_callback,
+            "job_context": job_context
         }
 
         if is_group:
@@ -2366,77 +2624,167 @@ def process_tabular(document_id, user_id, temp_file_path, original_filename, fil
 
         upload_to_blob(**args)
 
+    settings = job_context.settings if job_context is not None else get_settings()
+    streaming_threshold_bytes = float(settings.get('tabular_streaming_threshold_mb', 25) or 0) * 1024 * 1024
+
     try:
-        if file_ext == '.csv':
-            # Process CSV
-             # Read CSV, attempt to infer header, keep data as string initially
-            df = pd.read_csv(
-                temp_file_path, 
-                keep_default_na=False, 
-                dtype=str
+        if streaming_threshold_bytes and get_ingestion_file_size(job_context, temp_file_path) > streaming_threshold_bytes:
+            return process_tabular_streaming(
+                document_id=document_id,
+                user_id=user_id,
+                temp_file_path=temp_file_path,
+                original_filename=original_filename,
+                file_ext=file_ext,
+                update_callback=update_callback,
+                group_id=group_id,
+                job_context=job_context,
+                rows_per_block=int(settings.get('tabular_streaming_rows_per_block', 5000) or 5000)
             )
+
+        # Read and chunk every sheet in the parsing process (pandas is CPU-bound)
+        update_callback(status=f"Reading {original_filename}...")
+        with ingestion_stage(job_context, "parsing", num_bytes=get_ingestion_file_size(job_context, temp_file_path)):
+            sheets = run_parsing_task(parse_tabular_sheets, temp_file_path, file_ext, original_filename)
+
+        accumulated_total_chunks = 0
+        for effective_filename, sheet_chunks in sheets:
+            if len(sheets) > 1:
+                update_callback(status=f"Processing sheet '{effective_filename}'...")
+
             args = {
-                "df": df,
+                "sheet_chunks": sheet_chunks,
                 "document_id": document_id,
                 "user_id": user_id,
-                "file_name": original_filename,
+                "file_name": effective_filename,
                 "update_callback": update_callback
             }
 
             if is_group:
                 args["group_id"] = group_id
 
-            total_chunks_saved = process_single_tabular_sheet(**args)
+            args["job_context"] = job_context
 
-        elif file_ext in ('.xlsx', '.xls'):
-            # Process Excel (potentially multiple sheets)
-            excel_file = pd.ExcelFile(
-                temp_file_path, 
-                engine='openpyxl' if file_ext == '.xlsx' else 'xlrd'
-            )
-            sheet_names = excel_file.sheet_names
-            base_name, ext = os.path.splitext(original_filename)
+            accumulated_total_chunks += process_single_tabular_sheet(**args)
 
-            accumulated_total_chunks = 0
-            for sheet_name in sheet_names:
-                update_callback(status=f"Processing sheet '{sheet_name}'...")
-                # Read specific sheet, get values (not formulas), keep data as string
-                # Note: pandas typically reads values, not formulas by default.
-                df = excel_file.parse(sheet_name, keep_default_na=False, dtype=str)
+        total_chunks_saved = accumulated_total_chunks # Total across all sheets
 
-                # Create effective filename for this sheet
-                effective_filename = f"{base_name}-{sheet_name}{ext}" if len(sheet_names) > 1 else original_filename
+    except pd.errors.EmptyDataError:
+        print(f"Warning: Tabular file or sheet is empty: {original_filename}")
+        update_callback(status=f"Warning: File/sheet is empty - {original_filename}", number_of_pages=0)
+    except Exception as e:
+        raise Exception(f"Failed processing Tabular file {original_filename}: {e}")
 
-                args = {
-                    "df": df,
-                    "document_id": document_id,
-                    "user_id": user_id,
-                    "file_name": effective_filename,
-                    "update_callback": update_callback
-                }
+    return total_chunks_saved
 
-                if is_group:
-                    args["group_id"] = group_id
 
-                chunks_from_sheet = process_single_tabular_sheet(**args)
+# Chunks handed to save_chunks_batch at a time when streaming a tabular file
+TABULAR_STREAMING_SAVE_BATCH = 256
 
-                accumulated_total_chunks += chunks_from_sheet
+def process_tabular_streaming(document_id, user_id, temp_file_path, original_filename, file_ext, update_callback, group_id=None, job_context=None, rows_per_block=5000):
+    """
+    Streams a large CSV / Excel file: rows are read block by block
+    (iter_tabular_chunks) and the resulting chunks are embedded and indexed
+    as they arrive, so memory use does not grow with the file size.
+    Chunk numbering restarts for every sheet, as in process_single_tabular_sheet.
+    """
+    is_group = group_id is not None
 
-            total_chunks_saved = accumulated_total_chunks # Total across all sheets
+    update_callback(status=f"Streaming {original_filename}...")
+    index_writer = job_context.new_index_writer() if job_context is not None else get_search_index_writer(group_id)
 
+    total_chunks_saved = 0
+    current_file_name = None
+    page_number = 0
+    pending_chunks = []
 
-    except pd.errors.EmptyDataError:
-        print(f"Warning: Tabular file or sheet is empty: {original_filename}")
-        update_callback(status=f"Warning: File/sheet is empty - {original_filename}", number_of_pages=0)
-    except Exception as e:
-        raise Exception(f"Failed processing Tabular file {original_filename}: {e}")
+    def save_pending():
+        if not pending_chunks:
+            return 0
+        args = {
+            "chunks": list(pending_chunks),
+            "file_name": current_file_name,
+            "user_id": user_id,
+            "document_id": document_id,
+            "update_callback": update_callback,
+            "status_template": f"Saving chunk {{index}} from {current_file_name}...",
+            "index_writer": index_writer,
+            "job_context": job_context
+        }
 
+        if is_group:
+            args["group_id"] = group_id
+
+        pending_chunks.clear()
+        return save_chunks_batch(**args)
+
+    for effective_filename, chunk_content in iter_tabular_chunks(temp_file_path, file_ext, original_filename, rows_per_block=rows_per_block):
+        if effective_filename != current_file_name:
+            total_chunks_saved += save_pending()
+            current_file_name = effective_filename
+            page_number = 0
+            update_callback(status=f"Processing sheet '{effective_filename}'...")
+
+        page_number += 1
+        pending_chunks.append({"page_number": page_number, "content": chunk_content})
+
+        if len(pending_chunks) >= TABULAR_STREAMING_SAVE_BATCH:
+            total_chunks_saved += save_pending()
+
+    total_chunks_saved += save_pending()
+    index_writer.flush()
+
+    update_callback(number_of_pages=total_chunks_saved)
     return total_chunks_saved
 
 
+def extract_pdf_content_with_text_layer(pdf_path, min_chars=50, text_layer_pages=None, file_sha256=None):
+    """
+    Extracts a PDF page by page, taking the text layer locally with PyMuPDF
+    where a page has one and sending only the remaining (scanned or
+    image-only) pages to Azure Document Intelligence. Returns the same
+    [{"page_number", "content"}] list as extract_content_with_azure_di, with
+    page numbers relative to `pdf_path`. text_layer_pages already read by the
+    probe stage are used instead of reading the text layer again.
+    """
+    pages = text_layer_pages
+    if pages is None:
+        try:
+            pages = run_parsing_task(probe_pdf_text_layer, pdf_path, min_chars)
+        except Exception as e:
+            print(f"Warning: Could not read PDF text layer of {pdf_path}, using Document Intelligence: {e}")
+            return extract_content_with_azure_di(pdf_path, file_sha256=file_sha256)
+
+    scanned_page_numbers = [page["page_number"] for page in pages if not page["has_text_layer"]]
+    if not pages or len(scanned_page_numbers) == len(pages):
+        return extract_content_with_azure_di(pdf_path, file_sha256=file_sha256)
+
+    content_by_page = {page["page_number"]: page["content"] for page in pages}
+
+    if scanned_page_numbers:
+        base_name, ext = os.path.splitext(pdf_path)
+        scanned_pdf_path = f"{base_name}_scanned{ext}"
+        try:
+            run_parsing_task(write_pdf_pages, pdf_path, scanned_page_numbers, scanned_pdf_path)
+            di_pages = extract_content_with_azure_di(scanned_pdf_path)
+        finally:
+            if os.path.exists(scanned_pdf_path):
+                os.remove(scanned_pdf_path)
+
+        # DI numbers the pages of the subset 1..n; map them back to the original pages
+        for di_page in di_pages:
+            subset_index = di_page.get("page_number", 0) - 1
+            if 0 <= subset_index < len(scanned_page_numbers):
+                content_by_page[scanned_page_numbers[subset_index]] = di_page.get("content", "")
+
+    print(f"PDF {pdf_path}: {len(pages) - len(scanned_page_numbers)} page(s) from text layer, {len(scanned_page_numbers)} sent to Document Intelligence")
+    return [
+        {"page_number": page_number, "content": content_by_page[page_number]}
+        for page_number in sorted(content_by_page)
+    ]
+
 # --- Helper function for DI-supported types (PDF, DOCX, PPT, Image) ---
 # This function encapsulates the original logic for these file types
-def process_di_document(document_id, user_id, temp_file_path, original_filename, file_ext, enable_enhanced_citations, update_callback, group_id=None):
+def process_di_document(document_id, user_id, temp_file_path, original_filename, file_ext, enable_enhanced_citations, update_callback, group_id=None, job_context=None):
     """Processes documents supported by Azure Document Intelligence (PDF, Word, PPT, Image)."""
     is_group = group_id is not None
     
@@ -2450,14 +2798,19 @@ def process_di_document(document_id, user_id, temp_file_path, original_filename,
     is_ppt = file_ext in ('.pptx', '.ppt')
     is_image = file_ext in ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.heif')
 
+    # Page count, metadata and text layer come from the probe stage instead of reopening the file
+    file_probe = job_context.file_probe if job_context is not None else None
+    if file_probe is None:
+        file_probe = probe_ingestion_file(FileProbe(temp_file_path, original_filename), get_settings())
+
     try:
-        if is_pdf:
-            doc_title, doc_author, doc_subject, doc_keywords = extract_pdf_metadata(temp_file_path)
-            doc_authors_list = parse_authors(doc_author)
-            page_count = get_pdf_page_count(temp_file_path)
-        elif is_word:
-            doc_title, doc_author = extract_docx_metadata(temp_file_path)
+        if is_pdf or is_word:
+            doc_title = file_probe.metadata.get("title", "")
+            doc_author = file_probe.metadata.get("author", "")
+            doc_subject = file_probe.metadata.get("subject") or None
+            doc_keywords = file_probe.metadata.get("keywords") or None
             doc_authors_list = parse_authors(doc_author)
+            page_count = file_probe.page_count or 0
         # PPT and Image metadata extraction might be added here if needed/possible
 
         update_fields = {'status': "Extracted initial metadata"}
@@ -2476,7 +2829,8 @@ def process_di_document(document_id, user_id, temp_file_path, original_filename,
     settings = get_settings() # Assuming get_settings is accessible
     di_limit_bytes = 500 * 1024 * 1024
     di_page_limit = 2000
-    file_size = os.path.getsize(temp_file_path)
+    pdf_chunk_max_pages = di_page_limit // 4 if di_page_limit > 4 else 500
+    file_size = file_probe.size_bytes
 
     file_paths_to_process = [temp_file_path]
     needs_pdf_file_chunking = False
@@ -2495,11 +2849,11 @@ def process_di_document(document_id, user_id, temp_file_path, original_filename,
     if needs_pdf_file_chunking:
         try:
             update_callback(status="Chunking large PDF file...")
-            pdf_chunk_max_pages = di_page_limit // 4 if di_page_limit > 4 else 500
-            file_paths_to_process = chunk_pdf(temp_file_path, max_pages=pdf_chunk_max_pages)
+            with ingestion_stage(job_context, "parsing", num_bytes=get_ingestion_file_size(job_context, temp_file_path)):
+                file_paths_to_process = run_parsing_task(chunk_pdf, temp_file_path, max_pages=pdf_chunk_max_pages)
             if not file_paths_to_process:
                 raise Exception("PDF chunking failed to produce output files.")
-            if os.path.exists(temp_file_path): os.remove(temp_file_path) # Remove original large PDF
+            # The original is removed when the job ends, so an interrupted job can chunk it again
             print(f"Successfully chunked large PDF into {len(file_paths_to_process)} files.")
         except Exception as e:
             raise Exception(f"Failed to chunk PDF file: {str(e)}")
@@ -2507,130 +2861,200 @@ def process_di_document(document_id, user_id, temp_file_path, original_filename,
     num_file_chunks = len(file_paths_to_process)
     update_callback(num_file_chunks=num_file_chunks, status=f"Processing {original_filename} in {num_file_chunks} file chunk(s)")
 
-    total_final_chunks_processed = 0
-    for idx, chunk_path in enumerate(file_paths_to_process, start=1):
-        chunk_base_name, chunk_ext_loop = os.path.splitext(original_filename)
-        chunk_effective_filename = original_filename
-        if num_file_chunks > 1:
-            chunk_effective_filename = f"{chunk_base_name}_chunk_{idx}{chunk_ext_loop}"
-        print(f"Processing DI file chunk {idx}/{num_file_chunks}: {chunk_effective_filename}")
+    # Start content extraction for every file chunk up front, a few at a time;
+    # results are then consumed (and saved) in file chunk order below.
+    use_local_pdf_text = is_pdf and settings.get('enable_pdf_local_text_extraction', True)
+
+    checkpoint = job_context.checkpoint if job_context is not None else None
+
+    def extract_file_chunk(chunk_index, chunk_path):
+        # A resumed job reuses pages extracted before it was interrupted
+        step_key = f"extracted_pages:{chunk_index}/{num_file_chunks}"
+        if checkpoint is not None:
+            saved_pages = checkpoint.get_step_result(step_key)
+            if saved_pages is not None:
+                return saved_pages
+
+        start = time.monotonic()
+        # The probe already hashed the whole file, which is the DI cache key
+        chunk_sha256 = file_probe.sha256 if chunk_path == temp_file_path else None
+        if use_local_pdf_text:
+            if num_file_chunks > 1:
+                # chunk_pdf splits the file into runs of pdf_chunk_max_pages pages
+                first_page = (chunk_index - 1) * pdf_chunk_max_pages + 1
+                text_layer_pages = file_probe.get_text_layer_pages(first_page, first_page + pdf_chunk_max_pages - 1)
+            else:
+                text_layer_pages = file_probe.text_layer_pages
+            pages = extract_pdf_content_with_text_layer(
+                chunk_path,
+                min_chars=int(settings.get('pdf_text_layer_min_chars', 50) or 0),
+                text_layer_pages=text_layer_pages,
+                file_sha256=chunk_sha256
+            )
+        else:
+            pages = extract_content_with_azure_di(chunk_path, file_sha256=chunk_sha256)
+        if job_context is not None:
+            job_context.stage_timer.record(
+                "document_intelligence",
+                time.monotonic() - start,
+                num_bytes=get_ingestion_file_size(job_context, chunk_path),
+                num_items=len(pages)
+            )
+        if checkpoint is not None:
+            checkpoint.save_step_result(step_key, pages)
+        return pages
 
-        update_callback(status=f"Processing file chunk {idx}/{num_file_chunks}: {chunk_effective_filename}")
+    try:
+        di_concurrency = max(1, int(settings.get('document_intelligence_max_concurrency', 3) or 1))
+    except (TypeError, ValueError):
+        di_concurrency = 1
+    di_pool = ThreadPoolExecutor(max_workers=min(di_concurrency, num_file_chunks), thread_name_prefix="di")
+    extraction_futures = [
+        di_pool.submit(extract_file_chunk, chunk_index, chunk_path)
+        for chunk_index, chunk_path in enumerate(file_paths_to_process, start=1)
+    ]
+    if use_local_pdf_text:
+        update_callback(status=f"Extracting text from {num_file_chunks} file chunk(s)...")
+    else:
+        update_callback(status=f"Sending {num_file_chunks} file chunk(s) to Azure Document Intelligence...")
 
-        # Upload to Blob (if enhanced citations enabled for these types)
-        if use_enhanced_citations_di:
-            args = {
-                "temp_file_path": temp_file_path,
-                "user_id": user_id,
-                "document_id": document_id,
-                "blob_filename": chunk_effective_filename,
-                "update_callback": update_callback
-            }
+    total_final_chunks_processed = 0
+    try:
+        for idx, chunk_path in enumerate(file_paths_to_process, start=1):
+            chunk_base_name, chunk_ext_loop = os.path.splitext(original_filename)
+            chunk_effective_filename = original_filename
+            if num_file_chunks > 1:
+                chunk_effective_filename = f"{chunk_base_name}_chunk_{idx}{chunk_ext_loop}"
+            print(f"Processing DI file chunk {idx}/{num_file_chunks}: {chunk_effective_filename}")
 
-            if is_group:
-                args["group_id"] = group_id
+            update_callback(status=f"Processing file chunk {idx}/{num_file_chunks}: {chunk_effective_filename}")
 
-            upload_to_blob(**args)
+            # Upload to Blob (if enhanced citations enabled for these types)
+            if use_enhanced_citations_di:
+                args = {
+                    "temp_file_path": temp_file_path,
+                    "user_id": user_id,
+                    "document_id": document_id,
+                    "blob_filename": chunk_effective_filename,
+                    "update_callback": update_callback,
+                    "job_context": job_context
+                }
 
-        # Send chunk to Azure DI
-        update_callback(status=f"Sending {chunk_effective_filename} to Azure Document Intelligence...")
-        di_extracted_pages = []
-        try:
-            di_extracted_pages = extract_content_with_azure_di(chunk_path)
-            num_di_pages = len(di_extracted_pages)
-            conceptual_pages = num_di_pages if not is_image else 1 # Image is one conceptual item
-
-            if not di_extracted_pages and not is_image:
-                print(f"Warning: Azure DI returned no content pages for {chunk_effective_filename}.")
-                status_msg = f"Azure DI found no content in {chunk_effective_filename}."
-                # Update page count to 0 if nothing found, otherwise keep previous estimate or conceptual count
-                update_callback(number_of_pages=0 if idx == num_file_chunks else conceptual_pages, status=status_msg)
-            elif not di_extracted_pages and is_image:
-                print(f"Info: Azure DI processed image {chunk_effective_filename}, but extracted no text.")
-                update_callback(number_of_pages=conceptual_pages, status=f"Processed image {chunk_effective_filename} (no text found).")
-            else:
-                 update_callback(number_of_pages=conceptual_pages, status=f"Received {num_di_pages} content page(s)/slide(s) from Azure DI for {chunk_effective_filename}.")
+                if is_group:
+                    args["group_id"] = group_id
 
-        except Exception as e:
-            raise Exception(f"Error extracting content from {chunk_effective_filename} with Azure DI: {str(e)}")
+                upload_to_blob(**args)
 
-        # Content Chunking Strategy (Word needs specific handling)
-        final_chunks_to_save = []
-        if is_word:
-            update_callback(status=f"Chunking Word content from {chunk_effective_filename}...")
+            # Wait for this chunk's extraction (started above, possibly already done)
+            di_extracted_pages = []
             try:
-                final_chunks_to_save = chunk_word_file_into_pages(di_pages=di_extracted_pages)
-                num_final_chunks = len(final_chunks_to_save)
-                # Update number_of_pages again for Word to reflect final chunk count
-                update_callback(number_of_pages=num_final_chunks, status=f"Created {num_final_chunks} content chunks for {chunk_effective_filename}.")
+                di_extracted_pages = extraction_futures[idx - 1].result()
+                num_di_pages = len(di_extracted_pages)
+                conceptual_pages = num_di_pages if not is_image else 1 # Image is one conceptual item
+
+                if not di_extracted_pages and not is_image:
+                    print(f"Warning: Azure DI returned no content pages for {chunk_effective_filename}.")
+                    status_msg = f"Azure DI found no content in {chunk_effective_filename}."
+                    # Update page count to 0 if nothing found, otherwise keep previous estimate or conceptual count
+                    update_callback(number_of_pages=0 if idx == num_file_chunks else conceptual_pages, status=status_msg)
+                elif not di_extracted_pages and is_image:
+                    print(f"Info: Azure DI processed image {chunk_effective_filename}, but extracted no text.")
+                    update_callback(number_of_pages=conceptual_pages, status=f"Processed image {chunk_effective_filename} (no text found).")
+                else:
+                     update_callback(number_of_pages=conceptual_pages, status=f"Received {num_di_pages} content page(s)/slide(s) from Azure DI for {chunk_effective_filename}.")
+
             except Exception as e:
-                 raise Exception(f"Error chunking Word content for {chunk_effective_filename}: {str(e)}")
-        elif is_pdf or is_ppt:
-            final_chunks_to_save = di_extracted_pages # Use DI pages/slides directly
-        elif is_image:
-            if di_extracted_pages:
-                 if 'page_number' not in di_extracted_pages[0]: di_extracted_pages[0]['page_number'] = 1
-                 final_chunks_to_save = di_extracted_pages
-            else: final_chunks_to_save = [] # No text extracted
-
-        # Save Final Chunks to Search Index
-        num_final_chunks = len(final_chunks_to_save)
-        if not final_chunks_to_save:
-            print(f"Info: No final content chunks to save for {chunk_effective_filename}.")
-        else:
-            update_callback(status=f"Saving {num_final_chunks} content chunk(s) for {chunk_effective_filename}...")
-            args = {
-                "document_id": document_id,
-                "user_id": user_id
-            }
+                raise Exception(f"Error extracting content from {chunk_effective_filename} with Azure DI: {str(e)}")
+
+            # Content Chunking Strategy (Word needs specific handling)
+            final_chunks_to_save = []
+            if is_word:
+                update_callback(status=f"Chunking Word content from {chunk_effective_filename}...")
+                try:
+                    final_chunks_to_save = chunk_word_file_into_pages(di_pages=di_extracted_pages)
+                    num_final_chunks = len(final_chunks_to_save)
+                    # Update number_of_pages again for Word to reflect final chunk count
+                    update_callback(number_of_pages=num_final_chunks, status=f"Created {num_final_chunks} content chunks for {chunk_effective_filename}.")
+                except Exception as e:
+                     raise Exception(f"Error chunking Word content for {chunk_effective_filename}: {str(e)}")
+            elif is_pdf or is_ppt:
+                final_chunks_to_save = di_extracted_pages # Use DI pages/slides directly
+            elif is_image:
+                if di_extracted_pages:
+                     if 'page_number' not in di_extracted_pages[0]: di_extracted_pages[0]['page_number'] = 1
+                     final_chunks_to_save = di_extracted_pages
+                else: final_chunks_to_save = [] # No text extracted
+
+            # Save Final Chunks to Search Index
+            num_final_chunks = len(final_chunks_to_save)
+            if not final_chunks_to_save:
+                print(f"Info: No final content chunks to save for {chunk_effective_filename}.")
+            else:
+                update_callback(status=f"Saving {num_final_chunks} content chunk(s) for {chunk_effective_filename}...")
+                args = {
+                    "document_id": document_id,
+                    "user_id": user_id
+                }
 
-            if is_group:
-                args["group_id"] = group_id
+                if is_group:
+                    args["group_id"] = group_id
 
-            doc_metadata_temp = get_document_metadata(**args)
+                doc_metadata_temp = get_document_metadata(**args)
 
-            estimated_total_items = doc_metadata_temp.get('number_of_pages', num_final_chunks) if doc_metadata_temp else num_final_chunks
+                estimated_total_items = doc_metadata_temp.get('number_of_pages', num_final_chunks) if doc_metadata_temp else num_final_chunks
+
+                try:
+                    chunks_to_save = []
+                    for i, chunk_data in enumerate(final_chunks_to_save):
+                        chunk_index = chunk_data.get("page_number", i + 1) # Ensure page number exists
+                        chunk_content = chunk_data.get("content", "")
+
+                        if not chunk_content.strip():
+                            print(f"Skipping empty chunk index {chunk_index} for {chunk_effective_filename}.")
+                            continue
+
+                        chunks_to_save.append({"page_number": chunk_index, "content": chunk_content})
 
-            try:
-                for i, chunk_data in enumerate(final_chunks_to_save):
-                    chunk_index = chunk_data.get("page_number", i + 1) # Ensure page number exists
-                    chunk_content = chunk_data.get("content", "")
-
-                    if not chunk_content.strip():
-                        print(f"Skipping empty chunk index {chunk_index} for {chunk_effective_filename}.")
-                        continue
-
-                    update_callback(
-                        current_file_chunk=int(chunk_index),
-                        number_of_pages=estimated_total_items,
-                        status=f"Saving page/chunk {chunk_index}/{estimated_total_items} of {chunk_effective_filename}..."
-                    )
-                    
                     args = {
-                        "page_text_content": chunk_content,
-                        "page_number": chunk_index,
+                        "chunks": chunks_to_save,
                         "file_name": chunk_effective_filename,
                         "user_id": user_id,
-                        "document_id": document_id
+                        "document_id": document_id,
+                        "update_callback": update_callback,
+                        "status_template": f"Saving page/chunk {{index}}/{{total}} of {chunk_effective_filename}...",
+                        "total": estimated_total_items,
+                        "progress_fields": {"number_of_pages": estimated_total_items}
                     }
 
                     if is_group:
                         args["group_id"] = group_id
 
-                    save_chunks(**args)
+                    args["job_context"] = job_context
 
-                    total_final_chunks_processed += 1
-                print(f"Saved {num_final_chunks} content chunk(s) from {chunk_effective_filename}.")
-            except Exception as e:
-                raise Exception(f"Error saving extracted content chunk index {chunk_index} for {chunk_effective_filename}: {repr(e)}\nTraceback:\n{traceback.format_exc()}")
+                    total_final_chunks_processed += save_chunks_batch(**args)
+                    print(f"Saved {num_final_chunks} content chunk(s) from {chunk_effective_filename}.")
+                except Exception as e:
+                    raise Exception(f"Error saving extracted content chunks for {chunk_effective_filename}: {repr(e)}\nTraceback:\n{traceback.format_exc()}")
 
-        # Clean up local file chunk (if it's not the original temp file)
-        if chunk_path != temp_file_path and os.path.exists(chunk_path):
-            try:
-                os.remove(chunk_path)
-                print(f"Cleaned up temporary chunk file: {chunk_path}")
-            except Exception as cleanup_e:
-                print(f"Warning: Failed to clean up temp chunk file {chunk_path}: {cleanup_e}")
+            # Clean up local file chunk (if it's not the original temp file)
+            if chunk_path != temp_file_path and os.path.exists(chunk_path):
+                try:
+                    os.remove(chunk_path)
+                    print(f"Cleaned up temporary chunk file: {chunk_path}")
+                except Exception as cleanup_e:
+                    print(f"Warning: Failed to clean up temp chunk file {chunk_path}: {cleanup_e}")
+    finally:
+        # Wait for extractions already running so none of them writes files or
+        # checkpoint steps after this attempt has ended
+        di_pool.shutdown(wait=True, cancel_futures=True)
+
+        # Split files left behind when a chunk failed; a retry splits the original again
+        for chunk_path in file_paths_to_process:
+            if chunk_path != temp_file_path and os.path.exists(chunk_path):
+                try:
+                    os.remove(chunk_path)
+                except Exception as cleanup_e:
+                    print(f"Warning: Failed to clean up temp chunk file {chunk_path}: {cleanup_e}")
 
     # --- Final Metadata Extraction (Optional, moved outside loop) ---
     settings = get_settings() # Re-get in case it changed? Or pass it down.
@@ -2646,7 +3070,8 @@ def process_di_document(document_id, user_id, temp_file_path, original_filename,
             if is_group:
                 args["group_id"] = group_id
 
-            document_metadata = extract_document_metadata(**args)
+            with ingestion_stage(job_context, "metadata_extraction"):
+                document_metadata = extract_document_metadata(**args)
 
             update_fields = {k: v for k, v in document_metadata.items() if v is not None and v != ""}
             if update_fields:
@@ -2666,6 +3091,8 @@ def _get_content_type(path: str) -> str:
     ext = os.path.splitext(path)[1].lower()
     mapping = {
         '.wav': 'audio/wav',
+        '.flac': 'audio/flac',
+        '.ogg': 'audio/ogg',
         '.mp3': 'audio/mpeg',
         '.m4a': 'audio/mp4',
         '.mp4': 'audio/mp4'
@@ -2673,15 +3100,31 @@ def _get_content_type(path: str) -> str:
     return mapping.get(ext, 'application/octet-stream')
 
 
-def _split_audio_file(input_path: str, chunk_seconds: int = 540) -> List[str]:
+# Segment encodings for transcription: mono 16 kHz speech, compressed unless
+# "wav" is chosen (PCM WAV is ~115 MB per hour, Opus at 32 kbps ~14 MB)
+AUDIO_SEGMENT_FORMATS = {
+    "opus": {"extension": ".ogg", "options": {"acodec": "libopus", "audio_bitrate": "32k", "application": "voip"}},
+    "flac": {"extension": ".flac", "options": {"acodec": "flac"}},
+    "wav": {"extension": ".wav", "options": {"acodec": "pcm_s16le"}}
+}
+
+def _split_audio_file(input_path: str, chunk_seconds: int = 540, output_dir: str = None, audio_format: str = "opus") -> List[str]:
     """
-    Splits `input_path` into WAV segments of length `chunk_seconds` seconds,
-    writing files like input_chunk_000.wav.
-    Returns the list of generated WAV chunk file paths.
-    Each chunk is re-encoded to PCM WAV (16kHz) for compatibility.
+    Splits `input_path` into segments of length `chunk_seconds` seconds,
+    re-encoded as mono 16 kHz `audio_format` (opus, flac or wav), writing
+    files like input_chunk_000.ogg into `output_dir` (default: next to the
+    input). An unknown `audio_format` falls back to opus. Returns the list
+    of generated segment file paths.
     """
-    base, _ = os.path.splitext(input_path)
-    pattern = f"{base}_chunk_%03d.wav"
+    audio_format = str(audio_format or "").strip().lower()
+    if audio_format not in AUDIO_SEGMENT_FORMATS:
+        print(f"[Warning] Unknown audio segment format '{audio_format}', using opus")
+        audio_format = "opus"
+    segment_format = AUDIO_SEGMENT_FORMATS[audio_format]
+    extension = segment_format["extension"]
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    base = os.path.join(output_dir or os.path.dirname(input_path), base_name)
+    pattern = f"{base}_chunk_%03d{extension}"
 
     try:
         (
@@ -2689,36 +3132,100 @@ def _split_audio_file(input_path: str, chunk_seconds: int = 540) -> List[str]:
             .input(input_path)
             .output(
                 pattern,
-                acodec='pcm_s16le',
+                ac=1,
                 ar='16000',
                 f='segment',
                 segment_time=chunk_seconds,
                 reset_timestamps=1,
-                map='0'
+                map='0:a:0', # first audio stream only (skips cover art and extra tracks)
+                **segment_format["options"]
             )
             .run(quiet=True, overwrite_output=True)
         )
     except Exception as e:
-        print(f"[Error] FFmpeg segmentation to WAV failed for '{input_path}': {e}")
+        print(f"[Error] FFmpeg segmentation to {audio_format} failed for '{input_path}': {e}")
         raise RuntimeError(f"Segmentation failed: {e}")
 
-    chunks = sorted(glob.glob(f"{base}_chunk_*.wav"))
+    chunks = sorted(glob.glob(f"{glob.escape(base)}_chunk_*{extension}"))
     if not chunks:
-        print(f"[Error] No WAV chunks produced for '{input_path}'.")
+        print(f"[Error] No {audio_format} chunks produced for '{input_path}'.")
         raise RuntimeError(f"No chunks produced by ffmpeg for file '{input_path}'")
-    print(f"[Debug] Produced {len(chunks)} WAV chunks: {chunks}")
+    print(f"[Debug] Produced {len(chunks)} {audio_format} chunks: {chunks}")
     return chunks
 
 
+# Pooled HTTP session for the Speech fast-transcription endpoint, shared by
+# every transcription thread so connections are reused between segments
+_speech_session = None
+_speech_session_lock = threading.Lock()
+
+def _get_speech_session():
+    global _speech_session
+    with _speech_session_lock:
+        if _speech_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=SPEECH_HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _speech_session = session
+        return _speech_session
+
+def _transcribe_audio_chunk(url, key, locale, chunk_path, max_retries=3, initial_delay=2.0, delay_multiplier=2.0):
+    """
+    Sends one audio segment (Opus, FLAC or WAV, see _split_audio_file) to
+    the fast-transcription endpoint and returns its phrases. Throttling
+    (429), server errors and dropped connections are retried for this
+    segment only, waiting for Retry-After when given.
+    """
+    session = _get_speech_session()
+    retries = 0
+    current_delay = initial_delay
+
+    while True:
+        try:
+            with open(chunk_path, 'rb') as audio_f:
+                files = {
+                    'audio': (os.path.basename(chunk_path), audio_f, _get_content_type(chunk_path)),
+                    'definition': (None, json.dumps({'locales':[locale]}), 'application/json')
+                }
+                headers = {'Ocp-Apim-Subscription-Key': key}
+                resp = session.post(url, headers=headers, files=files, timeout=SPEECH_REQUEST_TIMEOUT_SECONDS)
+
+            if resp.status_code == 429 or resp.status_code >= 500:
+                resp.raise_for_status()
+            break
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError) as e:
+            retries += 1
+            if retries > max_retries:
+                print(f"[Error] Transcription of {chunk_path} failed after {max_retries} retries: {e}")
+                raise
+            wait_seconds = get_retry_after_seconds(e, default=current_delay * random.uniform(1.0, 1.5))
+            print(f"[Warning] Transcription of {chunk_path} failed ({e}); retry {retries}/{max_retries} in {wait_seconds:.1f}s")
+            time.sleep(wait_seconds)
+            current_delay *= delay_multiplier
+
+    try:
+        resp.raise_for_status()
+    except Exception as e:
+        print(f"[Error] HTTP error for {chunk_path}: {e}")
+        raise
+
+    result = resp.json()
+    phrases = result.get('combinedPhrases', [])
+    print(f"[Debug] Received {len(phrases)} phrases")
+    return [p.get('text','').strip() for p in phrases if p.get('text')]
+
+
 def process_audio_document(
     document_id: str,
     user_id: str,
     temp_file_path: str,
     original_filename: str,
     update_callback,
-    group_id=None
+    group_id=None,
+    job_context=None
 ) -> int:
-    """Transcribe an audio file via Azure Speech, splitting >10 min into WAV chunks."""
+    """Transcribe an audio file via Azure Speech, split into 9-minute compressed chunks."""
 
     settings = get_settings()
     if settings.get("enable_enhanced_citations", False):
@@ -2729,58 +3236,65 @@ def process_audio_document(
             document_id,
             original_filename,
             update_callback,
-            group_id
+            group_id,
+            job_context
         )
         update_callback(status=f"Enhanced citations: audio at {blob_path}")
 
 
     # 1) size guard
-    file_size = os.path.getsize(temp_file_path)
+    file_size = get_ingestion_file_size(job_context, temp_file_path)
     print(f"[Debug] File size: {file_size} bytes")
     if file_size > 300 * 1024 * 1024:
         raise ValueError("Audio exceeds 300 MB limit.")
 
-    # 2) split to WAV chunks
-    update_callback(status="Preparing audio for transcription…")
-    chunk_paths = _split_audio_file(temp_file_path, chunk_seconds=540)
-
-    # 3) transcribe each WAV chunk
-    settings = get_settings()
+    audio_format = settings.get("speech_audio_segment_format", "opus")
     endpoint = settings.get("speech_service_endpoint", "").rstrip('/')
     key = settings.get("speech_service_key", "")
     locale = settings.get("speech_service_locale", "en-US")
     url = f"{endpoint}/speechtotext/transcriptions:transcribe?api-version=2024-11-15"
+    try:
+        concurrency = max(1, int(settings.get("speech_transcription_max_concurrency", 4) or 1))
+    except (TypeError, ValueError):
+        concurrency = 1
 
+    checkpoint = job_context.checkpoint if job_context is not None else None
     all_phrases: List[str] = []
-    for idx, chunk_path in enumerate(chunk_paths, start=1):
-        update_callback(current_file_chunk=idx, status=f"Transcribing chunk {idx}/{len(chunk_paths)}…")
-        print(f"[Debug] Transcribing WAV chunk: {chunk_path}")
-
-        with open(chunk_path, 'rb') as audio_f:
-            files = {
-                'audio': (os.path.basename(chunk_path), audio_f, 'audio/wav'),
-                'definition': (None, json.dumps({'locales':[locale]}), 'application/json')
-            }
-            headers = {'Ocp-Apim-Subscription-Key': key}
-            resp = requests.post(url, headers=headers, files=files)
-        try:
-            resp.raise_for_status()
-        except Exception as e:
-            print(f"[Error] HTTP error for {chunk_path}: {e}")
-            raise
 
-        result = resp.json()
-        phrases = result.get('combinedPhrases', [])
-        print(f"[Debug] Received {len(phrases)} phrases")
-        all_phrases += [p.get('text','').strip() for p in phrases if p.get('text')]
-
-    # 4) cleanup WAV chunks
-    for p in chunk_paths:
+    # Segments live in their own temporary directory, removed however this block exits
+    with tempfile.TemporaryDirectory(prefix="audio_segments_") as segment_dir:
+        # 2) split into compressed mono segments
+        update_callback(status="Preparing audio for transcription…")
+        chunk_paths = _split_audio_file(temp_file_path, chunk_seconds=540, output_dir=segment_dir, audio_format=audio_format)
+        num_chunks = len(chunk_paths)
+
+        def transcribe_chunk(idx, chunk_path):
+            # A resumed job reuses segments transcribed before it was interrupted
+            step_key = f"transcript:{idx}/{num_chunks}"
+            saved_phrases = checkpoint.get_step_result(step_key) if checkpoint is not None else None
+            if saved_phrases is not None:
+                return saved_phrases
+
+            print(f"[Debug] Transcribing audio chunk: {chunk_path}")
+            with ingestion_stage(job_context, "transcription", num_bytes=os.path.getsize(chunk_path), num_items=1):
+                chunk_phrases = _transcribe_audio_chunk(url, key, locale, chunk_path)
+            if checkpoint is not None:
+                checkpoint.save_step_result(step_key, chunk_phrases)
+            return chunk_phrases
+
+        # 3) transcribe the chunks, a few at a time, and reassemble them in order
+        transcription_pool = ThreadPoolExecutor(max_workers=min(concurrency, num_chunks), thread_name_prefix="transcribe")
         try:
-            os.remove(p)
-            print(f"[Debug] Removed chunk: {p}")
-        except Exception as e:
-            print(f"[Warning] Could not remove chunk {p}: {e}")
+            transcription_futures = [
+                transcription_pool.submit(transcribe_chunk, idx, chunk_path)
+                for idx, chunk_path in enumerate(chunk_paths, start=1)
+            ]
+            for idx, future in enumerate(transcription_futures, start=1):
+                update_callback(current_file_chunk=idx, status=f"Transcribing chunk {idx}/{num_chunks}…")
+                all_phrases += future.result()
+        finally:
+            # 4) stop outstanding uploads before the segment directory is removed
+            transcription_pool.shutdown(wait=True, cancel_futures=True)
 
     # 5) stitch and save transcript chunks
     full_text = ' '.join(all_phrases).strip()
@@ -2789,17 +3303,20 @@ def process_audio_document(
     total_pages = max(1, math.ceil(len(words) / chunk_size))
     print(f"[Debug] Creating {total_pages} transcript pages")
 
-    for i in range(total_pages):
-        page_text = ' '.join(words[i*chunk_size:(i+1)*chunk_size])
-        update_callback(current_file_chunk=i+1, status=f"Saving transcript chunk {i+1}/{total_pages}…")
-        save_chunks(
-            page_text_content=page_text,
-            page_number=i+1,
-            file_name=original_filename,
-            user_id=user_id,
-            document_id=document_id,
-            group_id=group_id
-        )
+    save_chunks_batch(
+        chunks=[
+            {"page_number": i+1, "content": ' '.join(words[i*chunk_size:(i+1)*chunk_size])}
+            for i in range(total_pages)
+        ],
+        file_name=original_filename,
+        user_id=user_id,
+        document_id=document_id,
+        update_callback=update_callback,
+        group_id=group_id,
+        status_template="Saving transcript chunk {index}/{total}…",
+        total=total_pages,
+        job_context=job_context
+    )
 
     update_callback(number_of_pages=total_pages, status="Audio transcription complete", percentage_complete=100, current_file_chunk=None)
     print("[Info] Audio transcription complete")
@@ -2807,11 +3324,50 @@ def process_audio_document(
 
 
 
+def get_ingestion_file_size(job_context, file_path):
+    """Size of the staged upload from the probe, or from the file when there is no job context."""
+    if job_context is not None and job_context.file_probe is not None and job_context.file_probe.file_path == file_path:
+        return job_context.file_probe.size_bytes
+    return os.path.getsize(file_path)
+
+def probe_ingestion_file(file_probe, settings):
+    """
+    Probe stage: fills in a FileProbe with one read of the file (SHA-256 and
+    sniffed MIME type) and, for PDFs, one PyMuPDF open for page count,
+    metadata and text layer; Word files get their core properties. A file
+    that cannot be parsed here keeps empty document fields, and the handler
+    reports the error when it reads the file itself.
+    """
+    file_probe.read_file_bytes()
+
+    if file_probe.file_ext == '.pdf':
+        try:
+            pdf_facts = run_parsing_task(
+                probe_pdf_file,
+                file_probe.file_path,
+                min_chars=int(settings.get('pdf_text_layer_min_chars', 50) or 0),
+                # The full text layer is only needed when it replaces Document Intelligence
+                read_text_layer=settings.get('enable_pdf_local_text_extraction', True)
+            )
+            file_probe.page_count = pdf_facts["page_count"]
+            file_probe.metadata = pdf_facts["metadata"]
+            file_probe.has_text_layer = pdf_facts["has_text_layer"]
+            file_probe.text_layer_pages = pdf_facts["text_layer_pages"]
+        except Exception as e:
+            print(f"Warning: Could not probe PDF {file_probe.original_filename}: {e}")
+    elif file_probe.file_ext == '.docx':
+        doc_title, doc_author = extract_docx_metadata(file_probe.file_path)
+        file_probe.metadata = {"title": doc_title, "author": doc_author}
+
+    return file_probe
+
 def process_document_upload_background(document_id, user_id, temp_file_path, original_filename, group_id=None):
     """
     Main background task dispatcher for document processing.
     Handles various file types with specific chunking and processing logic.
     Integrates enhanced citations (blob upload) for all supported types.
+    On failure the document gets an error status and the exception is
+    re-raised for the ingestion worker.
     """
     is_group = group_id is not None
     settings = get_settings()
@@ -2823,8 +3379,16 @@ def process_document_upload_background(document_id, user_id, temp_file_path, ori
     audio_extensions = ('.mp3', '.wav', '.ogg', '.aac', '.flac', '.m4a')
 
     # --- Define update_document callback wrapper ---
-    # This makes it easier to pass the update function to helpers without repeating args
+    # This makes it easier to pass the update function to helpers without repeating args.
+    # Once the job context is loaded, updates go through the coalescing progress reporter.
+    progress_reporter = None
+    job_context = None
+
     def update_doc_callback(**kwargs):
+        if progress_reporter is not None:
+            progress_reporter.update(**kwargs)
+            return
+
         args = {
             "document_id": document_id,
             "user_id": user_id,
@@ -2839,6 +3403,8 @@ def process_document_upload_background(document_id, user_id, temp_file_path, ori
 
     total_chunks_saved = 0
     file_ext = '' # Initialize
+    file_size = 0
+    keep_temp_file = False
 
     try:
         # --- 0. Initial Setup & Validation ---
@@ -2852,12 +3418,32 @@ def process_document_upload_background(document_id, user_id, temp_file_path, ori
         if not allowed_file(original_filename): # Assuming allowed_file checks the extension
              raise ValueError(f"File type {file_ext} is not allowed.")
 
-        file_size = os.path.getsize(temp_file_path)
+        file_probe = FileProbe(temp_file_path, original_filename)
+        file_size = file_probe.size_bytes
         if file_size > max_file_size_bytes:
             raise ValueError(f"File exceeds maximum allowed size ({max_file_size_bytes / (1024*1024):.1f} MB).")
 
         update_doc_callback(status=f"Processing file {original_filename}, type: {file_ext}")
 
+        # Resolve version / owner scope / clients once for every chunk save
+        job_context = IngestionJobContext.load(
+            document_id=document_id,
+            user_id=user_id,
+            file_name=original_filename,
+            group_id=group_id,
+            settings=settings
+        )
+        progress_reporter = IngestionProgressReporter(job_context)
+
+        # Read the file once up front; handlers take its facts from the job context
+        with job_context.stage_timer.stage("probe", num_bytes=file_size):
+            job_context.file_probe = probe_ingestion_file(file_probe, settings)
+
+        if job_context.checkpoint is not None:
+            job_context.checkpoint.set_temp_file_path(temp_file_path)
+            if job_context.checkpoint.resumed:
+                update_doc_callback(status=f"Resuming {original_filename}: {job_context.checkpoint.indexed_chunk_count()} chunk(s) already indexed")
+
         # --- 1. Dispatch to appropriate handler based on file type ---
         di_supported_extensions = ('.pdf', '.docx', '.doc', '.pptx', '.ppt', '.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.heif')
         tabular_extensions = ('.csv', '.xlsx', '.xls')
@@ -2871,7 +3457,8 @@ def process_document_upload_background(document_id, user_id, temp_file_path, ori
             "original_filename": original_filename,
             "file_ext": file_ext if file_ext in tabular_extensions or file_ext in di_supported_extensions else None,
             "enable_enhanced_citations": enable_enhanced_citations,
-            "update_callback": update_doc_callback
+            "update_callback": update_doc_callback,
+            "job_context": job_context
         }
 
         if is_group:
@@ -2894,7 +3481,8 @@ def process_document_upload_background(document_id, user_id, temp_file_path, ori
                 temp_file_path=temp_file_path,
                 original_filename=original_filename,
                 update_callback=update_doc_callback,
-                group_id=group_id
+                group_id=group_id,
+                job_context=job_context
             )
         elif file_ext in audio_extensions:
             total_chunks_saved = process_audio_document(
@@ -2903,7 +3491,8 @@ def process_document_upload_background(document_id, user_id, temp_file_path, ori
                 temp_file_path=temp_file_path,
                 original_filename=original_filename,
                 update_callback=update_doc_callback,
-                group_id=group_id
+                group_id=group_id,
+                job_context=job_context
             )
         elif file_ext in di_supported_extensions:
             total_chunks_saved = process_di_document(**args)
@@ -2929,27 +3518,59 @@ def process_document_upload_background(document_id, user_id, temp_file_path, ori
              number_of_pages=total_chunks_saved, # Final count of SAVED chunks
              status=final_status,
              percentage_complete=100,
-             current_file_chunk=None # Clear current chunk tracking
+             current_file_chunk=None, # Clear current chunk tracking
+             embedding_model=job_context.embedding_model, # Lets the next version reuse these embeddings
+             ingestion_stats=job_context.stage_timer.to_dict(
+                 status="complete",
+                 file_ext=file_ext,
+                 file_size_bytes=file_size,
+                 mime_type=job_context.file_probe.mime_type,
+                 chunks_saved=total_chunks_saved
+             )
          )
 
+        if job_context.checkpoint is not None:
+            job_context.checkpoint.clear()
+
         print(f"Document {document_id} ({original_filename}) processed successfully with {total_chunks_saved} chunks saved.")
 
     except Exception as e:
         error_msg = f"Processing failed: {str(e)}"
         print(f"Error processing {document_id} ({original_filename}): {error_msg}")
+        # Keep the upload: the queue runs the job again (from its checkpoint) until it
+        # has used max_attempts, and the worker removes it once the job has failed
+        keep_temp_file = True
         # Attempt to update status to Error
         try:
+            error_fields = {}
+            if job_context is not None:
+                error_fields["ingestion_stats"] = job_context.stage_timer.to_dict(
+                    status="failed",
+                    file_ext=file_ext,
+                    file_size_bytes=file_size
+                )
             update_doc_callback(
                 status=f"Error: {error_msg[:250]}", # Limit error message length
-                percentage_complete=0 # Indicate failure
+                percentage_complete=0, # Indicate failure
+                **error_fields
             )
         except Exception as update_e:
             print(f"Critical Error: Failed to update document status to error for {document_id}: {update_e}")
 
+        # Let the ingestion worker record the failure so the job is retried or marked failed
+        raise
+
     finally:
         # --- 3. Cleanup ---
-        # Clean up the original temporary file path regardless of success or failure
-        if temp_file_path and os.path.exists(temp_file_path):
+        # Write any progress update still buffered by the reporter
+        if progress_reporter is not None:
+            try:
+                progress_reporter.flush()
+            except Exception as flush_e:
+                print(f"Warning: Failed to flush progress for {document_id}: {flush_e}")
+
+        # Clean up the original temporary file unless it is kept for a resume
+        if temp_file_path and os.path.exists(temp_file_path) and not keep_temp_file:
             try:
                 os.remove(temp_file_path)
                 print(f"Cleaned up original temporary file: {temp_file_path}")
@@ -0,0 +1,124 @@
+# functions_file_probe.py
+
+from config import *
+
+# The probe stage runs once per upload, before any handler, and records the
+# facts later stages need about the staged file: size, extension, MIME type
+# sniffed from the leading bytes, SHA-256 and, for PDFs and Word files, page
+# count, text-layer presence and embedded metadata. Handlers read them from
+# job_context.file_probe instead of stat-ing, hashing or opening the file
+# again.
+FILE_PROBE_SNIFF_BYTES = 64
+
+# (offset, signature, MIME type); checked in order
+FILE_SIGNATURES = (
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"BM", "image/bmp"),
+    (0, b"II*\x00", "image/tiff"),
+    (0, b"MM\x00*", "image/tiff"),
+    (4, b"ftypheic", "image/heif"),
+    (4, b"ftypheix", "image/heif"),
+    (4, b"ftypmif1", "image/heif"),
+    (4, b"ftypqt", "video/quicktime"),
+    (4, b"ftypM4A", "audio/mp4"),
+    (4, b"ftyp", "video/mp4"),
+    (0, b"\x1a\x45\xdf\xa3", "video/x-matroska"),
+    (0, b"FLV", "video/x-flv"),
+    (0, b"OggS", "audio/ogg"),
+    (0, b"fLaC", "audio/flac"),
+    (0, b"ID3", "audio/mpeg"),
+    (0, b"\xff\xfb", "audio/mpeg"),
+    (0, b"\xff\xf1", "audio/aac"),
+    (0, b"\xff\xf9", "audio/aac"),
+)
+
+# Zip and OLE2 containers are told apart by extension
+ZIP_CONTAINER_MIME_TYPES = {
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+OLE_CONTAINER_MIME_TYPES = {
+    ".doc": "application/msword",
+    ".ppt": "application/vnd.ms-powerpoint",
+    ".xls": "application/vnd.ms-excel",
+}
+
+def sniff_mime_type(header, file_ext=""):
+    """
+    MIME type from a file's leading bytes, or from its extension when the
+    bytes have no known signature (plain text, HTML, JSON, CSV, ...).
+    """
+    if header.startswith(b"PK\x03\x04"):
+        return ZIP_CONTAINER_MIME_TYPES.get(file_ext, "application/zip")
+    if header.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):
+        return OLE_CONTAINER_MIME_TYPES.get(file_ext, "application/x-ole-storage")
+    if header.startswith(b"RIFF") and len(header) >= 12:
+        return {b"WAVE": "audio/wav", b"AVI ": "video/x-msvideo"}.get(header[8:12], "application/octet-stream")
+
+    for offset, signature, mime_type in FILE_SIGNATURES:
+        if header[offset:offset + len(signature)] == signature:
+            return mime_type
+
+    guessed, _ = mimetypes.guess_type(f"file{file_ext}")
+    return guessed or "application/octet-stream"
+
+class FileProbe:
+    """
+    Facts about one staged upload. size_bytes is set on creation; MIME type
+    and SHA-256 are filled by read_file_bytes in a single read of the file;
+    document fields (page_count, has_text_layer, metadata, text_layer_pages)
+    are filled by probe_ingestion_file for the types that have them and stay
+    empty otherwise.
+    """
+
+    def __init__(self, file_path, original_filename):
+        self.file_path = file_path
+        self.original_filename = original_filename
+        self.file_ext = os.path.splitext(original_filename)[-1].lower()
+        self.size_bytes = os.path.getsize(file_path)
+        self.mime_type = None
+        self.sha256 = None
+        self.page_count = None
+        self.has_text_layer = None
+        self.metadata = {}
+        # Per-page {"page_number", "content", "has_text_layer"} from the PDF text layer, when read
+        self.text_layer_pages = None
+
+    def read_file_bytes(self, block_size=1024 * 1024):
+        """Hashes the file and sniffs its MIME type from the first block, in one pass."""
+        digest = hashlib.sha256()
+        header = b""
+        with open(self.file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                if not header:
+                    header = block[:FILE_PROBE_SNIFF_BYTES]
+                digest.update(block)
+        self.sha256 = digest.hexdigest()
+        self.mime_type = sniff_mime_type(header, self.file_ext)
+
+    def get_text_layer_pages(self, first_page, last_page):
+        """
+        Text-layer pages first_page..last_page (1-based, inclusive), renumbered
+        from 1 as in a PDF holding only those pages; None if not read.
+        """
+        if self.text_layer_pages is None:
+            return None
+        offset = first_page - 1
+        return [
+            {**page, "page_number": page["page_number"] - offset}
+            for page in self.text_layer_pages[offset:last_page]
+        ]
+
+    def to_dict(self):
+        """Probe facts without the page text, e.g. for ingestion_stats."""
+        return {
+            "file_ext": self.file_ext,
+            "size_bytes": self.size_bytes,
+            "mime_type": self.mime_type,
+            "sha256": self.sha256,
+            "page_count": self.page_count,
+            "has_text_layer": self.has_text_layer
+        }
@@ -0,0 +1,219 @@
+# functions_ingestion_checkpoints.py
+
+from config import *
+
+# Ingestion checkpoints let a job that was interrupted (worker restart, lease
+# expiry, transient error) continue where it stopped instead of starting
+# over. Each document has a small JSON file under INGESTION_CHECKPOINT_DIR with
+# the staged upload path, the keys of completed extraction steps and, per file
+# name, the chunk numbers that are already in the search index. The results of
+# the expensive steps (Document Intelligence pages per file chunk, transcripts
+# per audio segment) go into one file per step in a "<document>.steps"
+# directory next to it, so each index flush only rewrites the small file.
+# Both are removed when the job completes.
+
+class IngestionCheckpoint:
+    """
+    Checkpoint state for one document version. Safe to share between
+    threads; every change is written to disk straight away.
+    """
+
+    def __init__(self, document_id, version):
+        self.document_id = document_id
+        self.version = version
+        self.path = get_ingestion_checkpoint_path(document_id)
+        self.steps_dir = _get_checkpoint_steps_dir(self.path)
+        self._lock = threading.Lock()
+        self._state = self._load()
+        self.resumed = bool(self._state["steps"] or self._state["indexed"])
+
+    def _empty_state(self):
+        return {
+            "document_id": self.document_id,
+            "version": self.version,
+            "temp_file_path": None,
+            "steps": [],
+            "indexed": {}
+        }
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return self._empty_state()
+        except (OSError, ValueError) as e:
+            print(f"Warning: ignoring unreadable ingestion checkpoint {self.path}: {e}")
+            return self._empty_state()
+
+        # A checkpoint from another version of the document is of no use
+        if state.get("version") != self.version:
+            return self._empty_state()
+        # Checkpoints that kept step results inline are read without them
+        if not isinstance(state.get("steps"), list):
+            state["steps"] = []
+        state.setdefault("indexed", {})
+        return state
+
+    def _write_locked(self):
+        try:
+            os.makedirs(INGESTION_CHECKPOINT_DIR, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=INGESTION_CHECKPOINT_DIR, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._state, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Warning: could not write ingestion checkpoint {self.path}: {e}")
+
+    def set_temp_file_path(self, temp_file_path):
+        """Remembers the staged upload so it is removed together with the checkpoint."""
+        with self._lock:
+            if self._state.get("temp_file_path") != temp_file_path:
+                self._state["temp_file_path"] = temp_file_path
+                self._write_locked()
+
+    def _get_step_path(self, key):
+        return os.path.join(self.steps_dir, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.json")
+
+    def get_step_result(self, key):
+        """Result saved for an extraction step, or None if it has not completed."""
+        with self._lock:
+            if key not in self._state["steps"]:
+                return None
+        try:
+            with open(self._get_step_path(key), "r", encoding="utf-8") as f:
+                step = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: ignoring unreadable ingestion checkpoint step {key} of {self.document_id}: {e}")
+            return None
+        if step.get("key") != key or step.get("version") != self.version:
+            return None
+        return step.get("result")
+
+    def save_step_result(self, key, result):
+        """Writes the result to its own file, then records the key in the checkpoint."""
+        step_path = self._get_step_path(key)
+        try:
+            os.makedirs(self.steps_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.steps_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "version": self.version, "result": result}, f)
+            os.replace(temp_path, step_path)
+        except OSError as e:
+            print(f"Warning: could not write ingestion checkpoint step {step_path}: {e}")
+            return
+
+        with self._lock:
+            if key not in self._state["steps"]:
+                self._state["steps"].append(key)
+                self._write_locked()
+
+    def is_chunk_indexed(self, file_name, chunk_number):
+        with self._lock:
+            ranges = self._state["indexed"].get(file_name)
+            if not ranges:
+                return False
+            position = bisect.bisect_right([start for start, _ in ranges], chunk_number) - 1
+            return position >= 0 and ranges[position][1] >= chunk_number
+
+    def mark_chunks_indexed(self, file_name, chunk_numbers):
+        """Records chunk numbers of file_name as indexed; stored as merged [start, end] ranges."""
+        chunk_numbers = sorted({int(n) for n in chunk_numbers})
+        if not chunk_numbers:
+            return
+
+        with self._lock:
+            ranges = self._state["indexed"].get(file_name, []) + [[n, n] for n in chunk_numbers]
+            ranges.sort()
+            merged = [list(ranges[0])]
+            for start, end in ranges[1:]:
+                if start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self._state["indexed"][file_name] = merged
+            self._write_locked()
+
+    def indexed_chunk_count(self):
+        with self._lock:
+            return sum(
+                end - start + 1
+                for ranges in self._state["indexed"].values()
+                for start, end in ranges
+            )
+
+    def clear(self):
+        """Deletes the checkpoint once the job has completed."""
+        with self._lock:
+            self._state = self._empty_state()
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Warning: could not remove ingestion checkpoint {self.path}: {e}")
+            _remove_checkpoint_steps(self.steps_dir)
+
+def get_ingestion_checkpoint_path(document_id):
+    safe_document_id = re.sub(r'[^A-Za-z0-9_-]', '_', str(document_id))
+    return os.path.join(INGESTION_CHECKPOINT_DIR, f"{safe_document_id}.json")
+
+def _get_checkpoint_steps_dir(checkpoint_path):
+    return f"{os.path.splitext(checkpoint_path)[0]}.steps"
+
+def _remove_checkpoint_steps(steps_dir):
+    for step_path in glob.glob(os.path.join(steps_dir, "*")):
+        try:
+            os.remove(step_path)
+        except OSError as e:
+            print(f"Warning: could not remove {step_path}: {e}")
+    try:
+        os.rmdir(steps_dir)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Warning: could not remove {steps_dir}: {e}")
+
+def _remove_checkpoint_file(checkpoint_path):
+    """Removes a checkpoint file, its step results and the staged upload it kept for resuming."""
+    try:
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            temp_file_path = json.load(f).get("temp_file_path")
+    except (OSError, ValueError):
+        temp_file_path = None
+
+    for path in (temp_file_path, checkpoint_path):
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Warning: could not remove {path}: {e}")
+    _remove_checkpoint_steps(_get_checkpoint_steps_dir(checkpoint_path))
+
+def delete_ingestion_checkpoint(document_id):
+    """Drops any checkpoint (and kept upload) for a document that is being deleted."""
+    _remove_checkpoint_file(get_ingestion_checkpoint_path(document_id))
+
+def purge_stale_ingestion_checkpoints(max_age_hours=None):
+    """Removes checkpoints, and their kept uploads, not touched for max_age_hours."""
+    max_age_hours = max_age_hours if max_age_hours is not None else INGESTION_CHECKPOINT_MAX_AGE_HOURS
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for checkpoint_path in glob.glob(os.path.join(INGESTION_CHECKPOINT_DIR, "*.json")):
+        try:
+            if os.path.getmtime(checkpoint_path) >= cutoff:
+                continue
+        except OSError:
+            continue
+        _remove_checkpoint_file(checkpoint_path)
+        removed += 1
+
+    # Step results whose checkpoint file is gone (e.g. a crash between the two writes)
+    for steps_dir in glob.glob(os.path.join(INGESTION_CHECKPOINT_DIR, "*.steps")):
+        try:
+            if os.path.exists(f"{os.path.splitext(steps_dir)[0]}.json") or os.path.getmtime(steps_dir) >= cutoff:
+                continue
+        except OSError:
+            continue
+        _remove_checkpoint_steps(steps_dir)
+    return removed
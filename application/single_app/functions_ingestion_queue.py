@@ -0,0 +1,420 @@
+# functions_ingestion_queue.py
+
+from config import *
+from functions_settings import *
+from functions_documents import *
+
+# Durable queue for document ingestion, stored in a local SQLite file so that
+# jobs survive restarts and can be picked up by a separate worker process.
+# Job ids are document ids (metadata jobs use "<document_id>_metadata"); a job
+# that is already queued or running is never enqueued a second time.
+#
+# Job lifecycle: queued -> running -> completed | failed. A running job holds
+# a lease that its worker renews; if the worker dies, the lease expires and
+# the job is queued again (or failed once it has used all its attempts).
+# A re-run document upload continues from its ingestion checkpoint.
+
+INGESTION_JOB_QUEUED = "queued"
+INGESTION_JOB_RUNNING = "running"
+INGESTION_JOB_COMPLETED = "completed"
+INGESTION_JOB_FAILED = "failed"
+
+INGESTION_JOB_TYPE_DOCUMENT_UPLOAD = "document_upload"
+INGESTION_JOB_TYPE_METADATA_EXTRACTION = "metadata_extraction"
+
+INGESTION_POLL_INTERVAL_SECONDS = 2
+
+_ingestion_schema_ready = False
+_ingestion_schema_lock = threading.Lock()
+_ingestion_workers = []
+_ingestion_workers_lock = threading.Lock()
+
+def _get_ingestion_queue_connection():
+    # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE
+    connection = sqlite3.connect(INGESTION_QUEUE_DB_PATH, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    _ensure_ingestion_schema(connection)
+    return connection
+
+def _ensure_ingestion_schema(connection):
+    global _ingestion_schema_ready
+    if _ingestion_schema_ready:
+        return
+
+    with _ingestion_schema_lock:
+        if _ingestion_schema_ready:
+            return
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                job_id TEXT PRIMARY KEY,
+                job_type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                worker_id TEXT,
+                lease_expires_at REAL,
+                enqueued_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                last_error TEXT
+            )
+        """)
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status ON ingestion_jobs (status, enqueued_at)"
+        )
+        _ingestion_schema_ready = True
+
+def _ingestion_job_to_dict(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    return job
+
+def enqueue_ingestion_job(job_id, job_type, payload, max_attempts=None):
+    """
+    Adds a job to the queue. Returns True if it was queued, False if a job with
+    the same id is already queued or running. Completed or failed jobs with the
+    same id are reset and queued again.
+    """
+    current_time = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    max_attempts = max_attempts or INGESTION_JOB_MAX_ATTEMPTS
+
+    connection = _get_ingestion_queue_connection()
+    try:
+        cursor = connection.execute(
+            """
+            INSERT INTO ingestion_jobs (job_id, job_type, payload, status, attempts, max_attempts, enqueued_at)
+            VALUES (?, ?, ?, ?, 0, ?, ?)
+            ON CONFLICT(job_id) DO UPDATE SET
+                job_type = excluded.job_type,
+                payload = excluded.payload,
+                status = excluded.status,
+                attempts = 0,
+                max_attempts = excluded.max_attempts,
+                worker_id = NULL,
+                lease_expires_at = NULL,
+                enqueued_at = excluded.enqueued_at,
+                started_at = NULL,
+                finished_at = NULL,
+                last_error = NULL
+            WHERE ingestion_jobs.status IN (?, ?)
+            """,
+            (
+                job_id, job_type, json.dumps(payload), INGESTION_JOB_QUEUED, max_attempts, current_time,
+                INGESTION_JOB_COMPLETED, INGESTION_JOB_FAILED
+            )
+        )
+        return cursor.rowcount > 0
+    finally:
+        connection.close()
+
+def _recover_expired_ingestion_jobs(connection, now):
+    """Requeues running jobs whose worker stopped renewing its lease (must be inside a transaction)."""
+    connection.execute(
+        """
+        UPDATE ingestion_jobs
+        SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,
+            last_error = 'Worker lease expired',
+            worker_id = NULL,
+            lease_expires_at = NULL
+        WHERE status = ? AND lease_expires_at < ?
+        """,
+        (INGESTION_JOB_FAILED, INGESTION_JOB_QUEUED, INGESTION_JOB_RUNNING, now)
+    )
+
+def claim_next_ingestion_job(worker_id, lease_seconds=None):
+    """
+    Atomically takes the oldest queued job and marks it running for this
+    worker. BEGIN IMMEDIATE holds the SQLite write lock for the whole claim,
+    so a job can only be claimed by one worker. Returns the job or None.
+    """
+    lease_seconds = lease_seconds or INGESTION_JOB_LEASE_SECONDS
+    current_time = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    now = time.time()
+
+    connection = _get_ingestion_queue_connection()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            _recover_expired_ingestion_jobs(connection, now)
+
+            row = connection.execute(
+                "SELECT * FROM ingestion_jobs WHERE status = ? ORDER BY enqueued_at LIMIT 1",
+                (INGESTION_JOB_QUEUED,)
+            ).fetchone()
+
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+
+            connection.execute(
+                """
+                UPDATE ingestion_jobs
+                SET status = ?, attempts = attempts + 1, worker_id = ?, lease_expires_at = ?, started_at = ?
+                WHERE job_id = ?
+                """,
+                (INGESTION_JOB_RUNNING, worker_id, now + lease_seconds, current_time, row["job_id"])
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        job = _ingestion_job_to_dict(row)
+        job["status"] = INGESTION_JOB_RUNNING
+        job["attempts"] += 1
+        job["worker_id"] = worker_id
+        return job
+    finally:
+        connection.close()
+
+def renew_ingestion_job_lease(job_id, worker_id, lease_seconds=None):
+    """Extends the lease on a running job. Returns False if the job is no longer ours."""
+    lease_seconds = lease_seconds or INGESTION_JOB_LEASE_SECONDS
+
+    connection = _get_ingestion_queue_connection()
+    try:
+        cursor = connection.execute(
+            "UPDATE ingestion_jobs SET lease_expires_at = ? WHERE job_id = ? AND worker_id = ? AND status = ?",
+            (time.time() + lease_seconds, job_id, worker_id, INGESTION_JOB_RUNNING)
+        )
+        return cursor.rowcount > 0
+    finally:
+        connection.close()
+
+def finish_ingestion_job(job_id, worker_id, error=None):
+    """
+    Marks a running job completed, or records the error. A failed job goes
+    back to the queue until it has used max_attempts. Returns the job's new
+    status.
+    """
+    current_time = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    connection = _get_ingestion_queue_connection()
+    try:
+        if error is None:
+            connection.execute(
+                """
+                UPDATE ingestion_jobs
+                SET status = ?, finished_at = ?, lease_expires_at = NULL, last_error = NULL
+                WHERE job_id = ? AND worker_id = ?
+                """,
+                (INGESTION_JOB_COMPLETED, current_time, job_id, worker_id)
+            )
+        else:
+            connection.execute(
+                """
+                UPDATE ingestion_jobs
+                SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END,
+                    finished_at = CASE WHEN attempts >= max_attempts THEN ? ELSE NULL END,
+                    worker_id = NULL,
+                    lease_expires_at = NULL,
+                    last_error = ?
+                WHERE job_id = ? AND worker_id = ?
+                """,
+                (INGESTION_JOB_FAILED, INGESTION_JOB_QUEUED, current_time, str(error)[:1000], job_id, worker_id)
+            )
+
+        row = connection.execute("SELECT status FROM ingestion_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row["status"] if row else None
+    finally:
+        connection.close()
+
+def get_ingestion_job(job_id):
+    connection = _get_ingestion_queue_connection()
+    try:
+        row = connection.execute("SELECT * FROM ingestion_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return _ingestion_job_to_dict(row)
+    finally:
+        connection.close()
+
+def get_ingestion_queue_depth():
+    """Returns job counts per status plus the age of the oldest queued job."""
+    connection = _get_ingestion_queue_connection()
+    try:
+        counts = {
+            INGESTION_JOB_QUEUED: 0,
+            INGESTION_JOB_RUNNING: 0,
+            INGESTION_JOB_COMPLETED: 0,
+            INGESTION_JOB_FAILED: 0
+        }
+        for row in connection.execute("SELECT status, COUNT(*) AS total FROM ingestion_jobs GROUP BY status"):
+            counts[row["status"]] = row["total"]
+
+        oldest = connection.execute(
+            "SELECT MIN(enqueued_at) AS oldest FROM ingestion_jobs WHERE status = ?",
+            (INGESTION_JOB_QUEUED,)
+        ).fetchone()
+
+        return {
+            "counts": counts,
+            "oldest_queued_at": oldest["oldest"] if oldest else None
+        }
+    finally:
+        connection.close()
+
+def enqueue_document_upload_job(document_id, user_id, temp_file_path, original_filename, group_id=None):
+    payload = {
+        "document_id": document_id,
+        "user_id": user_id,
+        "temp_file_path": temp_file_path,
+        "original_filename": original_filename
+    }
+
+    if group_id is not None:
+        payload["group_id"] = group_id
+
+    return enqueue_ingestion_job(document_id, INGESTION_JOB_TYPE_DOCUMENT_UPLOAD, payload)
+
+def enqueue_metadata_extraction_job(document_id, user_id, group_id=None):
+    payload = {
+        "document_id": document_id,
+        "user_id": user_id
+    }
+
+    if group_id is not None:
+        payload["group_id"] = group_id
+
+    return enqueue_ingestion_job(f"{document_id}_metadata", INGESTION_JOB_TYPE_METADATA_EXTRACTION, payload)
+
+def resume_document_upload_job(job):
+    """
+    Queues a finished document upload job again so it continues from its
+    checkpoint. Returns an error message if it cannot be resumed, else None.
+    """
+    if job["job_type"] != INGESTION_JOB_TYPE_DOCUMENT_UPLOAD:
+        return "Only document upload jobs can be resumed."
+    if job["status"] in (INGESTION_JOB_QUEUED, INGESTION_JOB_RUNNING):
+        return "The job is already queued or running."
+
+    payload = job["payload"]
+    if not payload.get("temp_file_path") or not os.path.exists(payload["temp_file_path"]):
+        return "The uploaded file is no longer available; please upload it again."
+
+    enqueue_ingestion_job(job["job_id"], job["job_type"], payload)
+    return None
+
+def run_ingestion_job(job):
+    payload = job["payload"]
+
+    if job["job_type"] == INGESTION_JOB_TYPE_DOCUMENT_UPLOAD:
+        process_document_upload_background(**payload)
+    elif job["job_type"] == INGESTION_JOB_TYPE_METADATA_EXTRACTION:
+        process_metadata_extraction_background(**payload)
+    else:
+        raise ValueError(f"Unknown ingestion job type: {job['job_type']}")
+
+def _discard_failed_upload(job):
+    """
+    Removes the staged upload of a document upload job that has used all its
+    attempts, unless an ingestion checkpoint still references it for a manual
+    resume (purge_stale_ingestion_checkpoints removes it later).
+    """
+    payload = job["payload"]
+    temp_file_path = payload.get("temp_file_path")
+    if not temp_file_path or not os.path.exists(temp_file_path):
+        return
+    if os.path.exists(get_ingestion_checkpoint_path(payload["document_id"])):
+        return
+    try:
+        os.remove(temp_file_path)
+    except OSError as e:
+        print(f"[Ingestion] Failed to remove upload of failed job {job['job_id']}: {e}")
+
+def process_claimed_ingestion_job(job, worker_id, lease_seconds=None):
+    """
+    Runs a job claimed by this worker while renewing its lease, then records
+    the result: completed, or queued again / failed when the job raised.
+    Returns the job's new status.
+    """
+    lease_seconds = lease_seconds or INGESTION_JOB_LEASE_SECONDS
+
+    print(f"[Ingestion] {worker_id} started {job['job_type']} job {job['job_id']} (attempt {job['attempts']})")
+
+    # Keep the lease alive while the job runs
+    job_done = threading.Event()
+
+    def renew_lease():
+        while not job_done.wait(lease_seconds / 3):
+            try:
+                renew_ingestion_job_lease(job["job_id"], worker_id, lease_seconds)
+            except Exception as e:
+                print(f"[Ingestion] Failed to renew lease for job {job['job_id']}: {e}")
+
+    lease_thread = threading.Thread(target=renew_lease, daemon=True)
+    lease_thread.start()
+
+    error = None
+    try:
+        run_ingestion_job(job)
+    except Exception as e:
+        error = e
+        print(f"[Ingestion] Job {job['job_id']} failed: {repr(e)}\nTraceback:\n{traceback.format_exc()}")
+    finally:
+        job_done.set()
+        lease_thread.join()
+
+    try:
+        status = finish_ingestion_job(job["job_id"], worker_id, error)
+    except Exception as e:
+        print(f"[Ingestion] Failed to record result of job {job['job_id']}: {e}")
+        return None
+
+    if status == INGESTION_JOB_FAILED and job["job_type"] == INGESTION_JOB_TYPE_DOCUMENT_UPLOAD:
+        _discard_failed_upload(job)
+    return status
+
+def _ingestion_worker_loop(worker_id, stop_event):
+    lease_seconds = INGESTION_JOB_LEASE_SECONDS
+
+    while not stop_event.is_set():
+        try:
+            job = claim_next_ingestion_job(worker_id, lease_seconds)
+        except Exception as e:
+            print(f"[Ingestion] {worker_id} failed to claim a job: {e}")
+            stop_event.wait(INGESTION_POLL_INTERVAL_SECONDS)
+            continue
+
+        if job is None:
+            stop_event.wait(INGESTION_POLL_INTERVAL_SECONDS)
+            continue
+
+        process_claimed_ingestion_job(job, worker_id, lease_seconds)
+
+def start_ingestion_workers(worker_count=None):
+    """
+    Starts ingestion worker threads in this process (once). Returns the stop
+    event shared by the workers.
+    """
+    worker_count = worker_count if worker_count is not None else INGESTION_WORKER_COUNT
+
+    with _ingestion_workers_lock:
+        if _ingestion_workers:
+            return _ingestion_workers[0][1]
+
+        stop_event = threading.Event()
+        process_tag = f"{socket.gethostname()}-{os.getpid()}"
+        for i in range(worker_count):
+            worker_id = f"{process_tag}-{i + 1}-{uuid.uuid4().hex[:8]}"
+            worker = threading.Thread(
+                target=_ingestion_worker_loop,
+                args=(worker_id, stop_event),
+                name=f"ingestion-worker-{i + 1}",
+                daemon=True
+            )
+            worker.start()
+            _ingestion_workers.append((worker, stop_event))
+
+        print(f"[Ingestion] Started {worker_count} worker(s) in process {process_tag}, queue at {INGESTION_QUEUE_DB_PATH}")
+
+        try:
+            removed = purge_stale_ingestion_checkpoints()
+            if removed:
+                print(f"[Ingestion] Removed {removed} stale ingestion checkpoint(s)")
+        except Exception as e:
+            print(f"[Ingestion] Failed to purge stale ingestion checkpoints: {e}")
+
+        return stop_event
@@ -0,0 +1,155 @@
+# functions_ingestion_stats.py
+
+from config import *
+
+# Per-stage ingestion metrics. Each job accumulates, per stage (blob_upload,
+# parsing, document_intelligence, embedding, indexing, metadata_extraction,
+# ...), the seconds spent, number of calls, bytes, items and retries, and the
+# totals are saved on the document as `ingestion_stats` when the job ends.
+INGESTION_STAGE_FIELDS = ("seconds", "calls", "bytes", "items", "retries")
+INGESTION_STATS_PERCENTILES = (50, 90, 99)
+
+class IngestionStageTimer:
+    """
+    Accumulates stage metrics for one ingestion job. Stages that run on
+    several threads at once (DI file chunks, embedding batches) add up their
+    busy time, so a stage can report more seconds than the job's elapsed
+    time. Safe to share between threads.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds=0.0, num_bytes=0, num_items=0, retries=0, calls=1):
+        with self._lock:
+            totals = self.stages.setdefault(stage, dict.fromkeys(INGESTION_STAGE_FIELDS, 0))
+            totals["seconds"] += seconds
+            totals["calls"] += calls
+            totals["bytes"] += num_bytes
+            totals["items"] += num_items
+            totals["retries"] += retries
+
+    @contextmanager
+    def stage(self, name, num_bytes=0, num_items=0):
+        """Times the enclosed block and adds it to `name`, even if it raises."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - start, num_bytes=num_bytes, num_items=num_items)
+
+    def to_dict(self, **extra):
+        """Stats as stored on the document; `extra` adds job-level fields (file_ext, status, ...)."""
+        with self._lock:
+            stages = {
+                name: {**totals, "seconds": round(totals["seconds"], 3)}
+                for name, totals in self.stages.items()
+            }
+        return {
+            "total_seconds": round(time.monotonic() - self.started_at, 3),
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "stages": stages,
+            **extra
+        }
+
+def ingestion_stage(job_context, name, num_bytes=0, num_items=0):
+    """job_context.stage_timer.stage(...), or a no-op when there is no job context."""
+    if job_context is None:
+        return nullcontext()
+    return job_context.stage_timer.stage(name, num_bytes=num_bytes, num_items=num_items)
+
+def add_stage_to_ingestion_stats(ingestion_stats, stage, seconds, num_bytes=0, num_items=0, retries=0):
+    """
+    Returns a copy of a stored ingestion_stats dict with one more stage run
+    added, for stages that run outside the upload job (background metadata
+    extraction).
+    """
+    stats = copy.deepcopy(ingestion_stats) if ingestion_stats else {"stages": {}}
+    totals = stats.setdefault("stages", {}).setdefault(stage, dict.fromkeys(INGESTION_STAGE_FIELDS, 0))
+    totals["seconds"] = round(totals.get("seconds", 0) + seconds, 3)
+    totals["calls"] = totals.get("calls", 0) + 1
+    totals["bytes"] = totals.get("bytes", 0) + num_bytes
+    totals["items"] = totals.get("items", 0) + num_items
+    totals["retries"] = totals.get("retries", 0) + retries
+    return stats
+
+def _percentile(sorted_values, percentile):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(percentile / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def _summarize_values(values):
+    values = sorted(values)
+    summary = {"count": len(values)}
+    for percentile in INGESTION_STATS_PERCENTILES:
+        value = _percentile(values, percentile)
+        summary[f"p{percentile}"] = round(value, 3) if value is not None else None
+    return summary
+
+def summarize_ingestion_stats(stats_items):
+    """
+    Aggregates stored ingestion_stats dicts into percentiles of job duration
+    and, per stage, of seconds, bytes/second and items/second.
+    """
+    total_seconds = []
+    stage_values = {}
+
+    for stats in stats_items:
+        if not stats:
+            continue
+        if stats.get("total_seconds") is not None:
+            total_seconds.append(stats["total_seconds"])
+
+        for name, totals in (stats.get("stages") or {}).items():
+            values = stage_values.setdefault(name, {"seconds": [], "bytes_per_second": [], "items_per_second": [], "retries": []})
+            seconds = totals.get("seconds", 0) or 0
+            values["seconds"].append(seconds)
+            values["retries"].append(totals.get("retries", 0) or 0)
+            if seconds > 0:
+                if totals.get("bytes"):
+                    values["bytes_per_second"].append(totals["bytes"] / seconds)
+                if totals.get("items"):
+                    values["items_per_second"].append(totals["items"] / seconds)
+
+    return {
+        "documents": len(total_seconds),
+        "total_seconds": _summarize_values(total_seconds),
+        "stages": {
+            name: {metric: _summarize_values(metric_values) for metric, metric_values in values.items()}
+            for name, values in sorted(stage_values.items())
+        }
+    }
+
+def get_recent_ingestion_stats(since, file_ext=None, max_items=5000):
+    """
+    Reads ingestion_stats recorded since `since` (ISO timestamp) from the
+    personal and group document containers, optionally for one file type.
+    """
+    query = """
+        SELECT TOP @max_items VALUE c.ingestion_stats
+        FROM c
+        WHERE IS_DEFINED(c.ingestion_stats)
+            AND c.ingestion_stats.recorded_at >= @since
+    """
+    parameters = [
+        {"name": "@max_items", "value": max_items},
+        {"name": "@since", "value": since}
+    ]
+    if file_ext:
+        query += " AND c.ingestion_stats.file_ext = @file_ext"
+        parameters.append({"name": "@file_ext", "value": file_ext})
+
+    stats_items = []
+    for container in (cosmos_user_documents_container, cosmos_group_documents_container):
+        stats_items.extend(
+            container.query_items(
+                query=query,
+                parameters=parameters,
+                enable_cross_partition_query=True
+            )
+        )
+    return stats_items
@@ -3,21 +3,162 @@
 from config import *
 from functions_settings import *
 
-def add_file_task_to_file_processing_log(document_id, user_id, content):
-    settings = get_settings()
-    enable_file_processing_log = settings.get('enable_file_processing_log', True)
+# File processing log entries are queued in memory and written to the
+# file_processing container by a background thread, grouped per document into
+# transactional batches, so logging does not add a Cosmos round trip (and its
+# RU) to every ingestion step. Entries below file_processing_log_level are
+# dropped, debug/info entries can be sampled, and long payloads are truncated.
+FILE_PROCESSING_LOG_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+FILE_PROCESSING_LOG_QUEUE_SIZE = 10000
+FILE_PROCESSING_LOG_BATCH_SIZE = 100 # Cosmos transactional batch limit
+FILE_PROCESSING_LOG_FLUSH_SECONDS = 1.0
+FILE_PROCESSING_LOG_MAX_ITEMS_PER_WRITE = 1000
 
-    if enable_file_processing_log:
+_file_processing_log_queue = queue.Queue(maxsize=FILE_PROCESSING_LOG_QUEUE_SIZE)
+_file_processing_log_writer = {"thread": None, "dropped": 0}
+_file_processing_log_writer_lock = threading.Lock()
+_file_processing_log_config = {"config": None, "loaded_at": 0.0}
+
+def _get_file_processing_log_config():
+    """Logging settings, re-read at most every SETTINGS_CACHE_TTL_SECONDS."""
+    now = time.monotonic()
+    config = _file_processing_log_config["config"]
+    if config is not None and now - _file_processing_log_config["loaded_at"] < SETTINGS_CACHE_TTL_SECONDS:
+        return config
+
+    settings = get_settings() or {}
+    # 'enable_file_processing_log' was the key read here before the admin page saved 'enable_file_processing_logs'
+    enabled = settings.get('enable_file_processing_logs', settings.get('enable_file_processing_log', True))
+    level = str(settings.get('file_processing_log_level', 'info') or 'info').lower()
+    try:
+        sample_rate = min(1.0, max(0.0, float(settings.get('file_processing_log_sample_rate', 1.0))))
+    except (TypeError, ValueError):
+        sample_rate = 1.0
+    try:
+        max_chars = int(settings.get('file_processing_log_max_chars', 2000) or 0)
+    except (TypeError, ValueError):
+        max_chars = 2000
+
+    config = {
+        "enabled": bool(enabled),
+        "min_level": FILE_PROCESSING_LOG_LEVELS.get(level, FILE_PROCESSING_LOG_LEVELS["info"]),
+        "sample_rate": sample_rate,
+        "max_chars": max_chars
+    }
+    _file_processing_log_config["config"] = config
+    _file_processing_log_config["loaded_at"] = now
+    return config
+
+def add_file_task_to_file_processing_log(document_id, user_id, content, level="info"):
+    """
+    Queues a file processing log entry. `level` is one of debug / info /
+    warning / error; warnings and errors are never sampled out. Returns
+    without waiting for the write.
+    """
+    config = _get_file_processing_log_config()
+    if not config["enabled"]:
+        return
+
+    level_value = FILE_PROCESSING_LOG_LEVELS.get(level, FILE_PROCESSING_LOG_LEVELS["info"])
+    if level_value < config["min_level"]:
+        return
+    if level_value < FILE_PROCESSING_LOG_LEVELS["warning"] and config["sample_rate"] < 1.0:
+        if random.random() >= config["sample_rate"]:
+            return
+
+    content = str(content)
+    max_chars = config["max_chars"]
+    if max_chars > 0 and len(content) > max_chars:
+        content = f"{content[:max_chars]}... [truncated {len(content) - max_chars} characters]"
+
+    log_item = {
+        "id": str(uuid.uuid4()),
+        "document_id": document_id,
+        "user_id": user_id,
+        "level": level,
+        "log": content,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+    _ensure_file_processing_log_writer()
+    try:
+        _file_processing_log_queue.put_nowait(log_item)
+    except queue.Full:
+        # Never block the caller on logging
+        _file_processing_log_writer["dropped"] += 1
+
+def _ensure_file_processing_log_writer():
+    thread = _file_processing_log_writer["thread"]
+    if thread is not None and thread.is_alive():
+        return
+
+    with _file_processing_log_writer_lock:
+        thread = _file_processing_log_writer["thread"]
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(target=_file_processing_log_writer_loop, name="file-processing-log", daemon=True)
+        _file_processing_log_writer["thread"] = thread
+        thread.start()
+
+def _file_processing_log_writer_loop():
+    while True:
+        try:
+            items = [_file_processing_log_queue.get()]
+        except Exception:
+            continue
+
+        # Gather whatever else arrives within the flush window
+        deadline = time.monotonic() + FILE_PROCESSING_LOG_FLUSH_SECONDS
+        while len(items) < FILE_PROCESSING_LOG_MAX_ITEMS_PER_WRITE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(_file_processing_log_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        _write_file_processing_log_items(items)
+
+def flush_file_processing_log():
+    """Writes every queued entry on the calling thread (used at shutdown)."""
+    items = []
+    while True:
         try:
-            id_value = str(uuid.uuid4())
-            log_item = {
-                "id": id_value,
-                "document_id": document_id,
-                "user_id": user_id,
-                "log": content,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            cosmos_file_processing_container.create_item(log_item)
-        except Exception as e:
-            raise e
-        
+            items.append(_file_processing_log_queue.get_nowait())
+        except queue.Empty:
+            break
+    if items:
+        _write_file_processing_log_items(items)
+
+def _write_file_processing_log_items(items):
+    dropped = _file_processing_log_writer["dropped"]
+    if dropped:
+        _file_processing_log_writer["dropped"] = 0
+        print(f"Warning: dropped {dropped} file processing log entries because the log queue was full.")
+
+    # The container is partitioned by document_id; a transactional batch covers one partition
+    items_by_document = {}
+    for item in items:
+        items_by_document.setdefault(item["document_id"], []).append(item)
+
+    for document_id, document_items in items_by_document.items():
+        for batch_start in range(0, len(document_items), FILE_PROCESSING_LOG_BATCH_SIZE):
+            batch = document_items[batch_start:batch_start + FILE_PROCESSING_LOG_BATCH_SIZE]
+            if document_id is not None and len(batch) > 1:
+                try:
+                    cosmos_file_processing_container.execute_item_batch(
+                        batch_operations=[("create", (item,)) for item in batch],
+                        partition_key=document_id
+                    )
+                    continue
+                except Exception as e:
+                    print(f"Warning: batched file processing log write failed for {document_id}, writing entries one by one: {e}")
+
+            for item in batch:
+                try:
+                    cosmos_file_processing_container.create_item(item)
+                except Exception as e:
+                    print(f"Warning: failed to write file processing log for {item.get('document_id')}: {e}")
+
+atexit.register(flush_file_processing_log)
@@ -0,0 +1,445 @@
+# functions_parsing.py
+#
+# CPU-bound parse-and-chunk stages of the ingestion pipeline. These functions
+# run in a separate process (see run_parsing_task in functions_documents.py),
+# so they must stay self-contained: no config / Cosmos / Flask imports, file
+# paths in, plain lists of strings out.
+
+import os
+import json
+import fitz # PyMuPDF
+import numpy as np
+import pandas as pd
+import openpyxl
+from bs4 import BeautifulSoup
+from langchain_text_splitters import (
+    RecursiveCharacterTextSplitter,
+    MarkdownHeaderTextSplitter,
+    RecursiveJsonSplitter
+)
+
+# --- Helper function to estimate word count ---
+def estimate_word_count(text):
+    """Estimates the number of words in a string."""
+    if not text:
+        return 0
+    return len(text.split())
+
+def merge_small_chunks(chunks, min_chunk_words, separator):
+    """
+    Accumulates consecutive chunks until they reach `min_chunk_words`; the
+    last chunk is always kept. Returns the merged, non-empty chunks.
+    """
+    final_chunks = []
+    buffer_chunk = ""
+    for i, chunk in enumerate(chunks):
+        current_chunk_text = buffer_chunk + chunk
+        current_word_count = estimate_word_count(current_chunk_text)
+
+        if current_word_count >= min_chunk_words or i == len(chunks) - 1:
+            if current_chunk_text.strip():
+                final_chunks.append(current_chunk_text)
+            buffer_chunk = "" # Reset buffer
+        else:
+            # Chunk is too small, add to buffer and continue to next chunk
+            buffer_chunk = current_chunk_text + separator
+
+    return final_chunks
+
+def parse_txt_chunks(file_path, target_words_per_chunk=400):
+    """Splits a plain text file into chunks of `target_words_per_chunk` words."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    words = content.split()
+    return [
+        " ".join(words[i : i + target_words_per_chunk])
+        for i in range(0, len(words), target_words_per_chunk)
+    ]
+
+def parse_html_chunks(file_path, target_chunk_words=1200, min_chunk_words=600):
+    """Extracts the text of an HTML file and splits it into chunks."""
+    # Open in binary mode and let BeautifulSoup handle the decoding
+    # based on meta tags or detection
+    with open(file_path, 'rb') as f:
+        soup = BeautifulSoup(f, 'lxml') # or 'html.parser' if lxml not installed
+
+    # TODO: Advanced Table Handling
+    text_content = soup.get_text(separator=" ", strip=True)
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=target_chunk_words * 6, # Approximation
+        chunk_overlap=target_chunk_words * 0.1 * 6, # 10% overlap approx
+        length_function=len,
+        is_separator_regex=False,
+    )
+
+    initial_chunks = text_splitter.split_text(text_content)
+    return merge_small_chunks(initial_chunks, min_chunk_words, " ")
+
+def parse_md_chunks(file_path, target_chunk_words=1200, min_chunk_words=600):
+    """Splits a Markdown file on headers and merges small sections."""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        md_content = f.read()
+
+    headers_to_split_on = [
+        ("#", "Header 1"),
+        ("##", "Header 2"),
+        ("###", "Header 3"),
+        ("####", "Header 4"),
+        ("#####", "Header 5"),
+    ]
+
+    md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on, return_each_line=False)
+    md_header_splits = md_splitter.split_text(md_content)
+
+    # TODO: Advanced Table/Code Block Handling:
+    # - Table header replication requires identifying markdown tables (`|---|`),
+    #   detecting splits, and injecting headers.
+    # - Code block wrapping requires detecting ``` blocks split across chunks and
+    #   adding start/end fences.
+    initial_chunks_content = [doc.page_content for doc in md_header_splits]
+    return merge_small_chunks(initial_chunks_content, min_chunk_words, "\n\n")
+
+def parse_json_chunks(file_path, max_chunk_size_chars=4000):
+    """
+    Splits a JSON file with RecursiveJsonSplitter and returns each chunk as a
+    JSON string. Raises ValueError if the file is not valid JSON.
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            json_data = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON structure: {e}")
+
+    json_splitter = RecursiveJsonSplitter(max_chunk_size=max_chunk_size_chars)
+
+    # convert_lists=True lets the splitter handle lists by converting them internally
+    final_json_chunks_structured = json_splitter.split_json(
+        json_data=json_data,
+        convert_lists=True
+    )
+
+    # ensure_ascii=False preserves original non-ASCII characters
+    return [json.dumps(chunk, ensure_ascii=False) for chunk in final_json_chunks_structured]
+
+def serialize_dataframe_rows(df):
+    """
+    Serializes every row of a DataFrame as a CSV line ("a,b,c\n", missing
+    values as empty strings) in one column-wise pass. Returns a Series of
+    row strings.
+    """
+    columns = [df.iloc[:, i].fillna("").astype(str) for i in range(df.shape[1])]
+    rows = columns[0].str.cat(columns[1:], sep=",") if len(columns) > 1 else columns[0]
+    return rows + "\n"
+
+def split_rows_by_length(row_lengths, target_chunk_size):
+    """
+    Greedily groups consecutive rows into chunks of at most
+    `target_chunk_size` characters (a row longer than that gets its own
+    chunk). Boundaries are found with a binary search over the cumulative
+    row lengths. Returns (start, end) index pairs.
+    """
+    cumulative = np.cumsum(row_lengths)
+    total_rows = len(cumulative)
+    boundaries = []
+    start = 0
+    while start < total_rows:
+        consumed = cumulative[start - 1] if start > 0 else 0
+        end = int(np.searchsorted(cumulative, consumed + target_chunk_size, side="right"))
+        end = max(end, start + 1)
+        boundaries.append((start, end))
+        start = end
+    return boundaries
+
+def chunk_tabular_dataframe(df, target_chunk_size_chars=800):
+    """
+    Serializes a DataFrame as CSV rows and groups them into chunks of about
+    `target_chunk_size_chars` characters, each prefixed with the header row.
+    The header does not count towards the chunk size.
+    """
+    if df.empty:
+        return []
+
+    header_string = ",".join(map(str, df.columns.tolist())) + "\n"
+
+    rows = serialize_dataframe_rows(df)
+    row_lengths = rows.str.len().to_numpy()
+    rows_as_strings = rows.to_numpy(dtype=object)
+
+    return [
+        header_string + "".join(rows_as_strings[start:end])
+        for start, end in split_rows_by_length(row_lengths, target_chunk_size_chars)
+    ]
+
+def parse_tabular_sheets(file_path, file_ext, original_filename, target_chunk_size_chars=800):
+    """
+    Reads a CSV / XLSX / XLS file and chunks every sheet. Returns a list of
+    (effective_filename, chunks) tuples, one per sheet; multi-sheet workbooks
+    get "<name>-<sheet><ext>" file names.
+    """
+    if file_ext == '.csv':
+        # Keep data as string; pandas infers the header row
+        df = pd.read_csv(file_path, keep_default_na=False, dtype=str)
+        return [(original_filename, chunk_tabular_dataframe(df, target_chunk_size_chars))]
+
+    excel_file = pd.ExcelFile(file_path, engine='openpyxl' if file_ext == '.xlsx' else 'xlrd')
+    sheet_names = excel_file.sheet_names
+    base_name, ext = os.path.splitext(original_filename)
+
+    sheets = []
+    for sheet_name in sheet_names:
+        # pandas reads values, not formulas
+        df = excel_file.parse(sheet_name, keep_default_na=False, dtype=str)
+        effective_filename = f"{base_name}-{sheet_name}{ext}" if len(sheet_names) > 1 else original_filename
+        sheets.append((effective_filename, chunk_tabular_dataframe(df, target_chunk_size_chars)))
+
+    return sheets
+
+def _iter_tabular_blocks(file_path, file_ext, rows_per_block):
+    """
+    Yields (sheet_name, DataFrame) blocks of at most `rows_per_block` rows,
+    all values as strings, without loading the whole file. CSV is read with
+    read_csv(chunksize=...), XLSX with openpyxl in read-only mode, shaped as
+    read_excel would (padded rows, "Unnamed: N" and de-duplicated headers).
+    XLS has no streaming reader (xlrd loads the whole workbook), so it is
+    read per sheet.
+    """
+    if file_ext == '.csv':
+        reader = pd.read_csv(file_path, keep_default_na=False, dtype=str, chunksize=rows_per_block)
+        for block in reader:
+            yield None, block
+        return
+
+    if file_ext == '.xls':
+        excel_file = pd.ExcelFile(file_path, engine='xlrd')
+        for sheet_name in excel_file.sheet_names:
+            yield sheet_name, excel_file.parse(sheet_name, keep_default_na=False, dtype=str)
+        return
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            # A first pass sizes the sheet so the header can be extended before any block is built
+            width, last_row = _scan_worksheet_shape(worksheet)
+            if last_row < 0:
+                continue
+
+            rows = worksheet.iter_rows(values_only=True)
+            header_row = _pad_row([_convert_excel_cell(value) for value in next(rows)[:width]], width)
+            header = dedup_column_names([
+                f"Unnamed: {i}" if value == "" else value
+                for i, value in enumerate(header_row)
+            ])
+
+            block = []
+            for row_number, row in enumerate(rows, start=1):
+                if row_number > last_row:
+                    break
+                block.append(_pad_row([str(_convert_excel_cell(value)) for value in row[:width]], width))
+                if len(block) >= rows_per_block:
+                    yield worksheet.title, pd.DataFrame(block, columns=header)
+                    block = []
+            yield worksheet.title, pd.DataFrame(block, columns=header)
+    finally:
+        workbook.close()
+
+# The helpers below reproduce how pandas.read_excel (openpyxl engine) shapes a
+# sheet, so the streaming path produces the same chunk text as
+# parse_tabular_sheets.
+
+def _convert_excel_cell(value):
+    """Cell value as pandas' openpyxl reader returns it: "" for empty cells, whole floats as int."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def _pad_row(values, width):
+    return values + [""] * (width - len(values))
+
+def _scan_worksheet_shape(worksheet):
+    """
+    Returns (width, last_row) of a worksheet as pandas reads it: the longest
+    row once trailing empty cells are dropped, and the index of the last row
+    holding any value (-1 for an empty sheet). Shorter rows, including the
+    header, are padded to that width.
+    """
+    width = 0
+    last_row = -1
+    for row_number, row in enumerate(worksheet.iter_rows(values_only=True)):
+        row_width = len(row)
+        while row_width and _convert_excel_cell(row[row_width - 1]) == "":
+            row_width -= 1
+        if row_width:
+            width = max(width, row_width)
+            last_row = row_number
+    return width, last_row
+
+def dedup_column_names(names):
+    """Renames repeated column names the way pandas read_csv / read_excel do: A, A.1, A.2."""
+    names = list(names)
+    counts = {}
+    for i, name in enumerate(names):
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts.get(name, 0)
+        names[i] = name
+        counts[name] = count + 1
+    return names
+
+def get_tabular_sheet_names(file_path, file_ext):
+    if file_ext == '.csv':
+        return [None]
+    if file_ext == '.xls':
+        return pd.ExcelFile(file_path, engine='xlrd').sheet_names
+    workbook = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+def iter_tabular_chunks(file_path, file_ext, original_filename, target_chunk_size_chars=800, rows_per_block=5000):
+    """
+    Streaming version of parse_tabular_sheets: yields (effective_filename,
+    chunk) as rows are read, holding one block of rows in memory at a time.
+    Rows that do not fill a chunk at the end of a block are carried into the
+    next block, so chunk boundaries match the non-streaming path.
+    """
+    sheet_names = get_tabular_sheet_names(file_path, file_ext)
+    base_name, ext = os.path.splitext(original_filename)
+
+    current_sheet = object()
+    header_string = ""
+    effective_filename = original_filename
+    carried_rows = np.empty(0, dtype=object)
+    carried_lengths = np.empty(0, dtype=np.int64)
+
+    for sheet_name, block in _iter_tabular_blocks(file_path, file_ext, rows_per_block):
+        if sheet_name != current_sheet:
+            # Emit what is left of the previous sheet
+            if len(carried_rows):
+                yield effective_filename, header_string + "".join(carried_rows)
+            current_sheet = sheet_name
+            header_string = ",".join(map(str, block.columns.tolist())) + "\n"
+            effective_filename = f"{base_name}-{sheet_name}{ext}" if len(sheet_names) > 1 else original_filename
+            carried_rows = np.empty(0, dtype=object)
+            carried_lengths = np.empty(0, dtype=np.int64)
+
+        if block.empty:
+            continue
+
+        rows = serialize_dataframe_rows(block)
+        rows_as_strings = np.concatenate([carried_rows, rows.to_numpy(dtype=object)])
+        row_lengths = np.concatenate([carried_lengths, rows.str.len().to_numpy(dtype=np.int64)])
+
+        boundaries = split_rows_by_length(row_lengths, target_chunk_size_chars)
+        # The last group may still grow with the next block's rows
+        for start, end in boundaries[:-1]:
+            yield effective_filename, header_string + "".join(rows_as_strings[start:end])
+
+        last_start = boundaries[-1][0]
+        carried_rows = rows_as_strings[last_start:]
+        carried_lengths = row_lengths[last_start:]
+
+    if len(carried_rows):
+        yield effective_filename, header_string + "".join(carried_rows)
+
+def chunk_pdf(input_pdf_path: str, max_pages: int = 500) -> list:
+    """
+    Splits a PDF into multiple PDFs, each with up to `max_pages` pages,
+    using PyMuPDF. Returns a list of file paths for the newly created chunks.
+    """
+    chunks = []
+    try:
+        with fitz.open(input_pdf_path) as doc:
+            total_pages = doc.page_count
+            current_page = 0
+            chunk_index = 1
+
+            base_name, ext = os.path.splitext(input_pdf_path)
+
+            # Loop through the PDF in increments of `max_pages`
+            while current_page < total_pages:
+                end_page = min(current_page + max_pages, total_pages)
+
+                # Create a new, empty document for this chunk
+                chunk_doc = fitz.open()
+
+                # Insert the range of pages in one go
+                chunk_doc.insert_pdf(doc, from_page=current_page, to_page=end_page - 1)
+
+                chunk_pdf_path = f"{base_name}_chunk_{chunk_index}{ext}"
+                chunk_doc.save(chunk_pdf_path)
+                chunk_doc.close()
+
+                chunks.append(chunk_pdf_path)
+
+                current_page = end_page
+                chunk_index += 1
+
+    except Exception as e:
+        print(f"Error chunking PDF: {e}")
+
+    return chunks
+
+def probe_pdf_text_layer(pdf_path, min_chars=50):
+    """
+    Reads the embedded text layer of every page with PyMuPDF. A page counts
+    as having a usable text layer when it holds at least `min_chars`
+    characters and is not mostly undecodable glyphs (U+FFFD); otherwise it is
+    treated as scanned / image-only. Returns a list of
+    {"page_number", "content", "has_text_layer"} dicts in page order.
+    """
+    with fitz.open(pdf_path) as doc:
+        return [_read_page_text_layer(page, min_chars) for page in doc]
+
+def _read_page_text_layer(page, min_chars):
+    text = page.get_text("text").strip()
+    usable = len(text) >= min_chars and text.count("\ufffd") <= len(text) * 0.05
+    return {
+        "page_number": page.number + 1,
+        "content": text if usable else "",
+        "has_text_layer": usable
+    }
+
+def probe_pdf_file(pdf_path, min_chars=50, read_text_layer=True, sample_pages=5):
+    """
+    Reads everything later ingestion stages need from a PDF in one open:
+    page count, embedded metadata and the text layer. With read_text_layer
+    the per-page list from probe_pdf_text_layer is included as
+    "text_layer_pages"; otherwise only the first `sample_pages` pages are
+    checked to set "has_text_layer".
+    """
+    with fitz.open(pdf_path) as doc:
+        meta = doc.metadata or {}
+        text_layer_pages = []
+        for page in doc:
+            if not read_text_layer and page.number >= sample_pages:
+                break
+            text_layer_pages.append(_read_page_text_layer(page, min_chars))
+
+        return {
+            "page_count": doc.page_count,
+            "metadata": {
+                "title": meta.get("title", "") or "",
+                "author": meta.get("author", "") or "",
+                "subject": meta.get("subject", "") or "",
+                "keywords": meta.get("keywords", "") or ""
+            },
+            "has_text_layer": any(page["has_text_layer"] for page in text_layer_pages),
+            "text_layer_pages": text_layer_pages if read_text_layer else None
+        }
+
+def write_pdf_pages(input_pdf_path, page_numbers, output_pdf_path):
+    """Writes the given 1-based pages of a PDF, in order, to a new PDF file."""
+    with fitz.open(input_pdf_path) as doc:
+        subset_doc = fitz.open()
+        for page_number in page_numbers:
+            subset_doc.insert_pdf(doc, from_page=page_number - 1, to_page=page_number - 1)
+        subset_doc.save(output_pdf_path)
+        subset_doc.close()
+    return output_pdf_path
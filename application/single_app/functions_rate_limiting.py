@@ -0,0 +1,148 @@
+# functions_rate_limiting.py
+
+from config import *
+from functions_settings import *
+
+# Process-wide admission control for Azure OpenAI calls, keyed by deployment.
+# Each deployment gets a request bucket (RPM) and a token bucket (TPM) that
+# refill continuously, plus a "blocked until" time set from Retry-After when
+# the service throttles us, so every caller backs off together.
+_openai_rate_limit_state = {}
+_openai_rate_limit_lock = threading.Lock()
+
+def _get_openai_rate_limits(deployment, settings):
+    """
+    Returns (rpm, tpm) for a deployment. Per-deployment values in
+    azure_openai_rate_limits override the global defaults; 0 means no local budget.
+    """
+    overrides = settings.get('azure_openai_rate_limits') or {}
+    limits = overrides.get(deployment, {}) if isinstance(overrides, dict) else {}
+    rpm = limits.get('rpm', settings.get('azure_openai_rate_limit_rpm', 0))
+    tpm = limits.get('tpm', settings.get('azure_openai_rate_limit_tpm', 0))
+    try:
+        return max(0, int(rpm or 0)), max(0, int(tpm or 0))
+    except (TypeError, ValueError):
+        return 0, 0
+
+def _get_rate_limit_state(deployment, rpm, tpm, now):
+    state = _openai_rate_limit_state.get(deployment)
+    if state is None or state['rpm'] != rpm or state['tpm'] != tpm:
+        state = {
+            'rpm': rpm,
+            'tpm': tpm,
+            'requests': float(rpm),
+            'tokens': float(tpm),
+            'updated_at': now,
+            'blocked_until': state['blocked_until'] if state else 0.0
+        }
+        _openai_rate_limit_state[deployment] = state
+    return state
+
+def _refill_rate_limit_state(state, now):
+    elapsed = now - state['updated_at']
+    if elapsed <= 0:
+        return
+    if state['rpm'] > 0:
+        state['requests'] = min(float(state['rpm']), state['requests'] + elapsed * state['rpm'] / 60.0)
+    if state['tpm'] > 0:
+        state['tokens'] = min(float(state['tpm']), state['tokens'] + elapsed * state['tpm'] / 60.0)
+    state['updated_at'] = now
+
+def acquire_openai_capacity(deployment, estimated_tokens=0, settings=None, timeout=600):
+    """
+    Blocks until `deployment` has budget for one request of roughly
+    `estimated_tokens` tokens and is not inside a Retry-After window.
+    Raises TimeoutError if that does not happen within `timeout` seconds.
+    """
+    if settings is None:
+        settings = get_settings() or {}
+    rpm, tpm = _get_openai_rate_limits(deployment, settings)
+    deadline = time.monotonic() + timeout
+
+    while True:
+        with _openai_rate_limit_lock:
+            now = time.monotonic()
+            state = _get_rate_limit_state(deployment, rpm, tpm, now)
+            _refill_rate_limit_state(state, now)
+
+            # A request bigger than the whole TPM budget is admitted once the bucket is full
+            tokens_needed = min(estimated_tokens, tpm) if tpm > 0 else 0
+            wait_time = state['blocked_until'] - now
+
+            if wait_time <= 0:
+                if rpm > 0 and state['requests'] < 1:
+                    wait_time = (1 - state['requests']) * 60.0 / rpm
+                elif tpm > 0 and state['tokens'] < tokens_needed:
+                    wait_time = (tokens_needed - state['tokens']) * 60.0 / tpm
+                else:
+                    if rpm > 0:
+                        state['requests'] -= 1
+                    if tpm > 0:
+                        state['tokens'] -= tokens_needed
+                    return
+
+        if time.monotonic() + wait_time > deadline:
+            raise TimeoutError(f"Timed out waiting for Azure OpenAI capacity on deployment '{deployment}'.")
+        time.sleep(wait_time)
+
+def report_openai_throttle(deployment, retry_after_seconds):
+    """Holds back every caller of `deployment` for `retry_after_seconds`."""
+    with _openai_rate_limit_lock:
+        now = time.monotonic()
+        state = _openai_rate_limit_state.get(deployment)
+        if state is None:
+            state = _get_rate_limit_state(deployment, 0, 0, now)
+        state['blocked_until'] = max(state['blocked_until'], now + max(0.0, retry_after_seconds))
+
+def get_retry_after_seconds(error, default=None):
+    """
+    Reads retry-after-ms / retry-after from the HTTP response attached to an
+    OpenAI or Azure SDK error. Returns `default` if neither header is usable.
+    """
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except (TypeError, ValueError):
+            pass
+
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            pass
+
+    return default
+
+def call_with_openai_rate_limit(
+    deployment,
+    request_fn,
+    estimated_tokens=0,
+    max_retries=5,
+    initial_delay=1.0,
+    delay_multiplier=2.0
+):
+    """
+    Runs `request_fn()` once the shared limiter admits it. On RateLimitError the
+    deployment is paused for the server's Retry-After (or an exponential
+    backoff when the header is missing) and the call is retried; the last
+    RateLimitError is re-raised after `max_retries` retries.
+    """
+    retries = 0
+    current_delay = initial_delay
+
+    while True:
+        acquire_openai_capacity(deployment, estimated_tokens)
+        try:
+            return request_fn()
+        except RateLimitError as e:
+            retries += 1
+            retry_after = get_retry_after_seconds(e, default=current_delay * random.uniform(1.0, 1.5))
+            report_openai_throttle(deployment, retry_after)
+            if retries > max_retries:
+                raise
+            current_delay *= delay_multiplier
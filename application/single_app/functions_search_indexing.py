@@ -0,0 +1,133 @@
+# functions_search_indexing.py
+
+from config import *
+
+# Indexing status codes worth retrying, per the Azure AI Search docs:
+# 409 (version conflict), 422 (index temporarily unavailable), 503 (service busy)
+RETRYABLE_INDEXING_STATUS_CODES = (409, 422, 503)
+
+class SearchIndexBatchWriter:
+    """
+    Buffers chunk documents for one search index and uploads them in batches
+    instead of one request per chunk. The buffer is flushed when it reaches
+    max_documents or max_bytes (serialized JSON), and must be flushed once
+    more when the document is finished. Failed keys from the indexing result
+    are retried on their own; anything still failing raises on flush.
+    Safe to share between threads. stats_recorder, when given, is called
+    as stats_recorder("indexing", seconds, num_bytes=..., num_items=...,
+    retries=...) after every flush, and indexed_callback, when given, with
+    the list of documents each flush indexed.
+    """
+
+    def __init__(
+        self,
+        search_client,
+        max_documents=SEARCH_INDEX_BATCH_MAX_DOCUMENTS,
+        max_bytes=SEARCH_INDEX_BATCH_MAX_BYTES,
+        max_retries=3,
+        initial_delay=1.0,
+        delay_multiplier=2.0,
+        stats_recorder=None,
+        indexed_callback=None
+    ):
+        self.search_client = search_client
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.max_retries = max_retries
+        self.initial_delay = initial_delay
+        self.delay_multiplier = delay_multiplier
+        self.stats_recorder = stats_recorder
+        self.indexed_callback = indexed_callback
+        self.documents_indexed = 0
+        self.retries = 0
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._lock = threading.RLock()
+
+    def add(self, document):
+        """Queues a chunk document, uploading the buffer first if it would overflow."""
+        document_bytes = len(json.dumps(document, default=str).encode("utf-8"))
+
+        with self._lock:
+            if self._buffer and (
+                len(self._buffer) >= self.max_documents
+                or self._buffer_bytes + document_bytes > self.max_bytes
+            ):
+                self._flush_locked()
+
+            self._buffer.append(document)
+            self._buffer_bytes += document_bytes
+
+    def flush(self):
+        """Uploads everything still buffered. Returns the number of documents indexed."""
+        with self._lock:
+            self._flush_locked()
+            return self.documents_indexed
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+
+        batch = self._buffer
+        batch_bytes = self._buffer_bytes
+        self._buffer = []
+        self._buffer_bytes = 0
+
+        start = time.monotonic()
+        retries_before = self.retries
+        self._upload_with_retry(batch)
+        if self.stats_recorder is not None:
+            self.stats_recorder(
+                "indexing",
+                time.monotonic() - start,
+                num_bytes=batch_bytes,
+                num_items=len(batch),
+                retries=self.retries - retries_before
+            )
+        if self.indexed_callback is not None:
+            self.indexed_callback(batch)
+
+    def _upload_with_retry(self, documents):
+        pending = documents
+        retries = 0
+        current_delay = self.initial_delay
+
+        while True:
+            try:
+                results = self.search_client.upload_documents(documents=pending)
+            except HttpResponseError as e:
+                # Payload too large for one request: split it and upload each half
+                if e.status_code == 413 and len(pending) > 1:
+                    middle = len(pending) // 2
+                    self._upload_with_retry(pending[:middle])
+                    self._upload_with_retry(pending[middle:])
+                    return
+                raise
+
+            failed_keys = set()
+            fatal_errors = []
+            for result in results:
+                if result.succeeded:
+                    continue
+                if result.status_code in RETRYABLE_INDEXING_STATUS_CODES:
+                    failed_keys.add(result.key)
+                else:
+                    fatal_errors.append(f"{result.key}: {result.status_code} {result.error_message}")
+
+            self.documents_indexed += len(pending) - len(failed_keys) - len(fatal_errors)
+
+            if fatal_errors:
+                raise RuntimeError(f"Failed to index {len(fatal_errors)} chunk(s): {'; '.join(fatal_errors[:5])}")
+
+            if not failed_keys:
+                return
+
+            retries += 1
+            self.retries += 1
+            if retries > self.max_retries:
+                raise RuntimeError(f"Failed to index {len(failed_keys)} chunk(s) after {self.max_retries} retries: {sorted(failed_keys)[:5]}")
+
+            print(f"Retrying {len(failed_keys)} chunk(s) that failed to index (attempt {retries}/{self.max_retries})")
+            pending = [doc for doc in pending if doc["id"] in failed_keys]
+            time.sleep(current_delay * random.uniform(1.0, 1.5))
+            current_delay *= self.delay_multiplier
@@ -2,7 +2,70 @@
 
 from config import *
 
+# Process-local cache of the app_settings document. Within the TTL the cached
+# copy is served as-is; after it expires we only compare the document's _etag
+# (a projection query) and re-read/merge the full document when it changed.
+SETTINGS_CACHE_TTL_SECONDS = 15
+_settings_cache = {
+    "settings": None,
+    "etag": None,
+    "checked_at": 0.0
+}
+_settings_cache_lock = threading.Lock()
+
 def get_settings():
+    """
+    Returns a copy of the app settings, served from the process-local cache
+    whenever possible. Callers are free to mutate the returned dict.
+    """
+    cached = _settings_cache["settings"]
+    if cached is not None and time.monotonic() - _settings_cache["checked_at"] < SETTINGS_CACHE_TTL_SECONDS:
+        return copy.deepcopy(cached)
+
+    with _settings_cache_lock:
+        # Another thread may have refreshed the cache while we waited
+        cached = _settings_cache["settings"]
+        now = time.monotonic()
+        if cached is not None and now - _settings_cache["checked_at"] < SETTINGS_CACHE_TTL_SECONDS:
+            return copy.deepcopy(cached)
+
+        if cached is not None:
+            try:
+                current_etag = _read_settings_etag()
+                if current_etag and current_etag == _settings_cache["etag"]:
+                    _settings_cache["checked_at"] = now
+                    return copy.deepcopy(cached)
+            except Exception as e:
+                print(f"Error checking settings version, reloading: {str(e)}")
+
+        settings = _load_settings_from_cosmos()
+        if settings is None:
+            # Serve the last known good settings rather than failing every caller
+            return copy.deepcopy(cached) if cached is not None else None
+
+        _settings_cache["settings"] = settings
+        _settings_cache["etag"] = settings.get("_etag")
+        _settings_cache["checked_at"] = now
+        return copy.deepcopy(settings)
+
+def invalidate_settings_cache():
+    """Drops the cached settings so the next get_settings() reads Cosmos."""
+    with _settings_cache_lock:
+        _settings_cache["settings"] = None
+        _settings_cache["etag"] = None
+        _settings_cache["checked_at"] = 0.0
+
+def _read_settings_etag():
+    results = list(
+        cosmos_settings_container.query_items(
+            query="SELECT VALUE c._etag FROM c WHERE c.id = @id",
+            parameters=[{"name": "@id", "value": "app_settings"}],
+            partition_key="app_settings"
+        )
+    )
+    return results[0] if results else None
+
+def _load_settings_from_cosmos():
     default_settings = {
         'id': 'app_settings',
         # -- Your entire default dictionary here --
@@ -142,11 +205,40 @@ def get_settings():
         'azure_apim_document_intelligence_endpoint': '',
         'azure_apim_document_intelligence_subscription_key': '',
 
+        # Azure OpenAI client-side rate limiting (per deployment, 0 = no local budget)
+        'azure_openai_rate_limit_rpm': 0,
+        'azure_openai_rate_limit_tpm': 0,
+        'azure_openai_rate_limits': {},
+
+        # Ingestion progress writes (coalesced per document)
+        'ingestion_progress_flush_seconds': 5,
+        'ingestion_progress_flush_percent': 5,
+        # Embedding requests in flight per document (each still waits on the rate limiter)
+        'ingestion_embedding_concurrency': 4,
+        # CSV / Excel files above this size are streamed block by block
+        'tabular_streaming_threshold_mb': 25,
+        'tabular_streaming_rows_per_block': 5000,
+        # Use the PDF text layer when present; only scanned pages go to Document Intelligence
+        'enable_pdf_local_text_extraction': True,
+        'pdf_text_layer_min_chars': 50,
+        # PDF file chunks analysed by Document Intelligence at the same time
+        'document_intelligence_max_concurrency': 3,
+        # Reuse Document Intelligence results for files that were analysed before
+        'enable_document_intelligence_cache': True,
+        # Reuse the previous version's embeddings for unchanged chunks of a re-uploaded file
+        'enable_incremental_reindexing': True,
+        # Checkpoint extraction results and indexed chunks so interrupted jobs can resume
+        'enable_ingestion_checkpoints': True,
+
         # Other
         'max_file_size_mb': 150,
         'conversation_history_limit': 10,
         'default_system_prompt': '',
         'enable_file_processing_logs': True,
+        # debug also logs chunk text and full metadata; debug/info entries can be sampled
+        'file_processing_log_level': 'info',
+        'file_processing_log_sample_rate': 1.0,
+        'file_processing_log_max_chars': 2000,
 
         # Video file settings with Azure Video Indexer Settings
         'video_indexer_endpoint': 'https://api.videoindexer.ai',
@@ -163,7 +255,11 @@ def get_settings():
         "speech_service_endpoint": "https://eastus.api.cognitive.microsoft.com",
         "speech_service_location": "eastus",
         "speech_service_locale": "en-US",
-        "speech_service_key": ""
+        "speech_service_key": "",
+        # Encoding of audio segments sent for transcription: opus, flac or wav
+        "speech_audio_segment_format": "opus",
+        # Audio segments sent to the Speech service at the same time
+        "speech_transcription_max_concurrency": 4
     }
 
     try:
@@ -179,7 +275,7 @@ def get_settings():
 
         # If merging added anything new, upsert back to Cosmos so future reads remain up to date
         if merged != settings_item:
-            cosmos_settings_container.upsert_item(merged)
+            merged = cosmos_settings_container.upsert_item(merged)
             print("App Settings had missing keys and was updated in Cosmos DB.")
             return merged
         else:
@@ -188,9 +284,9 @@ def get_settings():
 
     except CosmosResourceNotFoundError:
         # If there's no doc, create it from scratch:
-        cosmos_settings_container.create_item(body=default_settings)
+        created = cosmos_settings_container.create_item(body=default_settings)
         print("Default settings created in Cosmos and returned.")
-        return default_settings
+        return created
 
     except Exception as e:
         print(f"Error retrieving settings: {str(e)}")
@@ -200,12 +296,15 @@ def get_settings():
 def update_settings(new_settings):
     try:
         # always fetch the latest settings doc, which includes your merges
+        invalidate_settings_cache()
         settings_item = get_settings()
         settings_item.update(new_settings)
         cosmos_settings_container.upsert_item(settings_item)
+        invalidate_settings_cache()
         print("Settings updated successfully.")
         return True
     except Exception as e:
+        invalidate_settings_cache()
         print(f"Error updating settings: {str(e)}")
         return False
 
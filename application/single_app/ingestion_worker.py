@@ -0,0 +1,24 @@
+# ingestion_worker.py
+#
+# Runs document ingestion workers outside the web process:
+#
+#     INGESTION_RUN_IN_WEB_PROCESS=false   (on the web app)
+#     python ingestion_worker.py           (on the worker, same temp directory)
+#
+# The worker count comes from INGESTION_WORKER_COUNT.
+
+from config import *
+from functions_settings import *
+from functions_ingestion_queue import *
+
+if __name__ == '__main__':
+    settings = get_settings()
+    initialize_clients(settings)
+
+    stop_event = start_ingestion_workers()
+    try:
+        while not stop_event.wait(60):
+            print(f"[Ingestion] Queue depth: {get_ingestion_queue_depth()['counts']}")
+    except KeyboardInterrupt:
+        print("[Ingestion] Stopping workers...")
+        stop_event.set()
@@ -92,12 +92,8 @@ def register_route_backend_chats(app):
                         "'model_deployment' in your request."
                     )
 
-                # initialize the APIM client
-                gpt_client = AzureOpenAI(
-                    api_version=settings.get('azure_apim_gpt_api_version'),
-                    azure_endpoint=settings.get('azure_apim_gpt_endpoint'),
-                    api_key=settings.get('azure_apim_gpt_subscription_key')
-                )
+                # get the pooled APIM client
+                gpt_client = get_azure_openai_client("gpt", settings)
             else:
                 auth_type = settings.get('azure_openai_gpt_authentication_type')
                 endpoint = settings.get('azure_openai_gpt_endpoint')
@@ -119,21 +115,10 @@ def register_route_backend_chats(app):
                 else:
                     raise ValueError("No GPT model selected or configured.")
 
-                if auth_type == 'managed_identity':
-                    token_provider = get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")
-                    gpt_client = AzureOpenAI(
-                        api_version=api_version,
-                        azure_endpoint=endpoint,
-                        azure_ad_token_provider=token_provider
-                    )
-                else: # Default to API Key
+                if auth_type != 'managed_identity': # Default to API Key
                     api_key = settings.get('azure_openai_gpt_key')
                     if not api_key: raise ValueError("Azure OpenAI API Key not configured.")
-                    gpt_client = AzureOpenAI(
-                        api_version=api_version,
-                        azure_endpoint=endpoint,
-                        api_key=api_key
-                    )
+                gpt_client = get_azure_openai_client("gpt", settings)
 
             if not gpt_client or not gpt_model:
                  raise ValueError("GPT Client or Model could not be initialized.")
@@ -328,10 +313,14 @@ def register_route_backend_chats(app):
 
                         try:
                             # Use the already initialized gpt_client and gpt_model
-                            summary_response_search = gpt_client.chat.completions.create(
-                                model=gpt_model,
-                                messages=[{"role": "system", "content": summary_prompt_search}],
-                                max_tokens=100 # Keep summary short
+                            summary_response_search = call_with_openai_rate_limit(
+                                gpt_model,
+                                lambda: gpt_client.chat.completions.create(
+                                    model=gpt_model,
+                                    messages=[{"role": "system", "content": summary_prompt_search}],
+                                    max_tokens=100 # Keep summary short
+                                ),
+                                estimated_tokens=estimate_token_count(summary_prompt_search) + 100
                             )
                             summary_for_search = summary_response_search.choices[0].message.content.strip()
                             if summary_for_search:
@@ -492,36 +481,14 @@ def register_route_backend_chats(app):
 
         # Image Generation
         if image_gen_enabled:
+            image_gen_client = get_azure_openai_client("image_gen", settings)
             if enable_image_gen_apim:
                 image_gen_model = settings.get('azure_apim_image_gen_deployment')
-                image_gen_client = AzureOpenAI(
-                    api_version=settings.get('azure_apim_image_gen_api_version'),
-                    azure_endpoint=settings.get('azure_apim_image_gen_endpoint'),
-                    api_key=settings.get('azure_apim_image_gen_subscription_key')
-                )
             else:
-                if (settings.get('azure_openai_image_gen_authentication_type') == 'managed_identity'):
-                    token_provider = get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")
-                    image_gen_client = AzureOpenAI(
-                        api_version=settings.get('azure_openai_image_gen_api_version'),
-                        azure_endpoint=settings.get('azure_openai_image_gen_endpoint'),
-                        azure_ad_token_provider=token_provider
-                    )
-                    image_gen_model_obj = settings.get('image_gen_model', {})
-
-                    if image_gen_model_obj and image_gen_model_obj.get('selected'):
-                        selected_image_gen_model = image_gen_model_obj['selected'][0]
-                        image_gen_model = selected_image_gen_model['deploymentName']
-                else:
-                    image_gen_client = AzureOpenAI(
-                        api_version=settings.get('azure_openai_image_gen_api_version'),
-                        azure_endpoint=settings.get('azure_openai_image_gen_endpoint'),
-                        api_key=settings.get('azure_openai_image_gen_key')
-                    )
-                    image_gen_obj = settings.get('image_gen_model', {})
-                    if image_gen_obj and image_gen_obj.get('selected'):
-                        selected_image_gen_model = image_gen_obj['selected'][0]
-                        image_gen_model = selected_image_gen_model['deploymentName']
+                image_gen_model_obj = settings.get('image_gen_model', {})
+                if image_gen_model_obj and image_gen_model_obj.get('selected'):
+                    selected_image_gen_model = image_gen_model_obj['selected'][0]
+                    image_gen_model = selected_image_gen_model['deploymentName']
 
             try:
                 image_response = image_gen_client.images.generate(
@@ -606,11 +573,15 @@ def register_route_backend_chats(app):
                     summary_prompt_older += "\n".join(message_texts_older)
                     try:
                         # Use the already initialized client and model
-                        summary_response_older = gpt_client.chat.completions.create(
-                            model=gpt_model,
-                            messages=[{"role": "system", "content": summary_prompt_older}],
-                            max_tokens=150, # Adjust token limit for summary
-                            temperature=0.3 # Lower temp for factual summary
+                        summary_response_older = call_with_openai_rate_limit(
+                            gpt_model,
+                            lambda: gpt_client.chat.completions.create(
+                                model=gpt_model,
+                                messages=[{"role": "system", "content": summary_prompt_older}],
+                                max_tokens=150, # Adjust token limit for summary
+                                temperature=0.3 # Lower temp for factual summary
+                            ),
+                            estimated_tokens=estimate_token_count(summary_prompt_older) + 150
                         )
                         summary_of_older = summary_response_older.choices[0].message.content.strip()
                         print(f"Generated summary: {summary_of_older}")
@@ -719,10 +690,14 @@ def register_route_backend_chats(app):
             print(f"Total messages in API call: {len(conversation_history_for_api)}")
             # Calculate rough token estimate if needed for debugging
 
-            response = gpt_client.chat.completions.create(
-                model=final_model_used,
-                messages=conversation_history_for_api,
-                # Add other parameters like temperature, max_tokens if needed
+            response = call_with_openai_rate_limit(
+                final_model_used,
+                lambda: gpt_client.chat.completions.create(
+                    model=final_model_used,
+                    messages=conversation_history_for_api,
+                    # Add other parameters like temperature, max_tokens if needed
+                ),
+                estimated_tokens=estimate_token_count(json.dumps(conversation_history_for_api))
             )
             ai_message = response.choices[0].message.content
 
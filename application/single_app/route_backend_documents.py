@@ -3,6 +3,7 @@
 from config import *
 from functions_authentication import *
 from functions_documents import *
+from functions_ingestion_queue import *
 from functions_settings import *
 
 def register_route_backend_documents(app):
@@ -52,7 +53,7 @@ def register_route_backend_documents(app):
                 add_file_task_to_file_processing_log(document_id=file_id, user_id=user_id, content="File not found in conversation")
                 return jsonify({'error': 'File not found in conversation'}), 404
 
-            add_file_task_to_file_processing_log(document_id=file_id, user_id=user_id, content="File found, processing content: " + str(items))
+            add_file_task_to_file_processing_log(document_id=file_id, user_id=user_id, content="File found, processing content: " + str(items), level="debug")
             items_sorted = sorted(items, key=lambda x: x.get('chunk_index', 0))
 
             filename = items_sorted[0].get('filename', 'Untitled')
@@ -89,7 +90,7 @@ def register_route_backend_documents(app):
             }), 200
 
         except Exception as e:
-            add_file_task_to_file_processing_log(document_id=file_id, user_id=user_id, content="Error retrieving file content: " + str(e))
+            add_file_task_to_file_processing_log(document_id=file_id, user_id=user_id, content="Error retrieving file content: " + str(e), level="error")
             return jsonify({'error': f'Error retrieving file content: {str(e)}'}), 500
     
     @app.route('/api/documents/upload', methods=['POST'])
@@ -165,24 +166,14 @@ def register_route_backend_documents(app):
                     percentage_complete=0
                 )
 
-                # 3) Now run heavy-lifting in a background thread
+                # 3) Queue the heavy lifting for the ingestion workers (job id = document id)
                 # --- CHANGE: Pass original_filename ---
-                future = executor.submit(
-                    process_document_upload_background,
+                enqueue_document_upload_job(
                     document_id=parent_document_id,
                     user_id=user_id,
                     temp_file_path=temp_file_path, # Pass the actual path of the saved temp file
                     original_filename=original_filename
                 )
-                # If you want to store the future in memory by name, you can do:
-                executor.submit_stored(
-                    parent_document_id, 
-                    process_document_upload_background, 
-                    document_id=parent_document_id, 
-                    user_id=user_id, 
-                    temp_file_path=temp_file_path, 
-                    original_filename=original_filename
-                )
 
                 processed_docs.append({'document_id': parent_document_id, 'filename': original_filename})
 
@@ -472,20 +463,17 @@ def register_route_backend_documents(app):
         if not settings.get('enable_extract_meta_data'):
             return jsonify({'error': 'Metadata extraction not enabled'}), 403
 
-        # Queue the background task (immediately returns a future)
-        future = executor.submit(
-            process_metadata_extraction_background,
+        # Queue the background task; a job already queued or running is not added again
+        queued = enqueue_metadata_extraction_job(
             document_id=document_id,
             user_id=user_id
         )
 
-        # Optionally store or track this future:
-        executor.submit_stored(
-            f"{document_id}_metadata", 
-            process_metadata_extraction_background, 
-            document_id=document_id, 
-            user_id=user_id
-        )
+        if not queued:
+            return jsonify({
+                'message': 'Metadata extraction is already queued for this document.',
+                'document_id': document_id
+            }), 200
 
         # Return an immediate response to the user
         return jsonify({
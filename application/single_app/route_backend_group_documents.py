@@ -5,6 +5,7 @@ from functions_authentication import *
 from functions_settings import *
 from functions_group import *
 from functions_documents import *
+from functions_ingestion_queue import *
 
 def register_route_backend_group_documents(app):
     """
@@ -97,23 +98,13 @@ def register_route_backend_group_documents(app):
                     percentage_complete=0
                 )
 
-                future = executor.submit(
-                    process_document_upload_background,
+                enqueue_document_upload_job(
                     document_id=parent_document_id,
                     group_id=active_group_id,
                     user_id=user_id,
                     temp_file_path=temp_file_path,
                     original_filename=original_filename
                 )
-                executor.submit_stored(
-                    parent_document_id, 
-                    process_document_upload_background, 
-                    document_id=parent_document_id, 
-                    group_id=active_group_id, 
-                    user_id=user_id, 
-                    temp_file_path=temp_file_path, 
-                    original_filename=original_filename
-                )
 
                 processed_docs.append({'document_id': parent_document_id, 'filename': original_filename})
 
@@ -464,22 +455,19 @@ def register_route_backend_group_documents(app):
         if role not in ["Owner", "Admin", "DocumentManager"]:
             return jsonify({'error': 'You do not have permission to extract metadata for this group document'}), 403
 
-        # Queue the group metadata extraction task
-        future = executor.submit(
-            process_metadata_extraction_background,
-            document_id=document_id,
-            user_id=user_id,
-            group_id=active_group_id  # Ensure your background handler supports this
-        )
-
-        executor.submit_stored(
-            f"{document_id}_group_metadata",
-            process_metadata_extraction_background,
+        # Queue the group metadata extraction task; skipped if one is already queued or running
+        queued = enqueue_metadata_extraction_job(
             document_id=document_id,
             user_id=user_id,
             group_id=active_group_id
         )
 
+        if not queued:
+            return jsonify({
+                'message': 'Group metadata extraction is already queued for this document.',
+                'document_id': document_id
+            }), 200
+
         return jsonify({
             'message': 'Group metadata extraction has been queued. Check document status periodically.',
             'document_id': document_id
@@ -0,0 +1,153 @@
+# route_backend_ingestion.py
+
+from config import *
+from functions_authentication import *
+from functions_settings import *
+from functions_group import *
+from functions_ingestion_queue import *
+from functions_ingestion_stats import *
+
+def register_route_backend_ingestion(app):
+    """
+    Provides backend routes for the ingestion job queue:
+    - GET /api/admin/ingestion/queue        (queue depth, admin only)
+    - GET /api/admin/ingestion/stats        (per-stage timing percentiles, admin only)
+    - GET /api/ingestion/jobs/<job_id>      (status of one job)
+    - POST /api/ingestion/jobs/<job_id>/resume (continue a failed upload from its checkpoint)
+    """
+
+    @app.route('/api/admin/ingestion/queue', methods=['GET'])
+    @login_required
+    @admin_required
+    def api_get_ingestion_queue_depth():
+        try:
+            depth = get_ingestion_queue_depth()
+        except Exception as e:
+            return jsonify({'error': f'Error reading ingestion queue: {str(e)}'}), 500
+
+        depth['workers_in_web_process'] = INGESTION_RUN_IN_WEB_PROCESS
+        depth['worker_count'] = INGESTION_WORKER_COUNT
+        return jsonify(depth), 200
+
+    @app.route('/api/admin/ingestion/stats', methods=['GET'])
+    @login_required
+    @admin_required
+    def api_get_ingestion_stats():
+        """
+        Percentiles of ingestion time per stage over the last `days` days
+        (default 7), optionally for a single `file_ext` such as .pdf.
+        """
+        try:
+            days = max(1, int(request.args.get('days', 7)))
+        except ValueError:
+            return jsonify({'error': 'days must be an integer'}), 400
+
+        file_ext = request.args.get('file_ext', '').strip().lower() or None
+        if file_ext and not file_ext.startswith('.'):
+            file_ext = f".{file_ext}"
+        since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+        try:
+            stats_items = get_recent_ingestion_stats(since, file_ext=file_ext)
+        except Exception as e:
+            return jsonify({'error': f'Error reading ingestion stats: {str(e)}'}), 500
+
+        summary = summarize_ingestion_stats(stats_items)
+        summary['since'] = since
+        summary['file_ext'] = file_ext
+        return jsonify(summary), 200
+
+    @app.route('/api/ingestion/jobs/<job_id>', methods=['GET'])
+    @login_required
+    @user_required
+    def api_get_ingestion_job(job_id):
+        user_id = get_current_user_id()
+        if not user_id:
+            return jsonify({'error': 'User not authenticated'}), 401
+
+        try:
+            job = get_ingestion_job(job_id)
+        except Exception as e:
+            return jsonify({'error': f'Error reading ingestion job: {str(e)}'}), 500
+
+        if not _user_can_access_ingestion_job(job, user_id):
+            return jsonify({'error': 'Job not found'}), 404
+
+        payload = job['payload']
+        return jsonify({
+            'job_id': job['job_id'],
+            'job_type': job['job_type'],
+            'document_id': payload.get('document_id'),
+            'status': job['status'],
+            'attempts': job['attempts'],
+            'max_attempts': job['max_attempts'],
+            'enqueued_at': job['enqueued_at'],
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at'],
+            'last_error': job['last_error']
+        }), 200
+
+    @app.route('/api/ingestion/jobs/<job_id>/resume', methods=['POST'])
+    @login_required
+    @user_required
+    def api_resume_ingestion_job(job_id):
+        user_id = get_current_user_id()
+        if not user_id:
+            return jsonify({'error': 'User not authenticated'}), 401
+
+        try:
+            job = get_ingestion_job(job_id)
+        except Exception as e:
+            return jsonify({'error': f'Error reading ingestion job: {str(e)}'}), 500
+
+        if not _user_can_access_ingestion_job(job, user_id):
+            return jsonify({'error': 'Job not found'}), 404
+
+        # Resuming re-runs the upload, so group jobs need the roles allowed to upload
+        if not _user_can_resume_ingestion_job(job, user_id):
+            return jsonify({'error': 'You do not have permission to resume this job'}), 403
+
+        try:
+            error = resume_document_upload_job(job)
+        except Exception as e:
+            return jsonify({'error': f'Error resuming ingestion job: {str(e)}'}), 500
+
+        if error:
+            return jsonify({'error': error}), 409
+
+        payload = job['payload']
+        args = {
+            "document_id": payload.get('document_id'),
+            "user_id": payload.get('user_id'),
+            "status": "Queued to resume processing"
+        }
+
+        if payload.get('group_id'):
+            args["group_id"] = payload['group_id']
+
+        try:
+            update_document(**args)
+        except Exception as e:
+            print(f"Warning: could not update status of resumed document {payload.get('document_id')}: {e}")
+
+        return jsonify({'message': 'Job queued to resume', 'job_id': job_id}), 202
+
+def _user_can_access_ingestion_job(job, user_id):
+    """Only the uploader, or a member of the owning group, may see a job."""
+    if not job:
+        return False
+
+    payload = job['payload']
+    group_id = payload.get('group_id')
+    if group_id:
+        group_doc = find_group_by_id(group_id=group_id)
+        return bool(group_doc and get_user_role_in_group(group_doc, user_id))
+    return payload.get('user_id') == user_id
+
+def _user_can_resume_ingestion_job(job, user_id):
+    """Group jobs may be resumed by members who can upload to the group (Owner, Admin, DocumentManager)."""
+    group_id = job['payload'].get('group_id')
+    if not group_id:
+        return job['payload'].get('user_id') == user_id
+    group_doc = find_group_by_id(group_id=group_id)
+    return bool(group_doc) and get_user_role_in_group(group_doc, user_id) in ["Owner", "Admin", "DocumentManager"]
@@ -137,6 +137,11 @@ def register_route_frontend_admin_settings(app):
             app_title = form_data.get('app_title', 'AI Chat Application')
             max_file_size_mb = int(form_data.get('max_file_size_mb', 16))
             conversation_history_limit = int(form_data.get('conversation_history_limit', 10))
+            file_processing_log_level = form_data.get('file_processing_log_level', 'info')
+            if file_processing_log_level not in ('debug', 'info', 'warning', 'error'):
+                file_processing_log_level = 'info'
+            file_processing_log_sample_rate = min(1.0, max(0.0, float(form_data.get('file_processing_log_sample_rate') or 1.0)))
+            file_processing_log_max_chars = max(0, int(form_data.get('file_processing_log_max_chars') or 2000))
             # ... (fetch all other fields using form_data.get) ...
             enable_video_file_support = form_data.get('enable_video_file_support') == 'on'
             enable_audio_file_support = form_data.get('enable_audio_file_support') == 'on'
@@ -271,6 +276,9 @@ def register_route_frontend_admin_settings(app):
                 'enable_user_workspace': form_data.get('enable_user_workspace') == 'on',
                 'enable_group_workspaces': form_data.get('enable_group_workspaces') == 'on',
                 'enable_file_processing_logs': form_data.get('enable_file_processing_logs') == 'on',
+                'file_processing_log_level': file_processing_log_level,
+                'file_processing_log_sample_rate': file_processing_log_sample_rate,
+                'file_processing_log_max_chars': file_processing_log_max_chars,
                 'require_member_of_create_group': require_member_of_create_group, # ADDE
 
                 # Multimedia & Metadata
@@ -432,7 +440,8 @@ def register_route_frontend_admin_settings(app):
                     add_file_task_to_file_processing_log(
                         document_id='Image_Upload', # Placeholder if needed
                         user_id='New_image',
-                        content=f"Converted image to base64 for processing: {base64_str}"
+                        content=f"Converted image to base64 for processing: {base64_str}",
+                        level="debug"
                     )
 
                     # ****** CHANGE HERE: Update only on success *****
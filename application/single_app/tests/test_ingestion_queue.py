@@ -0,0 +1,95 @@
+# test_ingestion_queue.py
+
+import os
+
+import pytest
+
+pytest.importorskip("flask")
+if not os.getenv("AZURE_COSMOS_ENDPOINT"):
+    # config.py connects to Cosmos DB when it is imported
+    pytest.skip("AZURE_COSMOS_ENDPOINT is not set", allow_module_level=True)
+
+import functions_documents
+import functions_ingestion_checkpoints
+import functions_ingestion_queue as ingestion_queue
+
+
+@pytest.fixture
+def queue_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion_queue, "INGESTION_QUEUE_DB_PATH", str(tmp_path / "queue.db"))
+    monkeypatch.setattr(ingestion_queue, "_ingestion_schema_ready", False)
+    monkeypatch.setattr(functions_ingestion_checkpoints, "INGESTION_CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+
+
+@pytest.fixture
+def failing_upload(tmp_path, monkeypatch):
+    """A .txt upload whose handler raises; Cosmos / Search access is replaced with in-memory fakes."""
+    document_updates = []
+
+    class FakeJobContext:
+        def __init__(self):
+            self.checkpoint = None
+            self.file_probe = None
+            self.embedding_model = None
+            self.stage_timer = functions_documents.IngestionStageTimer()
+
+        @classmethod
+        def load(cls, **kwargs):
+            return cls()
+
+    class FakeProgressReporter:
+        def __init__(self, job_context):
+            pass
+
+        def update(self, **kwargs):
+            document_updates.append(kwargs)
+
+        def flush(self):
+            pass
+
+    def failing_handler(**kwargs):
+        raise RuntimeError("handler failed")
+
+    monkeypatch.setattr(functions_documents, "get_settings", lambda: {"max_file_size_mb": 16})
+    monkeypatch.setattr(functions_documents, "update_document", lambda **kwargs: document_updates.append(kwargs))
+    monkeypatch.setattr(functions_documents, "IngestionJobContext", FakeJobContext)
+    monkeypatch.setattr(functions_documents, "IngestionProgressReporter", FakeProgressReporter)
+    monkeypatch.setattr(functions_documents, "process_txt", failing_handler)
+
+    upload = tmp_path / "upload.txt"
+    upload.write_text("hello")
+    return str(upload), document_updates
+
+
+def test_failed_upload_is_requeued_then_marked_failed(queue_db, failing_upload):
+    temp_file_path, document_updates = failing_upload
+    payload = {
+        "document_id": "doc-1",
+        "user_id": "user-1",
+        "temp_file_path": temp_file_path,
+        "original_filename": "notes.txt"
+    }
+    assert ingestion_queue.enqueue_ingestion_job(
+        "doc-1", ingestion_queue.INGESTION_JOB_TYPE_DOCUMENT_UPLOAD, payload, max_attempts=2
+    )
+
+    job = ingestion_queue.claim_next_ingestion_job("worker-1")
+    status = ingestion_queue.process_claimed_ingestion_job(job, "worker-1")
+
+    assert status == ingestion_queue.INGESTION_JOB_QUEUED
+    stored = ingestion_queue.get_ingestion_job("doc-1")
+    assert stored["status"] == ingestion_queue.INGESTION_JOB_QUEUED
+    assert "handler failed" in stored["last_error"]
+    assert document_updates[-1]["status"].startswith("Error:")
+    # Kept for the retry
+    assert os.path.exists(temp_file_path)
+
+    job = ingestion_queue.claim_next_ingestion_job("worker-1")
+    status = ingestion_queue.process_claimed_ingestion_job(job, "worker-1")
+
+    assert status == ingestion_queue.INGESTION_JOB_FAILED
+    stored = ingestion_queue.get_ingestion_job("doc-1")
+    assert stored["status"] == ingestion_queue.INGESTION_JOB_FAILED
+    assert stored["attempts"] == 2
+    # No checkpoint references the upload, so nothing can resume it
+    assert not os.path.exists(temp_file_path)
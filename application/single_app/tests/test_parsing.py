@@ -0,0 +1,65 @@
+# test_parsing.py
+
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("bs4")
+pytest.importorskip("langchain_text_splitters")
+openpyxl = pytest.importorskip("openpyxl")
+
+from functions_parsing import dedup_column_names, iter_tabular_chunks, parse_tabular_sheets
+
+
+def _write_workbook(path, sheets):
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        worksheet = workbook.create_sheet(title)
+        for row in rows:
+            worksheet.append(row)
+    workbook.save(path)
+
+
+def _chunks_by_file(sheets):
+    return {effective_filename: chunks for effective_filename, chunks in sheets}
+
+
+def _streamed_chunks_by_file(chunks):
+    result = {}
+    for effective_filename, chunk in chunks:
+        result.setdefault(effective_filename, []).append(chunk)
+    return result
+
+
+def test_dedup_column_names_matches_pandas():
+    assert dedup_column_names(["A", "A", "B", "A", "A.1"]) == ["A", "A.1", "B", "A.2", "A.1.1"]
+
+
+@pytest.mark.parametrize("rows_per_block", [1, 2, 5000])
+def test_streaming_xlsx_matches_pandas_on_ragged_sheet(tmp_path, rows_per_block):
+    path = tmp_path / "ragged.xlsx"
+    _write_workbook(path, {
+        "Data": [
+            ["id", "name", "name", None],
+            [1, "alpha", "a", "x", "beyond header"],
+            [2.0, "beta"],
+            [None, None, None],
+            [3.5, "gamma", None, None, None, "far"],
+            [True, "delta", "d"],
+            [None],
+            [None, None],
+        ],
+        "Empty": [],
+        "Other": [
+            [2023, "value"],
+            ["row", 1],
+        ],
+    })
+
+    expected = _chunks_by_file(parse_tabular_sheets(str(path), ".xlsx", "ragged.xlsx", target_chunk_size_chars=40))
+    streamed = _streamed_chunks_by_file(
+        iter_tabular_chunks(str(path), ".xlsx", "ragged.xlsx", target_chunk_size_chars=40, rows_per_block=rows_per_block)
+    )
+
+    assert streamed == {name: chunks for name, chunks in expected.items() if chunks}
+    assert streamed["ragged-Data.xlsx"][0].startswith("id,name,name.1,Unnamed: 3,Unnamed: 4,Unnamed: 5\n")